@@ -1,68 +1,50 @@
 import anyio
 import argparse
+import dataclasses
 import os
 import shutil
 import json
-from datetime import datetime
+import threading
+import time
+from contextlib import aclosing
+from datetime import datetime, timezone
 from pathlib import Path
-from claude_agent_sdk import query, ClaudeAgentOptions
-from claude_agent_sdk.types import McpStdioServerConfig
-import anthropic
+# claude_agent_sdk and anthropic are imported where they are used: they dominate import
+# time, and the API server and CLI tools import this module without starting a session
+from cassette import query_messages, create_message, is_replaying
+from deadlines import DeadlineBudget
+from agent_progress import AgentProgress
+from log_serializer import encode_log_entry
+from rate_limit import get_upstream, UpstreamUnavailable
+from tool_trim import wrap_command, with_stats_path, summarize_stats
+from research_memory import get_research_memory, incremental_enabled
+from run_store import prompt_hash
+from model_router import default_model, route_model, record_model_call, token_cost
 
 
 def setup_logging_directory():
-    """Create logs directory if it doesn't exist."""
-    logs_dir = Path(__file__).parent / "logs"
-    logs_dir.mkdir(exist_ok=True)
+    """Create logs directory if it doesn't exist (override with LOGS_DIR)."""
+    logs_dir = Path(os.environ.get("LOGS_DIR") or Path(__file__).parent / "logs")
+    logs_dir.mkdir(parents=True, exist_ok=True)
     return logs_dir
 
 
 def create_log_file(logs_dir, coin_name):
     """Create a timestamped log file for this session."""
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    # Microseconds keep concurrent sessions for the same coin from sharing a file
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
     log_filename = f"agent_log_{coin_name}_{timestamp}.jsonl"
     return logs_dir / log_filename
 
 
 def log_message(log_file, message_type, data):
-    """Log a message to the log file in JSONL format."""
-    log_entry = {
-        "timestamp": datetime.now().isoformat(),
-        "type": message_type,
-        "data": data
-    }
+    """Log a message to the log file in JSONL format.
+    
+    data may hold SDK messages; oversized fields are capped (see log_serializer).
+    """
+    line = encode_log_entry(datetime.now().isoformat(), message_type, data)
     with open(log_file, "a", encoding="utf-8") as f:
-        f.write(json.dumps(log_entry, ensure_ascii=False) + "\n")
-
-
-def serialize_message(message):
-    """Convert a message object to a serializable dictionary."""
-    try:
-        # Try to get all attributes of the message
-        data = {}
-        if hasattr(message, "__dict__"):
-            for key, value in message.__dict__.items():
-                try:
-                    json.dumps(value)  # Test if serializable
-                    data[key] = value
-                except (TypeError, ValueError):
-                    # If not directly serializable, convert to string
-                    data[key] = str(value)
-        else:
-            data = {"message": str(message)}
-        
-        # Add type information
-        data["_message_type"] = type(message).__name__
-        
-        # Check for specific attributes that indicate tool calls or MCP usage
-        if hasattr(message, "tool_calls") or hasattr(message, "tool_call"):
-            data["_has_tool_call"] = True
-        if hasattr(message, "mcp") or hasattr(message, "server"):
-            data["_has_mcp"] = True
-            
-        return data
-    except Exception as e:
-        return {"error": f"Failed to serialize message: {str(e)}", "raw": str(message)}
+        f.write(line + "\n")
 
 
 def load_env_file():
@@ -93,73 +75,297 @@ def get_brave_api_key():
     return brave_api_key
 
 
+def load_mcp_overrides():
+    """Load MCP server overrides from the JSON file named by MCP_SERVERS_CONFIG, if set.
+    
+    The file maps server names to {"command": ..., "args": [...]} and replaces the
+    default servers (the offline benchmarks use it to swap in stub servers).
+    """
+    config_path = os.environ.get("MCP_SERVERS_CONFIG")
+    if not config_path:
+        return None
+    with open(config_path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
 def configure_mcp_servers(brave_api_key):
-    """Configure MCP servers for Brave Search and CoinGecko."""
+    """Configure MCP servers for Brave Search and CoinGecko.
+    
+    Known servers run behind the tool_trim proxy, which cuts their results down to the
+    fields the research prompt uses (TOOL_TRIM=0 disables it).
+    """
+    from claude_agent_sdk.types import McpStdioServerConfig
+
+    overrides = load_mcp_overrides()
+    if overrides is not None:
+        mcp_servers = {}
+        for name, server in overrides.items():
+            command, args = wrap_command(name, server["command"], server.get("args", []))
+            mcp_servers[name] = McpStdioServerConfig(
+                command=command,
+                args=args,
+                env=dict(os.environ, **server.get("env", {}))
+            )
+        return mcp_servers
+    
     npx_path = shutil.which("npx") or "npx"
     
     mcp_servers = {}
+    # Neither server changes its environment, so they share one copy
+    env = os.environ.copy()
     
     # Configure Brave Search
-    brave_env = os.environ.copy()
     if brave_api_key:
-        brave_env["BRAVE_API_KEY"] = brave_api_key
-    mcp_servers["brave-search"] = McpStdioServerConfig(
-        command=npx_path,
-        args=["-y", "@modelcontextprotocol/server-brave-search"],
-        env=brave_env
-    )
+        env["BRAVE_API_KEY"] = brave_api_key
+    command, args = wrap_command("brave-search", npx_path, ["-y", "@modelcontextprotocol/server-brave-search"])
+    mcp_servers["brave-search"] = McpStdioServerConfig(command=command, args=args, env=env)
     
     # Configure CoinGecko Remote Server (no API key required)
-    mcp_servers["coingecko"] = McpStdioServerConfig(
-        command=npx_path,
-        args=["mcp-remote", "https://mcp.api.coingecko.com/sse"],
-        env=os.environ.copy()
-    )
+    command, args = wrap_command("coingecko", npx_path, ["mcp-remote", "https://mcp.api.coingecko.com/sse"])
+    mcp_servers["coingecko"] = McpStdioServerConfig(command=command, args=args, env=env)
     
     return mcp_servers
 
 
+BRAVE_TOOL_MATCHER = "mcp__brave-search__.*"
+
+# Brave calls let through by brave_rate_limit_hook whose result hook has not run yet
+_brave_pending = set()
+
+
+async def brave_rate_limit_hook(input_data, tool_use_id, context):
+    """PreToolUse hook: wait for a Brave token, or deny the call while Brave is down."""
+    try:
+        await get_upstream("brave").acquire(tool_use_id)
+    except UpstreamUnavailable as e:
+        return {
+            "hookSpecificOutput": {
+                "hookEventName": "PreToolUse",
+                "permissionDecision": "deny",
+                "permissionDecisionReason": str(e)
+            }
+        }
+    if tool_use_id:
+        _brave_pending.add(tool_use_id)
+    return {}
+
+
+def brave_call_failed(response):
+    """True if a Brave tool response is marked as an error or carries an HTTP error status."""
+    if not isinstance(response, dict):
+        return False
+    if response.get("is_error") or response.get("isError"):
+        return True
+    status = response.get("status_code", response.get("status"))
+    return isinstance(status, int) and status >= 400
+
+
+async def brave_result_hook(input_data, tool_use_id, context):
+    """PostToolUse hook: feed the Brave call's outcome to its circuit breaker."""
+    _brave_pending.discard(tool_use_id)
+    get_upstream("brave").record_result(not brave_call_failed(input_data.get("tool_response")))
+    return {}
+
+
+def failed_tool_use_ids(message):
+    """Ids of the tool calls whose results in this message came back as errors."""
+    content = getattr(message, "content", None)
+    if not isinstance(content, list):
+        return []
+    return [
+        block.tool_use_id for block in content
+        if hasattr(block, "tool_use_id") and getattr(block, "is_error", False)
+    ]
+
+
+def record_brave_failures(tool_use_ids):
+    """Count Brave calls that failed without reaching the PostToolUse hook as upstream failures."""
+    for tool_use_id in _brave_pending & set(tool_use_ids):
+        _brave_pending.discard(tool_use_id)
+        get_upstream("brave").record_result(False)
+
+
+def release_brave_calls(tool_use_ids):
+    """Give up Brave calls that ended without any result (session cut off, call denied).
+
+    Otherwise a half-open trial among them would keep the Brave circuit from closing.
+    """
+    for tool_use_id in _brave_pending & set(tool_use_ids):
+        _brave_pending.discard(tool_use_id)
+        get_upstream("brave").release(tool_use_id)
+
+
 def create_agent_options(system_prompt, mcp_servers):
     """Create ClaudeAgentOptions with the given configuration."""
+    from claude_agent_sdk import ClaudeAgentOptions, HookMatcher
+
     return ClaudeAgentOptions(
         system_prompt=system_prompt,
-        model="claude-haiku-4-5",
+        model=default_model("research"),
         mcp_servers=mcp_servers,
-        permission_mode="bypassPermissions"
+        permission_mode="bypassPermissions",
+        # Brave runs inside its MCP server, so it is rate limited at the tool-call boundary
+        hooks={
+            "PreToolUse": [HookMatcher(matcher=BRAVE_TOOL_MATCHER, hooks=[brave_rate_limit_hook])],
+            "PostToolUse": [HookMatcher(matcher=BRAVE_TOOL_MATCHER, hooks=[brave_result_hook])],
+        }
     )
 
 
-async def query_agent(prompt, options, log_file=None):
-    """Query the agent and collect messages, logging each step."""
-    messages = []
+class RuntimeContext:
+    """Configuration shared by every session in this process: .env, seed prompt, MCP servers and options.
+    
+    Built once by get_runtime(). Sessions with a different system prompt get a copy of the
+    base options with only the prompt replaced.
+    """
+    
+    def __init__(self):
+        load_env_file()
+        self.system_prompt = load_system_prompt()
+        self.brave_api_key = get_brave_api_key()
+        self.mcp_servers = configure_mcp_servers(self.brave_api_key)
+        self.options = create_agent_options(self.system_prompt, self.mcp_servers)
+        # McpStdioServerConfig is a TypedDict, so its fields are read as keys, not attributes
+        self.mcp_details = {
+            server_name: {
+                "command": server_config.get("command"),
+                "args": server_config.get("args"),
+            }
+            for server_name, server_config in self.mcp_servers.items()
+        }
+    
+    def options_for(self, system_prompt):
+        """Agent options for a session running the given system prompt."""
+        if system_prompt == self.options.system_prompt:
+            return self.options
+        return dataclasses.replace(self.options, system_prompt=system_prompt)
+
+
+_runtime = None
+_runtime_lock = threading.Lock()
+
+
+def get_runtime():
+    """Return the process-wide RuntimeContext, building it on first use."""
+    global _runtime
+    if _runtime is None:
+        with _runtime_lock:
+            if _runtime is None:
+                _runtime = RuntimeContext()
+    return _runtime
+
+
+def log_agent_message(log_file, message):
+    """Log one SDK message under a type that categorizes it."""
+    # Determine message type for better categorization
+    message_type = "agent_message"
+    if hasattr(message, "tool_calls") or hasattr(message, "tool_call"):
+        message_type = "tool_call"
+    elif hasattr(message, "subtype"):
+        if message.subtype == "success":
+            message_type = "result_success"
+        elif message.subtype == "error":
+            message_type = "result_error"
+    
+    # log_message walks the message itself, so it is converted only once
+    log_message(log_file, message_type, message)
+
+
+class MessageTally:
+    """Running counters for an agent session plus its final ResultMessage.
+    
+    Holding this instead of the message list keeps memory per session bounded no
+    matter how long the conversation or its tool outputs get.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.by_type = {}
+        self.tool_calls = 0
+        self.tool_use_ids = set()
+        self.result = None
+        self.timed_out = False
+
+    async def observe(self, message):
+        self.count += 1
+        message_type = type(message).__name__
+        self.by_type[message_type] = self.by_type.get(message_type, 0) + 1
+        content = getattr(message, "content", None)
+        if isinstance(content, list):
+            tool_uses = [block for block in content if hasattr(block, "name") and hasattr(block, "input")]
+            self.tool_calls += len(tool_uses)
+            self.tool_use_ids.update(getattr(block, "id", None) for block in tool_uses)
+        if hasattr(message, "subtype") and hasattr(message, "total_cost_usd"):
+            self.result = message
+
+    @property
+    def messages(self):
+        """The retained messages: only the final result, in the shape extract_* expects."""
+        return [self.result] if self.result is not None else []
+
+
+class MessageCollector:
+    """Subscriber that keeps every message (the original query_agent behaviour)."""
+
+    def __init__(self):
+        self.messages = []
+
+    async def observe(self, message):
+        self.messages.append(message)
+
+
+async def stream_agent(prompt, options, log_file=None, deadline=None, subscribers=()):
+    """Run the agent, passing each message to the log and subscribers as it arrives.
+    
+    Subscribers have an async observe(message) and optionally an async close(timed_out).
+    Nothing is retained here; the returned MessageTally holds counters and the final
+    result. With a deadline (seconds), the query is cancelled when it runs out; closing
+    the stream stops the agent process, so pending tool calls are cut off.
+    """
+    from claude_agent_sdk import query
+
+    tally = MessageTally()
+    subscribers = [tally, *subscribers]
     
     # Log the initial prompt
     if log_file:
         log_message(log_file, "user_prompt", {"prompt": prompt})
     
-    async for message in query(prompt=prompt, options=options):
-        messages.append(message)
-        
-        # Log each message
-        if log_file:
-            message_data = serialize_message(message)
-            
-            # Determine message type for better categorization
-            message_type = "agent_message"
-            if hasattr(message, "tool_calls") or hasattr(message, "tool_call"):
-                message_type = "tool_call"
-            elif hasattr(message, "subtype"):
-                if message.subtype == "success":
-                    message_type = "result_success"
-                elif message.subtype == "error":
-                    message_type = "result_error"
-            
-            log_message(log_file, message_type, message_data)
-            
-            # Also log to console for visibility
-            # print(f"[LOG] {message_type}: {type(message).__name__}")
-    
-    return messages
+    try:
+        with anyio.move_on_after(deadline) as scope:
+            async with aclosing(query_messages(query, prompt, options)) as stream:
+                async for message in stream:
+                    record_brave_failures(failed_tool_use_ids(message))
+                    if log_file:
+                        log_agent_message(log_file, message)
+                    for subscriber in subscribers:
+                        await subscriber.observe(message)
+    finally:
+        # The session is over: tool calls still waiting for a result hook never get one
+        release_brave_calls(tally.tool_use_ids)
+    
+    tally.timed_out = scope.cancelled_caught
+    for subscriber in subscribers:
+        if hasattr(subscriber, "close"):
+            await subscriber.close(timed_out=tally.timed_out)
+    if tally.timed_out and log_file:
+        log_message(log_file, "research_deadline_exceeded", {
+            "deadline_seconds": deadline,
+            "messages_received": tally.count
+        })
+    
+    return tally
+
+
+async def query_agent(prompt, options, log_file=None, deadline=None, progress=None):
+    """Query the agent and collect every message, logging each step.
+    
+    Retains the whole conversation; main() uses stream_agent instead.
+    """
+    collector = MessageCollector()
+    subscribers = [collector] + ([progress] if progress else [])
+    await stream_agent(prompt, options, log_file, deadline, subscribers)
+    return collector.messages
 
 
 def extract_response(messages):
@@ -170,22 +376,48 @@ def extract_response(messages):
     return None
 
 
-def extract_structured_decision(response_text, log_file=None):
+def extract_usage(messages):
+    """Collect token usage, cost and turn count from the final ResultMessage."""
+    for message in reversed(messages):
+        if hasattr(message, "subtype") and hasattr(message, "total_cost_usd"):
+            usage = getattr(message, "usage", None) or {}
+            return {
+                "input_tokens": usage.get("input_tokens", 0),
+                "output_tokens": usage.get("output_tokens", 0),
+                "cache_read_input_tokens": usage.get("cache_read_input_tokens", 0),
+                "cache_creation_input_tokens": usage.get("cache_creation_input_tokens", 0),
+                "cost_usd": message.total_cost_usd or 0.0,
+                "num_turns": getattr(message, "num_turns", 0),
+            }
+    return {}
+
+
+def extract_structured_decision(response_text, log_file=None, metrics=None, timeout=None, model=None):
     """Extract structured decision (BUY/SELL) and reason from response using Claude structured outputs."""
     if not response_text:
         return None
+    model = model or default_model("extraction")
     
     # Get Anthropic API key from environment
     api_key = os.environ.get("ANTHROPIC_API_KEY")
-    if not api_key:
+    if not api_key and not is_replaying():
         print("Warning: ANTHROPIC_API_KEY not found in environment")
         return None
     
-    client = anthropic.Anthropic(api_key=api_key)
+    if is_replaying():
+        client = None
+    else:
+        import anthropic
+        client = anthropic.Anthropic(api_key=api_key)
+    
+    # A request timeout bounds the blocking call even though the thread cannot be cancelled
+    request_options = {"timeout": timeout} if timeout is not None else {}
     
     try:
-        response = client.beta.messages.create(
-            model="claude-sonnet-4-5",
+        response = create_message(
+            client,
+            **request_options,
+            model=model,
             max_tokens=1024,
             betas=["structured-outputs-2025-11-13"],
             messages=[
@@ -215,6 +447,10 @@ def extract_structured_decision(response_text, log_file=None):
         
         structured_output = json.loads(response.content[0].text)
         
+        if metrics is not None and getattr(response, "usage", None):
+            metrics["extraction_input_tokens"] = response.usage.input_tokens
+            metrics["extraction_output_tokens"] = response.usage.output_tokens
+        
         # Log the structured extraction
         if log_file:
             log_message(log_file, "structured_extraction", {
@@ -235,68 +471,191 @@ def extract_structured_decision(response_text, log_file=None):
         return None
 
 
-async def main(coin_name):
-    load_env_file()
+PREVIOUS_RESEARCH_TEMPLATE = """
+
+Previous research for {coin_name} (started {researched_at} UTC, {age_minutes:.0f} minutes ago):
+
+{report}
+
+This is an incremental update. Only search for news, company statements and Reddit posts published after {researched_at} UTC, and fetch current market data once. Treat the findings above as still valid for anything older and do not search for them again. Base the decision report on both."""
+
+
+def build_research_prompt(coin_name, previous=None):
+    """The user prompt for a session, with the previous report for an incremental one."""
+    prompt = f"\n\nCoin name: {coin_name}"
+    if previous is None:
+        return prompt
+    return prompt + PREVIOUS_RESEARCH_TEMPLATE.format(
+        coin_name=coin_name,
+        researched_at=datetime.fromtimestamp(previous["researched_at"], tz=timezone.utc).strftime("%Y-%m-%d %H:%M"),
+        age_minutes=(time.time() - previous["researched_at"]) / 60,
+        report=previous["report"],
+    )
+
+
+def load_previous_research(coin_name, system_prompt):
+    return get_research_memory().latest(coin_name, prompt_hash(system_prompt))
+
+
+def save_research(coin_name, system_prompt, report, researched_at, tool_calls, research_ms, previous, log_file):
+    """Remember this session's report; an incremental one keeps the last full session's start and cost."""
+    get_research_memory().save(
+        coin_name, prompt_hash(system_prompt), report, researched_at,
+        full_researched_at=previous["full_researched_at"] if previous else researched_at,
+        tool_calls=tool_calls,
+        research_ms=research_ms,
+        full_tool_calls=previous["full_tool_calls"] if previous else tool_calls,
+        full_research_ms=previous["full_research_ms"] if previous else research_ms,
+        log_file=log_file,
+    )
+
+
+async def main(coin_name, system_prompt=None, budget=None, callback=None, progress_context=None,
+               incremental=None):
+    """Research a coin and extract a BUY/SELL decision.
+    
+    With incremental (default: INCREMENTAL_RESEARCH, on unless replaying a cassette), a
+    recent report for the coin from the same system prompt is passed to the agent, which then only looks for newer
+    information. Callers comparing sessions against each other pass incremental=False.
+    """
+    started = time.perf_counter()
+    runtime = get_runtime()
+    if budget is None:
+        budget = DeadlineBudget()
     
     # Set up logging
     logs_dir = setup_logging_directory()
     log_file = create_log_file(logs_dir, coin_name)
     print(f"Logging to: {log_file}")
-    
-    system_prompt = load_system_prompt()
-    brave_api_key = get_brave_api_key()
-    mcp_servers = configure_mcp_servers(brave_api_key)
-    options = create_agent_options(system_prompt, mcp_servers)
+    if callback:
+        # Lets the UI page through this session's log via /api/runs/{id}/log
+        await callback.send_update("session_log", {"log_file": log_file.name, **(progress_context or {})})
+
+    if system_prompt is None:
+        system_prompt = runtime.system_prompt
+    options = runtime.options_for(system_prompt)
+    mcp_servers = runtime.mcp_servers
+    # Each session's trimming proxies report to their own file, summarized at session end
+    trim_stats_path = log_file.with_name(f"{log_file.stem}.trim-stats")
+    research_route = await anyio.to_thread.run_sync(route_model, "research", budget.timeout_for("research"))
+    options = dataclasses.replace(
+        options, mcp_servers=with_stats_path(mcp_servers, trim_stats_path), model=research_route["model"]
+    )
 
     # Log initial configuration
     log_message(log_file, "session_start", {
         "coin_name": coin_name,
         "mcp_servers": list(mcp_servers.keys()),
-        "brave_api_key_set": bool(brave_api_key),
+        "brave_api_key_set": bool(runtime.brave_api_key),
         "model": options.model if hasattr(options, "model") else "unknown",
         "system_prompt_length": len(system_prompt)
     })
     
     # Log MCP server details
-    mcp_details = {}
-    for server_name, server_config in mcp_servers.items():
-        mcp_details[server_name] = {
-            "command": server_config.command if hasattr(server_config, "command") else None,
-            "args": server_config.args if hasattr(server_config, "args") else None,
-        }
-    log_message(log_file, "mcp_configuration", mcp_details)
+    log_message(log_file, "mcp_configuration", runtime.mcp_details)
+    log_message(log_file, "model_route", research_route)
 
     print(f"MCP servers configured: {list(mcp_servers.keys())}")
-    print(f"BRAVE_API_KEY set: {bool(brave_api_key)}")
+    print(f"BRAVE_API_KEY set: {bool(runtime.brave_api_key)}")
     print(f"CoinGecko using remote server (no API key required)")
     print(f"Researching coin: {coin_name}")
 
-    prompt = f"\n\nCoin name: {coin_name}"
+    if incremental is None:
+        incremental = incremental_enabled() and not is_replaying()
+    previous = (
+        await anyio.to_thread.run_sync(load_previous_research, coin_name, system_prompt) if incremental else None
+    )
+    if previous is not None:
+        log_message(log_file, "incremental_research", {
+            "previous_researched_at": previous["researched_at"],
+            "previous_age_seconds": time.time() - previous["researched_at"],
+            "previous_log_file": previous["log_file"],
+            "previous_report_chars": len(previous["report"]),
+            "baseline_tool_calls": previous["full_tool_calls"],
+            "baseline_research_ms": previous["full_research_ms"],
+        })
+        print(f"Incremental research from the report started {time.time() - previous['researched_at']:.0f}s ago")
+    prompt = build_research_prompt(coin_name, previous)
     
-    messages = await query_agent(
+    researched_at = time.time()
+    research_started = time.perf_counter()
+    tally = await stream_agent(
         prompt=prompt,
         options=options,
-        log_file=log_file
+        log_file=log_file,
+        deadline=budget.timeout_for("research"),
+        subscribers=[AgentProgress(callback, **(progress_context or {}))] if callback else ()
     )
+    messages = tally.messages
+    metrics = {"research_ms": (time.perf_counter() - research_started) * 1000}
+    metrics.update(extract_usage(messages))
+    metrics["tool_trim"] = summarize_stats(trim_stats_path)
+    trim_stats_path.unlink(missing_ok=True)
+    metrics["tool_calls"] = tally.tool_calls
+    metrics["models"] = {"research": research_route["model"]}
+    # Trade outcomes are attached to these calls once the attempt is evaluated
+    metrics["model_calls"] = []
+    research_call = await anyio.to_thread.run_sync(
+        record_model_call, research_route, metrics["research_ms"], metrics.get("cost_usd")
+    )
+    if research_call is not None:
+        metrics["model_calls"].append(research_call)
     
     # Extract raw response
     raw_response = extract_response(messages)
+    if previous is not None:
+        # Work skipped relative to the last from-scratch session for this coin
+        metrics["incremental"] = {
+            "previous_researched_at": previous["researched_at"],
+            "tool_calls_skipped": (previous["full_tool_calls"] or 0) - tally.tool_calls,
+            "research_ms_saved": (previous["full_research_ms"] or 0.0) - metrics["research_ms"],
+        }
+    if raw_response and incremental and not tally.timed_out:
+        await anyio.to_thread.run_sync(
+            save_research, coin_name, system_prompt, raw_response, researched_at, tally.tool_calls,
+            metrics["research_ms"], previous, log_file
+        )
     
     # Extract structured decision
     structured_decision = None
-    if raw_response:
-        structured_decision = extract_structured_decision(raw_response, log_file)
+    if raw_response and budget.expired():
+        log_message(log_file, "extraction_skipped", {"reason": "run deadline exceeded"})
+    elif raw_response:
+        extraction_route = await anyio.to_thread.run_sync(route_model, "extraction", budget.timeout_for("extraction"))
+        log_message(log_file, "model_route", extraction_route)
+        extraction_started = time.perf_counter()
+        # The Anthropic client is blocking; keep it off the event loop for concurrent sessions
+        structured_decision = await anyio.to_thread.run_sync(
+            extract_structured_decision, raw_response, log_file, metrics, budget.timeout_for("extraction"),
+            extraction_route["model"]
+        )
+        metrics["extraction_ms"] = (time.perf_counter() - extraction_started) * 1000
+        metrics["models"]["extraction"] = extraction_route["model"]
+        extraction_call = await anyio.to_thread.run_sync(
+            record_model_call, extraction_route, metrics["extraction_ms"], token_cost(
+                extraction_route["model"], metrics.get("extraction_input_tokens"), metrics.get("extraction_output_tokens")
+            ),
+            # An extraction that produced no decision failed whatever the market did
+            False if structured_decision is None else None
+        )
+        if extraction_call is not None:
+            metrics["model_calls"].append(extraction_call)
+    metrics["total_ms"] = (time.perf_counter() - started) * 1000
     
     # Log session end
     log_message(log_file, "session_end", {
-        "total_messages": len(messages),
+        "total_messages": tally.count,
+        "messages_by_type": tally.by_type,
         "response_extracted": raw_response is not None,
-        "structured_decision_extracted": structured_decision is not None
+        "structured_decision_extracted": structured_decision is not None,
+        "metrics": metrics
     })
 
     return {
         "raw_response": raw_response,
-        "structured_decision": structured_decision
+        "structured_decision": structured_decision,
+        "log_file": log_file,
+        "metrics": metrics
     }
 
 
@@ -0,0 +1,115 @@
+"""
+Live progress from query_agent for the SSE feed.
+
+AgentProgress watches SDK messages as they arrive and forwards tool call starts and
+ends (with durations), assistant text and elapsed time to a ProgressCallback. Tool
+events are sent as they happen; assistant text is coalesced and sent at most once per
+AGENT_PROGRESS_INTERVAL seconds (default 1.0) so long sessions do not flood the stream.
+"""
+import os
+import time
+
+
+TEXT_PREVIEW_CHARS = 400
+
+
+def split_tool_name(name):
+    """Split 'mcp__server__tool' into (server, tool); other tools have no server."""
+    parts = (name or "").split("__")
+    if len(parts) >= 3 and parts[0] == "mcp":
+        return parts[1], "__".join(parts[2:])
+    return None, name
+
+
+def summarize_input(tool_input, limit=200):
+    """Short one-line view of a tool call's arguments."""
+    if not isinstance(tool_input, dict):
+        return str(tool_input)[:limit]
+    summary = ", ".join(f"{key}={value}" for key, value in tool_input.items())
+    return summary if len(summary) <= limit else summary[:limit - 3] + "..."
+
+
+class AgentProgress:
+    """Forward agent activity to a callback with throttled text updates."""
+
+    def __init__(self, callback, min_interval=None, **context):
+        self.callback = callback
+        self.min_interval = (
+            min_interval if min_interval is not None
+            else float(os.environ.get("AGENT_PROGRESS_INTERVAL", 1.0))
+        )
+        # Extra fields sent with every event (e.g. the prompt hash of a population variant)
+        self.context = context
+        self.started = time.perf_counter()
+        self.open_tools = {}
+        self.pending_text = None
+        self.last_text_sent = 0.0
+        self.tool_calls = 0
+
+    def elapsed_ms(self):
+        return (time.perf_counter() - self.started) * 1000
+
+    async def send(self, event_type, data):
+        try:
+            await self.callback.send_update(event_type, {**data, **self.context, "elapsed_ms": self.elapsed_ms()})
+        except Exception as e:
+            # Progress is best effort; it must never break the research itself
+            print(f"Error sending agent progress: {e}")
+
+    async def observe(self, message):
+        """Inspect one SDK message and send whatever progress it carries."""
+        for block in getattr(message, "content", None) or []:
+            if isinstance(block, str):
+                continue
+            if hasattr(block, "tool_use_id"):
+                await self.tool_finished(block)
+            elif hasattr(block, "name") and hasattr(block, "input"):
+                await self.tool_started(block)
+            elif getattr(block, "text", None):
+                self.pending_text = block.text
+        await self.flush_text()
+
+    async def tool_started(self, block):
+        self.tool_calls += 1
+        server, tool = split_tool_name(block.name)
+        self.open_tools[block.id] = (block.name, time.perf_counter())
+        await self.send("agent_tool_start", {
+            "tool": tool,
+            "server": server,
+            "input": summarize_input(block.input),
+            "call": self.tool_calls
+        })
+
+    async def tool_finished(self, block):
+        name, started = self.open_tools.pop(block.tool_use_id, (None, None))
+        server, tool = split_tool_name(name)
+        await self.send("agent_tool_end", {
+            "tool": tool,
+            "server": server,
+            "duration_ms": (time.perf_counter() - started) * 1000 if started else None,
+            "is_error": bool(getattr(block, "is_error", False))
+        })
+
+    async def flush_text(self, force=False):
+        """Send the latest assistant text if the throttle interval has passed."""
+        if self.pending_text is None:
+            return
+        now = time.perf_counter()
+        if not force and now - self.last_text_sent < self.min_interval:
+            return
+        text = self.pending_text
+        self.pending_text = None
+        self.last_text_sent = now
+        await self.send("agent_text", {
+            "text": text if len(text) <= TEXT_PREVIEW_CHARS else text[:TEXT_PREVIEW_CHARS] + "...",
+            "length": len(text)
+        })
+
+    async def close(self, timed_out=False):
+        """Flush pending text and report the research summary."""
+        await self.flush_text(force=True)
+        await self.send("agent_research_done", {
+            "tool_calls": self.tool_calls,
+            "unfinished_tools": [split_tool_name(name)[1] for name, _ in self.open_tools.values()],
+            "timed_out": timed_out
+        })
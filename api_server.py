@@ -2,14 +2,23 @@
 FastAPI server for running the crypto agent with real-time updates via SSE.
 """
 import asyncio
+import hmac
 import json
+import time
+from datetime import datetime
 from typing import Optional
-from fastapi import FastAPI, HTTPException
+from fastapi import Depends, FastAPI, HTTPException, Header, Query, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import StreamingResponse
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
-import uvicorn
-from runner import run_with_feedback_loop
+from run_store import get_run_store, to_day, STATS_GROUPS
+from job_queue import JobBroker, SQLiteJobBroker, TERMINAL_EVENT_TYPES
+from log_archive import run_compactor
+from log_pages import read_log_page
+from rate_limit import upstream_metrics
+from coin_index import get_coin_index
+from model_router import get_model_router, routing_mode, stage_candidates, STAGES
+from diagnostics import MemoryTracer, collapsed, get_loop_lag_monitor, get_memory_tracer, profile_stacks
 import os
 
 
@@ -19,49 +28,93 @@ class RunRequest(BaseModel):
 
 
 class ProgressCallback:
-    """Callback class to capture progress updates from runner."""
+    """Publishes and tails the progress events of one queued run."""
     
-    def __init__(self, session_id: str):
+    def __init__(self, session_id: str, broker: JobBroker, poll_interval: float = 0.25):
         self.session_id = session_id
-        self.queue = asyncio.Queue()
+        self.broker = broker
+        self.poll_interval = poll_interval
     
     async def send_update(self, update_type: str, data: dict):
-        """Send an update to the frontend."""
-        update = {
-            "type": update_type,
-            "data": data,
-            "timestamp": asyncio.get_event_loop().time()
-        }
-        await self.queue.put(update)
+        """Publish an update to the shared event store."""
+        await asyncio.to_thread(self.broker.publish, self.session_id, update_type, data)
     
-    async def get_updates(self):
-        """Generator that yields updates."""
+    async def get_updates(self, after_id: int = 0):
+        """Generator that tails the event store and yields SSE frames."""
+        last_id = after_id
+        last_sent = asyncio.get_event_loop().time()
         while True:
             try:
-                update = await asyncio.wait_for(self.queue.get(), timeout=1.0)
-                yield f"data: {json.dumps(update)}\n\n"
-                # If we get a complete or error, break the loop
-                if update.get("type") in ["complete", "error"]:
-                    break
-            except asyncio.TimeoutError:
-                # Send heartbeat to keep connection alive
-                yield f": heartbeat\n\n"
+                events = await asyncio.to_thread(self.broker.read_events, self.session_id, last_id)
+                for event in events:
+                    last_id = event["id"]
+                    update = {
+                        "type": event["type"],
+                        "data": event["data"],
+                        "timestamp": event["timestamp"]
+                    }
+                    yield f"id: {last_id}\ndata: {json.dumps(update)}\n\n"
+                    # If we get a complete or error, break the loop
+                    if event["type"] in TERMINAL_EVENT_TYPES:
+                        return
+                
+                now = asyncio.get_event_loop().time()
+                if events:
+                    last_sent = now
+                elif now - last_sent >= 1.0:
+                    # Send heartbeat to keep connection alive
+                    last_sent = now
+                    yield f": heartbeat\n\n"
+                await asyncio.sleep(self.poll_interval)
             except Exception as e:
                 yield f"data: {json.dumps({'type': 'error', 'data': {'message': str(e)}})}\n\n"
                 break
 
 
-async def run_agent_with_updates(coin_name: str, max_retries: int, callback: ProgressCallback):
-    """Run the agent with progress callbacks."""
-    try:
-        await run_with_feedback_loop(coin_name, max_retries, callback)
-    except Exception as e:
-        await callback.send_update("error", {
-            "message": f"Error during execution: {str(e)}"
-        })
+def sse_response(callback: ProgressCallback, after_id: int = 0):
+    """Wrap a callback's event tail in an SSE StreamingResponse."""
+    return StreamingResponse(
+        callback.get_updates(after_id),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "Connection": "keep-alive",
+            "X-Accel-Buffering": "no",
+            "X-Session-Id": callback.session_id,
+        }
+    )
 
 
 app = FastAPI(title="Crypto Agent Runner API")
+broker = SQLiteJobBroker()
+
+
+@app.on_event("startup")
+async def start_embedded_workers():
+    """Optionally run queue workers inside the API process (EMBEDDED_WORKERS=N)."""
+    workers = int(os.environ.get("EMBEDDED_WORKERS", 0))
+    if workers:
+        # The agent stack is only loaded by processes that run sessions
+        from runner import run_worker
+
+        for _ in range(workers):
+            asyncio.create_task(run_worker())
+
+
+@app.on_event("startup")
+async def start_log_compactor():
+    """Move finished session logs into the compressed archive (LOG_ARCHIVE_INTERVAL=0 disables)."""
+    if float(os.environ.get("LOG_ARCHIVE_INTERVAL", 300)) > 0:
+        asyncio.create_task(run_compactor())
+
+
+@app.on_event("startup")
+async def start_loop_lag_monitor():
+    """Measure event-loop lag for /api/loop-lag (LOOP_LAG_INTERVAL=0 disables)."""
+    monitor = get_loop_lag_monitor()
+    if monitor.interval > 0:
+        asyncio.create_task(monitor.run())
+
 
 # CORS middleware
 app.add_middleware(
@@ -79,45 +132,317 @@ async def root():
 
 
 @app.get("/api/coins")
-async def get_coins():
-    """Get list of top 10 cryptocurrencies."""
-    coins = [
-        {"symbol": "BTC", "name": "Bitcoin"},
-        {"symbol": "ETH", "name": "Ethereum"},
-        {"symbol": "USDT", "name": "Tether"},
-        {"symbol": "BNB", "name": "BNB"},
-        {"symbol": "SOL", "name": "Solana"},
-        {"symbol": "USDC", "name": "USD Coin"},
-        {"symbol": "XRP", "name": "Ripple"},
-        {"symbol": "DOGE", "name": "Dogecoin"},
-        {"symbol": "ADA", "name": "Cardano"},
-        {"symbol": "TRX", "name": "TRON"},
-    ]
-    return {"coins": coins}
+async def get_coins(
+    query: Optional[str] = None,
+    limit: int = Query(10, ge=1, le=250),
+):
+    """Top coins by market cap, or the best matches for a symbol/name/id prefix."""
+    index = get_coin_index()
+    if not index.fresh():
+        await asyncio.to_thread(index.load)
+    coins = index.search(query, limit) if query else index.top(limit)
+    return {"coins": [
+        {"symbol": coin["symbol"].upper(), "name": coin["name"], "id": coin["id"], "rank": coin["rank"]}
+        for coin in coins
+    ]}
 
 
 @app.post("/api/run")
 async def run_agent(request: RunRequest):
-    """Start running the agent and return SSE stream."""
-    import uuid
-    session_id = str(uuid.uuid4())
+    """Enqueue an agent run and return an SSE stream of its progress."""
+    session_id = await asyncio.to_thread(broker.enqueue, request.coin_name, request.max_retries)
     
-    callback = ProgressCallback(session_id)
+    callback = ProgressCallback(session_id, broker)
+    await callback.send_update("queued", {
+        "session_id": session_id,
+        "coin_name": request.coin_name,
+        "max_retries": request.max_retries
+    })
     
-    # Start the agent run in background
-    asyncio.create_task(
-        run_agent_with_updates(request.coin_name, request.max_retries, callback)
+    return sse_response(callback)
+
+
+@app.get("/api/runs")
+async def list_runs(
+    coin: Optional[str] = None,
+    prompt: Optional[str] = None,
+    session_id: Optional[str] = None,
+    before_id: Optional[int] = None,
+    limit: int = Query(50, ge=1, le=500),
+):
+    """Page through recorded attempts, newest first (pass next_before_id to continue)."""
+    items, next_before_id = await asyncio.to_thread(
+        get_run_store().list_attempts, coin, prompt, session_id, before_id, limit
     )
-    
-    return StreamingResponse(
-        callback.get_updates(),
-        media_type="text/event-stream",
-        headers={
-            "Cache-Control": "no-cache",
-            "Connection": "keep-alive",
-            "X-Accel-Buffering": "no",
-        }
+    return {"runs": items, "next_before_id": next_before_id}
+
+
+@app.get("/api/stats")
+async def run_stats(
+    coin: Optional[str] = None,
+    prompt: Optional[str] = None,
+    days: int = Query(7, ge=1),
+    group_by: str = "coin_prompt",
+):
+    """Aggregate win rate, PnL, latency and cost over the last N days."""
+    if group_by not in STATS_GROUPS:
+        raise HTTPException(status_code=400, detail=f"group_by must be one of {sorted(STATS_GROUPS)}")
+    since_day = to_day(time.time() - (days - 1) * 86400)
+    stats = await asyncio.to_thread(
+        get_run_store().stats, coin, prompt, since_day, None, group_by
     )
+    return {"since_day": since_day, "group_by": group_by, "stats": stats}
+
+
+@app.get("/api/runs/{session_id}/events")
+async def run_events(session_id: str, after: int = 0, last_event_id: Optional[str] = Header(None)):
+    """Re-attach to a run's SSE stream, resuming after the last seen event id."""
+    job = await asyncio.to_thread(broker.get_job, session_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown session")
+    if last_event_id and last_event_id.isdigit():
+        after = max(after, int(last_event_id))
+    return sse_response(ProgressCallback(session_id, broker), after)
+
+
+def session_log_names(session_id):
+    """Names of the agent logs a run has written, oldest first."""
+    names = [event["data"]["log_file"] for event in broker.read_events(session_id, 0, 1000, "session_log")]
+    attempts, _ = get_run_store().list_attempts(session_id=session_id, limit=500)
+    for attempt in reversed(attempts):
+        name = os.path.basename(attempt["log_file"] or "")
+        if name and name not in names:
+            names.append(name)
+    return names
+
+
+@app.get("/api/runs/{session_id}/log")
+async def run_log(
+    session_id: str,
+    log: Optional[str] = None,
+    offset: int = Query(0, ge=0),
+    limit: int = Query(200, ge=1, le=2000),
+    types: Optional[str] = None,
+):
+    """Page through one of a run's agent logs by byte offset (pass next_offset to continue).
+
+    log defaults to the run's latest log; types is a comma separated list of entry types.
+    """
+    names = await asyncio.to_thread(session_log_names, session_id)
+    if not names:
+        raise HTTPException(status_code=404, detail="No logs for this session")
+    if log is None:
+        log = names[-1]
+    elif log not in names:
+        raise HTTPException(status_code=404, detail="Unknown log for this session")
+    type_list = [name.strip() for name in types.split(",") if name.strip()] if types else None
+    try:
+        page = await asyncio.to_thread(read_log_page, log, offset, limit, type_list)
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Log file not found")
+    return {"logs": names, "log": log, **page}
+
+
+def ws_frame(message):
+    """Encode a WebSocket frame as compact JSON."""
+    return json.dumps(message, separators=(",", ":"))
+
+
+@app.websocket("/api/ws")
+async def run_socket(websocket: WebSocket):
+    """Follow the progress of many runs over one WebSocket.
+    
+    Client frames: {"op": "sub", "sid": ..., "after": <event id>}, {"op": "unsub", "sid": ...}
+    and {"op": "run", "coin": ..., "max_retries": ..., "ref": ...}, which enqueues a run and
+    subscribes to it. Each tick (WS_TICK_SECONDS) all subscriptions are read in one query
+    and new events go out in one frame: {"t": "ev", "b": [[sid, id, type, data, timestamp], ...]}.
+    A session is unsubscribed after its terminal event. Other server frames are
+    {"t": "queued", "ref": ..., "sid": ...} and {"t": "err", "msg": ...}.
+    """
+    tick = float(os.environ.get("WS_TICK_SECONDS", 0.25))
+    max_subscriptions = int(os.environ.get("WS_MAX_SUBSCRIPTIONS", 100))
+    cursors = {}
+    send_lock = asyncio.Lock()
+    await websocket.accept()
+    
+    async def send(message):
+        async with send_lock:
+            await websocket.send_text(ws_frame(message))
+    
+    async def subscribe(session_id, after_id, ref=None):
+        if session_id not in cursors and len(cursors) >= max_subscriptions:
+            await send({"t": "err", "sid": session_id, "ref": ref, "msg": "Too many subscriptions"})
+            return False
+        cursors[session_id] = after_id
+        return True
+    
+    async def send_batches():
+        while True:
+            if cursors:
+                try:
+                    events = await asyncio.to_thread(broker.read_events_many, dict(cursors))
+                except Exception as e:
+                    # Keep the cursors and try again next tick, e.g. after a locked database
+                    print(f"Error reading run events for WebSocket: {e}")
+                    await send({"t": "err", "msg": "Could not read run events; retrying"})
+                    events = {}
+                batch = []
+                for session_id, items in events.items():
+                    if not items or session_id not in cursors:
+                        continue
+                    batch += [[session_id, event["id"], event["type"], event["data"], event["timestamp"]]
+                              for event in items]
+                    cursors[session_id] = items[-1]["id"]
+                    if any(event["type"] in TERMINAL_EVENT_TYPES for event in items):
+                        del cursors[session_id]
+                if batch:
+                    await send({"t": "ev", "b": batch})
+            await asyncio.sleep(tick)
+    
+    sender = asyncio.create_task(send_batches())
+    try:
+        while True:
+            try:
+                message = json.loads(await websocket.receive_text())
+                op = message["op"]
+            except (ValueError, TypeError, KeyError):
+                await send({"t": "err", "msg": "Frames must be JSON objects with an op"})
+                continue
+            ref = message.get("ref")
+            if op in ("sub", "unsub") and not isinstance(message.get("sid"), str):
+                await send({"t": "err", "ref": ref, "msg": "sid must be a session id string"})
+                continue
+            if op == "sub":
+                session_id = message["sid"]
+                try:
+                    after_id = int(message.get("after") or 0)
+                except (ValueError, TypeError):
+                    await send({"t": "err", "sid": session_id, "ref": ref, "msg": "after must be an event id"})
+                    continue
+                job = await asyncio.to_thread(broker.get_job, session_id)
+                if job is None:
+                    await send({"t": "err", "sid": session_id, "ref": ref, "msg": "Unknown session"})
+                    continue
+                await subscribe(session_id, after_id, ref)
+            elif op == "unsub":
+                cursors.pop(message["sid"], None)
+            elif op == "run":
+                if len(cursors) >= max_subscriptions:
+                    await send({"t": "err", "ref": ref, "msg": "Too many subscriptions"})
+                    continue
+                try:
+                    request = RunRequest(coin_name=message.get("coin"), max_retries=message.get("max_retries", 3))
+                except ValueError as e:
+                    await send({"t": "err", "ref": ref, "msg": str(e)})
+                    continue
+                session_id = await asyncio.to_thread(broker.enqueue, request.coin_name, request.max_retries)
+                await ProgressCallback(session_id, broker).send_update("queued", {
+                    "session_id": session_id,
+                    "coin_name": request.coin_name,
+                    "max_retries": request.max_retries
+                })
+                # Reply first so the client knows the session id before its events arrive
+                await send({"t": "queued", "ref": ref, "sid": session_id})
+                await subscribe(session_id, 0, ref)
+            else:
+                await send({"t": "err", "ref": ref, "msg": f"Unknown op: {op}"})
+    except WebSocketDisconnect:
+        pass
+    finally:
+        sender.cancel()
+
+
+@app.get("/api/runs/{session_id}/status")
+async def run_status(session_id: str):
+    """Return the queue state of a run."""
+    job = await asyncio.to_thread(broker.get_job, session_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown session")
+    return job
+
+
+@app.get("/api/upstreams")
+async def get_upstreams():
+    """Rate limiter queue times and circuit breaker state per upstream.
+
+    upstreams covers this process, which only calls out itself with EMBEDDED_WORKERS;
+    workers holds what each worker process published in the last UPSTREAM_METRICS_MAX_AGE
+    seconds (default 60).
+    """
+    max_age = float(os.environ.get("UPSTREAM_METRICS_MAX_AGE", 60))
+    workers = await asyncio.to_thread(broker.read_upstreams, max_age)
+    return {"upstreams": upstream_metrics(), "workers": workers}
+
+
+@app.get("/api/models")
+async def model_routing(days: int = Query(7, ge=1)):
+    """Per stage and model: observed latency, cost and win rate, and shadow routing picks."""
+    summary = await asyncio.to_thread(get_model_router().summary, time.time() - days * 86400)
+    return {
+        "mode": routing_mode(),
+        "candidates": {stage: list(stage_candidates(stage)) for stage in STAGES},
+        "models": summary,
+    }
+
+
+@app.get("/api/loop-lag")
+async def loop_lag(seconds: Optional[float] = Query(None, gt=0)):
+    """How late the event loop ran callbacks over the last `seconds` (default: the whole window)."""
+    monitor = get_loop_lag_monitor()
+    if monitor.interval <= 0:
+        raise HTTPException(status_code=404, detail="Loop lag monitor is disabled")
+    return monitor.snapshot(seconds)
+
+
+def require_admin(x_admin_token: Optional[str] = Header(None)):
+    """Admin endpoints are off unless ADMIN_TOKEN is set, and then need it in X-Admin-Token."""
+    token = os.environ.get("ADMIN_TOKEN")
+    if not token:
+        raise HTTPException(status_code=404, detail="Admin endpoints are disabled (set ADMIN_TOKEN)")
+    if not x_admin_token or not hmac.compare_digest(x_admin_token, token):
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+
+
+@app.post("/api/admin/profile", dependencies=[Depends(require_admin)])
+async def profile(seconds: float = Query(10, gt=0, le=120), interval_ms: float = Query(5, ge=1, le=100)):
+    """Sample all threads for `seconds` and return collapsed stacks for a flamegraph."""
+    try:
+        counts = await asyncio.to_thread(profile_stacks, seconds, interval_ms / 1000)
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    filename = f"api_server-{datetime.now().strftime('%Y%m%d_%H%M%S')}.collapsed"
+    return PlainTextResponse(collapsed(counts), headers={"Content-Disposition": f'attachment; filename="{filename}"'})
+
+
+@app.post("/api/admin/tracemalloc/start", dependencies=[Depends(require_admin)])
+async def tracemalloc_start(frames: int = Query(25, ge=1, le=100)):
+    """Start tracing allocations and take the baseline snapshot for /diff."""
+    return await asyncio.to_thread(get_memory_tracer().start, frames)
+
+
+@app.get("/api/admin/tracemalloc/diff", dependencies=[Depends(require_admin)])
+async def tracemalloc_diff(
+    limit: int = Query(25, ge=1, le=500),
+    group_by: str = "traceback",
+    scope: str = "app",
+    reset: bool = False,
+):
+    """Allocations that grew most since the baseline (scope=app: with a frame in this repo)."""
+    if group_by not in MemoryTracer.GROUPS:
+        raise HTTPException(status_code=400, detail=f"group_by must be one of {list(MemoryTracer.GROUPS)}")
+    if scope not in ("app", "all"):
+        raise HTTPException(status_code=400, detail="scope must be app or all")
+    try:
+        return await asyncio.to_thread(get_memory_tracer().diff, limit, group_by, scope, reset)
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+
+@app.post("/api/admin/tracemalloc/stop", dependencies=[Depends(require_admin)])
+async def tracemalloc_stop():
+    """Stop tracing allocations and drop the baseline."""
+    await asyncio.to_thread(get_memory_tracer().stop)
+    return get_memory_tracer().status()
 
 
 @app.get("/api/health")
@@ -126,5 +451,7 @@ async def health():
 
 
 if __name__ == "__main__":
+    import uvicorn
+
     port = int(os.environ.get("PORT", 8000))
     uvicorn.run(app, host="0.0.0.0", port=port)
@@ -0,0 +1,213 @@
+"""
+Fake Anthropic Messages API for offline benchmarks.
+
+Serves POST /v1/messages (streaming and non-streaming) with a configurable time to
+first token and total latency. Requests that declare MCP tools get one tool_use turn
+per MCP server before the final answer, so the stub MCP servers are exercised too.
+Structured-output requests (decision extraction, prompt rewriting) get JSON that
+matches their schema. GET /stats returns request counters.
+
+Usage: python bench/fake_anthropic.py --port 8101 --ttft-ms 200 --latency-ms 800
+"""
+import argparse
+import json
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+FINAL_REPORT = (
+    "BUY\n"
+    "- Recent news mentions positive developments\n"
+    "- Reddit discussions are positive\n"
+    "- Market data shows strong performance"
+)
+
+
+class FakeAnthropicState:
+    """Configuration and counters shared by all request handlers."""
+
+    def __init__(self, ttft_ms, latency_ms, tool_calls):
+        self.ttft_ms = ttft_ms
+        self.latency_ms = latency_ms
+        self.tool_calls = tool_calls
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.streamed = 0
+        self.tool_turns = 0
+
+    def count(self, streamed, tool_turn):
+        with self.lock:
+            self.requests += 1
+            self.streamed += int(streamed)
+            self.tool_turns += int(tool_turn)
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                "requests": self.requests,
+                "streamed": self.streamed,
+                "tool_turns": self.tool_turns,
+                "ttft_ms": self.ttft_ms,
+                "latency_ms": self.latency_ms,
+            }
+
+
+def structured_answer(output_format):
+    """Return JSON text matching a structured-output schema used by this repo."""
+    properties = (output_format or {}).get("schema", {}).get("properties", {})
+    if "updated_prompt" in properties:
+        return json.dumps({
+            "updated_prompt": "You are a crypto research agent. Stub rewrite for benchmarks.",
+            "reason": "Benchmark stub rewrite"
+        })
+    return json.dumps({"decision": "BUY", "reason": "Benchmark stub decision"})
+
+
+def pick_tool_call(body, max_tool_calls):
+    """Return the next MCP tool to call, or None once every server has been called."""
+    tools = [tool["name"] for tool in body.get("tools", []) if tool.get("name", "").startswith("mcp__")]
+    if not tools or max_tool_calls <= 0:
+        return None
+
+    called = set()
+    for message in body.get("messages", []):
+        content = message.get("content")
+        if isinstance(content, list):
+            for block in content:
+                if isinstance(block, dict) and block.get("type") == "tool_use":
+                    name = block.get("name", "")
+                    if "__" in name:
+                        called.add(name.split("__")[1])
+    if len(called) >= max_tool_calls:
+        return None
+
+    for tool in tools:
+        server = tool.split("__")[1]
+        if server not in called:
+            return tool
+    return None
+
+
+def make_handler(state):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            pass
+
+        def do_GET(self):
+            if self.path.startswith("/stats"):
+                self._send_json(200, state.snapshot())
+            else:
+                self._send_json(404, {"type": "error", "error": {"type": "not_found_error", "message": self.path}})
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length", 0))
+            body = json.loads(self.rfile.read(length) or b"{}")
+            if self.path.startswith("/v1/messages/count_tokens"):
+                self._send_json(200, {"input_tokens": len(json.dumps(body)) // 4})
+                return
+            if not self.path.startswith("/v1/messages"):
+                self._send_json(404, {"type": "error", "error": {"type": "not_found_error", "message": self.path}})
+                return
+
+            tool = pick_tool_call(body, state.tool_calls)
+            if body.get("output_format"):
+                blocks = [{"type": "text", "text": structured_answer(body["output_format"])}]
+                stop_reason = "end_turn"
+            elif tool:
+                blocks = [{"type": "tool_use", "id": f"toolu_{uuid.uuid4().hex[:12]}", "name": tool,
+                           "input": {"query": "latest news"}}]
+                stop_reason = "tool_use"
+            else:
+                blocks = [{"type": "text", "text": FINAL_REPORT}]
+                stop_reason = "end_turn"
+
+            input_tokens = len(json.dumps(body)) // 4
+            output_tokens = sum(len(json.dumps(block)) // 4 for block in blocks)
+            stream = bool(body.get("stream"))
+            state.count(stream, tool is not None and not body.get("output_format"))
+            message = {
+                "id": f"msg_{uuid.uuid4().hex[:12]}",
+                "type": "message",
+                "role": "assistant",
+                "model": body.get("model", "stub"),
+                "content": blocks,
+                "stop_reason": stop_reason,
+                "stop_sequence": None,
+                "usage": {"input_tokens": input_tokens, "output_tokens": output_tokens},
+            }
+
+            if not stream:
+                time.sleep(state.latency_ms / 1000)
+                self._send_json(200, message)
+                return
+            self._stream(message)
+
+        def _stream(self, message):
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Cache-Control", "no-cache")
+            self.send_header("Connection", "close")
+            self.end_headers()
+            self.close_connection = True
+
+            time.sleep(state.ttft_ms / 1000)
+            start = dict(message, content=[], stop_reason=None,
+                         usage={"input_tokens": message["usage"]["input_tokens"], "output_tokens": 1})
+            self._event("message_start", {"type": "message_start", "message": start})
+
+            for index, block in enumerate(message["content"]):
+                if block["type"] == "text":
+                    self._event("content_block_start", {"type": "content_block_start", "index": index,
+                                                        "content_block": {"type": "text", "text": ""}})
+                    delta = {"type": "text_delta", "text": block["text"]}
+                else:
+                    self._event("content_block_start", {"type": "content_block_start", "index": index,
+                                                        "content_block": dict(block, input={})})
+                    delta = {"type": "input_json_delta", "partial_json": json.dumps(block["input"])}
+                # Spend the rest of the latency budget "generating"
+                time.sleep(max(0.0, state.latency_ms - state.ttft_ms) / 1000)
+                self._event("content_block_delta", {"type": "content_block_delta", "index": index, "delta": delta})
+                self._event("content_block_stop", {"type": "content_block_stop", "index": index})
+
+            self._event("message_delta", {
+                "type": "message_delta",
+                "delta": {"stop_reason": message["stop_reason"], "stop_sequence": None},
+                "usage": {"output_tokens": message["usage"]["output_tokens"]},
+            })
+            self._event("message_stop", {"type": "message_stop"})
+
+        def _event(self, name, data):
+            self.wfile.write(f"event: {name}\ndata: {json.dumps(data)}\n\n".encode("utf-8"))
+            self.wfile.flush()
+
+        def _send_json(self, status, payload):
+            data = json.dumps(payload).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+    return Handler
+
+
+def serve(port, ttft_ms=200, latency_ms=800, tool_calls=2):
+    """Run the fake API until interrupted."""
+    state = FakeAnthropicState(ttft_ms, latency_ms, tool_calls)
+    server = ThreadingHTTPServer(("127.0.0.1", port), make_handler(state))
+    print(f"Fake Anthropic API on http://127.0.0.1:{port} (ttft {ttft_ms}ms, latency {latency_ms}ms)", flush=True)
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fake Anthropic Messages API")
+    parser.add_argument("--port", type=int, default=8101)
+    parser.add_argument("--ttft-ms", type=float, default=200, help="Time to first streamed event")
+    parser.add_argument("--latency-ms", type=float, default=800, help="Total latency per model call")
+    parser.add_argument("--tool-calls", type=int, default=2, help="MCP tool calls per research session")
+    args = parser.parse_args()
+    serve(args.port, args.ttft_ms, args.latency_ms, args.tool_calls)
@@ -0,0 +1,380 @@
+"""
+Load generator and soak test for api_server's SSE and WebSocket transports.
+
+Starts api_server.py in a subprocess against a temporary job queue, then runs N
+concurrent sessions at each concurrency level: with --transport sse each is its own
+POST /api/run SSE stream, with ws they are started and followed over --ws-connections
+multiplexed /api/ws sockets (default 1), and both runs every level on each transport. A
+stub pipeline in this process plays the run workers: it claims the queued runs and
+publishes runner-shaped events at a fixed pace, so the only thing under load is the API
+process itself.
+
+For each level the report records event delivery latency, heartbeat jitter (SSE only),
+frames sent, open server sockets, server RSS per session, event-loop lag (latency of
+/api/health probes while the streams run, and the server's own measurement from
+/api/loop-lag) and error rates, and marks the saturation point per transport: the first
+level that breaks a threshold.
+
+Usage:
+    python bench/loadtest.py --levels 10,50,100,200 --events 20 --event-interval 1.5
+    python bench/loadtest.py --transport both --levels 10,100,400
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+
+BENCH_DIR = Path(__file__).resolve().parent
+REPO_DIR = BENCH_DIR.parent
+sys.path.insert(0, str(REPO_DIR))
+
+from bench.run_bench import free_port, wait_for_port  # noqa: E402
+from stats import percentile  # noqa: E402
+
+HEARTBEAT_SECONDS = 1.0
+
+
+def read_rss_kb(pid):
+    """Resident set size of a process in kB (Linux /proc)."""
+    try:
+        with open(f"/proc/{pid}/status", "r") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+def count_sockets(pid):
+    """Open sockets of a process (Linux /proc), i.e. client connections plus listeners."""
+    try:
+        fd_dir = f"/proc/{pid}/fd"
+        return sum(1 for fd in os.listdir(fd_dir) if os.readlink(f"{fd_dir}/{fd}").startswith("socket:"))
+    except OSError:
+        return None
+
+
+async def stub_pipeline(broker, stop, events_per_session, event_interval):
+    """Claim queued runs and publish runner-shaped events for each, like a fleet of workers."""
+    from job_queue import make_worker_id
+
+    worker_id = make_worker_id()
+    running = set()
+
+    async def play(job):
+        for index in range(events_per_session):
+            await asyncio.sleep(event_interval)
+            await asyncio.to_thread(broker.publish, job["id"], "status", {
+                "message": f"Stub event {index + 1}/{events_per_session}",
+                "sent_at": time.time(),
+            })
+        await asyncio.to_thread(broker.publish, job["id"], "complete", {
+            "success": True, "attempts": 1, "coin_name": job["coin_name"], "sent_at": time.time()
+        })
+        await asyncio.to_thread(broker.finish, job["id"], worker_id)
+
+    while not stop.is_set():
+        job = await asyncio.to_thread(broker.claim, worker_id, 600)
+        if job is None:
+            await asyncio.sleep(0.05)
+            continue
+        task = asyncio.create_task(play(job))
+        running.add(task)
+        task.add_done_callback(running.discard)
+    for task in list(running):
+        task.cancel()
+
+
+async def run_session(client, base_url, result):
+    """Open one SSE session and record delivery latency, heartbeats and errors."""
+    last_heartbeat = None
+    try:
+        async with client.stream("POST", f"{base_url}/api/run",
+                                 json={"coin_name": "BTC", "max_retries": 1}) as response:
+            if response.status_code != 200:
+                result["errors"] += 1
+                return
+            async for line in response.aiter_lines():
+                now = time.time()
+                if line.startswith(": heartbeat"):
+                    if last_heartbeat is not None:
+                        result["heartbeat_jitter_ms"].append(abs(now - last_heartbeat - HEARTBEAT_SECONDS) * 1000)
+                    last_heartbeat = now
+                    continue
+                if not line.startswith("data: "):
+                    continue
+                # Any event resets the heartbeat timer on the server
+                last_heartbeat = now
+                result["frames"] += 1
+                update = json.loads(line[6:])
+                sent_at = (update.get("data") or {}).get("sent_at")
+                if sent_at:
+                    result["delivery_ms"].append((now - sent_at) * 1000)
+                result["events"] += 1
+                if update.get("type") == "error":
+                    result["errors"] += 1
+                    return
+                if update.get("type") == "complete":
+                    result["completed"] += 1
+                    return
+        result["incomplete"] += 1
+    except Exception:
+        result["errors"] += 1
+
+
+async def run_ws_connection(ws_url, sessions, result):
+    """Start several runs over one WebSocket and follow them all until each finishes."""
+    import websockets
+
+    remaining = sessions
+    try:
+        async with websockets.connect(ws_url, max_size=None) as socket:
+            for ref in range(sessions):
+                await socket.send(json.dumps({"op": "run", "coin": "BTC", "max_retries": 1, "ref": ref}))
+            while remaining:
+                frame = json.loads(await socket.recv())
+                now = time.time()
+                if frame["t"] == "err":
+                    result["errors"] += 1
+                    remaining -= 1
+                    continue
+                if frame["t"] != "ev":
+                    continue
+                result["frames"] += 1
+                for _, _, event_type, data, _ in frame["b"]:
+                    sent_at = (data or {}).get("sent_at")
+                    if sent_at:
+                        result["delivery_ms"].append((now - sent_at) * 1000)
+                    result["events"] += 1
+                    if event_type == "error":
+                        result["errors"] += 1
+                        remaining -= 1
+                    elif event_type == "complete":
+                        result["completed"] += 1
+                        remaining -= 1
+    except Exception:
+        result["errors"] += remaining
+
+
+async def probe_server(client, base_url, pid, stop, samples):
+    """Sample /api/health latency (event-loop lag proxy) and server RSS until stopped."""
+    while not stop.is_set():
+        started = time.perf_counter()
+        try:
+            await client.get(f"{base_url}/api/health")
+            samples["loop_lag_ms"].append((time.perf_counter() - started) * 1000)
+        except Exception:
+            samples["probe_errors"] += 1
+        rss = read_rss_kb(pid)
+        if rss is not None:
+            samples["rss_kb"].append(rss)
+        sockets = count_sockets(pid)
+        if sockets is not None:
+            samples["sockets"].append(sockets)
+        await asyncio.sleep(0.5)
+
+
+async def server_loop_lag(client, base_url, seconds):
+    """The server's loop lag over the last `seconds`, or None if its monitor is off."""
+    try:
+        response = await client.get(f"{base_url}/api/loop-lag", params={"seconds": seconds})
+        if response.status_code != 200:
+            return None
+        lag = response.json()
+        return {"p50": lag["p50_ms"], "p99": lag["p99_ms"], "max": lag["max_ms"], "stalls": lag["stalled_samples"]}
+    except Exception:
+        return None
+
+
+def distribution(values):
+    values = sorted(values)
+    return {
+        "p50": percentile(values, 0.50),
+        "p95": percentile(values, 0.95),
+        "p99": percentile(values, 0.99),
+        "max": values[-1] if values else None,
+    }
+
+
+async def run_level(base_url, pid, concurrency, baseline_rss_kb, transport="sse", ws_connections=1):
+    """Run one concurrency level on one transport and summarise it."""
+    import httpx
+
+    result = {"events": 0, "frames": 0, "completed": 0, "incomplete": 0, "errors": 0,
+              "delivery_ms": [], "heartbeat_jitter_ms": []}
+    samples = {"loop_lag_ms": [], "rss_kb": [], "sockets": [], "probe_errors": 0}
+    limits = httpx.Limits(max_connections=concurrency + 10, max_keepalive_connections=concurrency + 10)
+    stop = asyncio.Event()
+
+    async with httpx.AsyncClient(timeout=httpx.Timeout(60.0, connect=10.0), limits=limits) as client:
+        probe = asyncio.create_task(probe_server(client, base_url, pid, stop, samples))
+        started = time.perf_counter()
+        if transport == "ws":
+            connections = min(ws_connections, concurrency)
+            ws_url = base_url.replace("http://", "ws://") + "/api/ws"
+            shares = [concurrency // connections + (index < concurrency % connections) for index in range(connections)]
+            await asyncio.gather(*(run_ws_connection(ws_url, share, result) for share in shares))
+        else:
+            connections = concurrency
+            await asyncio.gather(*(run_session(client, base_url, result) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+        stop.set()
+        await probe
+        server_lag = await server_loop_lag(client, base_url, elapsed)
+
+    peak_rss = max(samples["rss_kb"]) if samples["rss_kb"] else None
+    return {
+        "transport": transport,
+        "concurrency": concurrency,
+        "client_connections": connections,
+        "peak_server_sockets": max(samples["sockets"]) if samples["sockets"] else None,
+        "duration_s": elapsed,
+        "events": result["events"],
+        "events_per_s": result["events"] / elapsed if elapsed else None,
+        "frames": result["frames"],
+        "events_per_frame": result["events"] / result["frames"] if result["frames"] else None,
+        "completed": result["completed"],
+        "error_rate": (result["errors"] + result["incomplete"]) / concurrency,
+        "delivery_ms": distribution(result["delivery_ms"]),
+        "heartbeat_jitter_ms": distribution(result["heartbeat_jitter_ms"]),
+        "loop_lag_ms": distribution(samples["loop_lag_ms"]),
+        "server_loop_lag_ms": server_lag,
+        "peak_rss_mb": peak_rss / 1024 if peak_rss else None,
+        "rss_per_session_kb": (peak_rss - baseline_rss_kb) / concurrency if peak_rss and baseline_rss_kb else None,
+    }
+
+
+def saturated(level, thresholds):
+    """Return the list of thresholds a level broke."""
+    broken = []
+    if (level["delivery_ms"]["p99"] or 0) > thresholds["delivery_p99_ms"]:
+        broken.append("delivery p99")
+    if (level["heartbeat_jitter_ms"]["p99"] or 0) > thresholds["jitter_p99_ms"]:
+        broken.append("heartbeat jitter p99")
+    if (level["loop_lag_ms"]["p99"] or 0) > thresholds["loop_lag_p99_ms"]:
+        broken.append("event-loop lag p99")
+    if level["error_rate"] > thresholds["error_rate"]:
+        broken.append("error rate")
+    return broken
+
+
+def write_report(report, path):
+    """Write the report as JSON plus a Markdown table next to it."""
+    path = Path(path)
+    path.write_text(json.dumps(report, indent=2))
+    lines = [
+        f"# api_server load test ({report['timestamp'][:19]})",
+        "",
+        f"{report['events_per_session']} events per session, one every {report['event_interval']}s.",
+        "",
+        "| transport | sessions | connections | server sockets | events/s | events/frame | delivery p99 ms "
+        "| heartbeat jitter p99 ms | loop lag p99 ms | server loop lag p99 ms | RSS/session kB | errors | saturated |",
+        "|---|---|---|---|---|---|---|---|---|---|---|---|---|",
+    ]
+    for level in report["levels"]:
+        def fmt(value, spec=".1f"):
+            return format(value, spec) if value is not None else "-"
+        lines.append(
+            f"| {level['transport']} | {level['concurrency']} | {level['client_connections']} "
+            f"| {fmt(level['peak_server_sockets'], 'd')} | {fmt(level['events_per_s'])} "
+            f"| {fmt(level['events_per_frame'])} | {fmt(level['delivery_ms']['p99'])} "
+            f"| {fmt(level['heartbeat_jitter_ms']['p99'])} | {fmt(level['loop_lag_ms']['p99'])} "
+            f"| {fmt((level['server_loop_lag_ms'] or {}).get('p99'))} "
+            f"| {fmt(level['rss_per_session_kb'])} | {level['error_rate']:.1%} "
+            f"| {', '.join(level['saturated']) or 'no'} |"
+        )
+    lines.append("")
+    for transport, point in report["saturation_point"].items():
+        lines.append(f"Saturation point ({transport}): {point or 'not reached'}")
+    path.with_suffix(".md").write_text("\n".join(lines) + "\n")
+
+
+async def run_loadtest(levels, events_per_session, event_interval, thresholds, report_path,
+                       transports=("sse",), ws_connections=1):
+    from job_queue import SQLiteJobBroker
+
+    with tempfile.TemporaryDirectory(prefix="agent-loadtest-") as workdir:
+        port = free_port()
+        env = dict(os.environ, PORT=str(port), EMBEDDED_WORKERS="0", DATA_DIR=workdir)
+        os.environ["DATA_DIR"] = workdir
+        server = subprocess.Popen([sys.executable, str(REPO_DIR / "api_server.py")], cwd=REPO_DIR, env=env,
+                                  stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        broker = SQLiteJobBroker()
+        stop = asyncio.Event()
+        pipeline = asyncio.create_task(stub_pipeline(broker, stop, events_per_session, event_interval))
+        results = []
+        saturation_point = {transport: None for transport in transports}
+        try:
+            wait_for_port(port, timeout=30)
+            baseline_rss_kb = read_rss_kb(server.pid)
+            base_url = f"http://127.0.0.1:{port}"
+            for concurrency in levels:
+                for transport in transports:
+                    print(f"Running {concurrency} concurrent sessions over {transport}...", flush=True)
+                    level = await run_level(base_url, server.pid, concurrency, baseline_rss_kb,
+                                            transport, ws_connections)
+                    level["saturated"] = saturated(level, thresholds)
+                    results.append(level)
+                    print(f"  delivery p99 {level['delivery_ms']['p99']} ms, "
+                          f"loop lag p99 {level['loop_lag_ms']['p99']} ms, "
+                          f"server sockets {level['peak_server_sockets']}, errors {level['error_rate']:.1%}", flush=True)
+                    if level["saturated"] and saturation_point[transport] is None:
+                        saturation_point[transport] = concurrency
+        finally:
+            stop.set()
+            await pipeline
+            server.terminate()
+            server.wait(timeout=10)
+
+    report = {
+        "timestamp": datetime.now().isoformat(),
+        "events_per_session": events_per_session,
+        "event_interval": event_interval,
+        "baseline_rss_mb": baseline_rss_kb / 1024 if baseline_rss_kb else None,
+        "thresholds": thresholds,
+        "levels": results,
+        "saturation_point": saturation_point,
+    }
+    write_report(report, report_path)
+    print()
+    for transport, point in saturation_point.items():
+        print(f"Saturation point ({transport}): {point or 'not reached'}")
+    print(f"Report written to {report_path} and {Path(report_path).with_suffix('.md')}")
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="SSE and WebSocket load test for api_server")
+    parser.add_argument("--levels", default="10,50,100,200", help="Comma separated concurrency levels")
+    parser.add_argument("--events", type=int, default=20, help="Events published per session")
+    parser.add_argument("--event-interval", type=float, default=1.5, help="Seconds between events")
+    parser.add_argument("--transport", choices=["sse", "ws", "both"], default="sse")
+    parser.add_argument("--ws-connections", type=int, default=1, help="WebSockets the sessions are spread over")
+    parser.add_argument("--max-delivery-p99-ms", type=float, default=1000)
+    parser.add_argument("--max-jitter-p99-ms", type=float, default=500)
+    parser.add_argument("--max-loop-lag-p99-ms", type=float, default=250)
+    parser.add_argument("--max-error-rate", type=float, default=0.01)
+    parser.add_argument("--report", default=str(BENCH_DIR / "loadtest_report.json"))
+    args = parser.parse_args()
+
+    thresholds = {
+        "delivery_p99_ms": args.max_delivery_p99_ms,
+        "jitter_p99_ms": args.max_jitter_p99_ms,
+        "loop_lag_p99_ms": args.max_loop_lag_p99_ms,
+        "error_rate": args.max_error_rate,
+    }
+    levels = [int(level) for level in args.levels.split(",") if level.strip()]
+    transports = ("sse", "ws") if args.transport == "both" else (args.transport,)
+    asyncio.run(run_loadtest(levels, args.events, args.event_interval, thresholds, args.report,
+                             transports, args.ws_connections))
+
+
+if __name__ == "__main__":
+    main()
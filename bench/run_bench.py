@@ -0,0 +1,324 @@
+"""
+Offline benchmark suite for the agent pipeline.
+
+Starts local stand-ins for every outside service (a fake Anthropic endpoint, stub MCP
+stdio servers and a stub CoinGecko price API), then measures end-to-end and per-stage
+overhead of agent.main, runner.run_with_feedback_loop and api_server. Overhead is the
+measured time minus the latency the stubs were configured to add. Results are appended
+to bench/results.jsonl with the current git commit so runs can be compared across commits.
+
+Usage:
+    python bench/run_bench.py --iterations 3
+    python bench/run_bench.py --history
+"""
+import argparse
+import asyncio
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from datetime import datetime
+from pathlib import Path
+
+BENCH_DIR = Path(__file__).resolve().parent
+REPO_DIR = BENCH_DIR.parent
+RESULTS_FILE = BENCH_DIR / "results.jsonl"
+
+
+def free_port():
+    """Return a free TCP port on localhost."""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_for_port(port, timeout=15.0):
+    """Block until something listens on the port."""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.2):
+                return
+        except OSError:
+            time.sleep(0.05)
+    raise RuntimeError(f"Nothing listening on port {port} after {timeout}s")
+
+
+def git_commit():
+    """Return the current commit hash, or 'unknown'."""
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=REPO_DIR, text=True, stderr=subprocess.DEVNULL
+        ).strip()
+    except Exception:
+        return "unknown"
+
+
+def fetch_json(url):
+    with urllib.request.urlopen(url, timeout=5) as response:
+        return json.loads(response.read())
+
+
+class StubServices:
+    """Launches the stub servers and builds the environment that points the code at them."""
+
+    def __init__(self, workdir, llm_ttft_ms, llm_latency_ms, mcp_latency_ms, price_latency_ms,
+                 tool_calls, eval_window_seconds):
+        self.workdir = Path(workdir)
+        self.llm_ttft_ms = llm_ttft_ms
+        self.llm_latency_ms = llm_latency_ms
+        self.mcp_latency_ms = mcp_latency_ms
+        self.price_latency_ms = price_latency_ms
+        self.tool_calls = tool_calls
+        self.eval_window_seconds = eval_window_seconds
+        self.llm_port = free_port()
+        self.price_port = free_port()
+        self.processes = []
+
+    def start(self):
+        self.processes.append(subprocess.Popen([
+            sys.executable, str(BENCH_DIR / "fake_anthropic.py"), "--port", str(self.llm_port),
+            "--ttft-ms", str(self.llm_ttft_ms), "--latency-ms", str(self.llm_latency_ms),
+            "--tool-calls", str(self.tool_calls),
+        ]))
+        self.processes.append(subprocess.Popen([
+            sys.executable, str(BENCH_DIR / "stub_price.py"), "--port", str(self.price_port),
+            "--latency-ms", str(self.price_latency_ms), "--seed", "7",
+        ]))
+        wait_for_port(self.llm_port)
+        wait_for_port(self.price_port)
+
+        mcp_config = {
+            flavor_name: {
+                "command": sys.executable,
+                "args": [str(BENCH_DIR / "stub_mcp.py"), "--flavor", flavor, "--latency-ms", str(self.mcp_latency_ms)],
+            }
+            for flavor_name, flavor in (("brave-search", "brave"), ("coingecko", "coingecko"))
+        }
+        mcp_config_path = self.workdir / "mcp_servers.json"
+        mcp_config_path.write_text(json.dumps(mcp_config))
+
+        self.env = {
+            "ANTHROPIC_BASE_URL": f"http://127.0.0.1:{self.llm_port}",
+            "ANTHROPIC_API_KEY": "bench-stub-key",
+            "BRAVE_API_KEY": "bench-stub-key",
+            "COINGECKO_API_URL": f"http://127.0.0.1:{self.price_port}/api/v3",
+            "MCP_SERVERS_CONFIG": str(mcp_config_path),
+            "EVAL_WINDOW_SECONDS": str(self.eval_window_seconds),
+            "DATA_DIR": str(self.workdir / "data"),
+            "LOGS_DIR": str(self.workdir / "logs"),
+            # Measure the pipeline, not the production request budgets
+            "RATE_LIMIT_ANTHROPIC": "1000:1000",
+            "RATE_LIMIT_BRAVE": "1000:1000",
+            "RATE_LIMIT_COINGECKO": "1000:1000",
+            # Every measured session does the same full research
+            "INCREMENTAL_RESEARCH": "0",
+        }
+        os.environ.update(self.env)
+
+    def llm_stats(self):
+        return fetch_json(f"http://127.0.0.1:{self.llm_port}/stats")
+
+    def stub_time_ms(self, before, after):
+        """Latency the stubs themselves added between two /stats snapshots."""
+        llm_calls = after["requests"] - before["requests"]
+        tool_calls = after["tool_turns"] - before["tool_turns"]
+        return llm_calls * self.llm_latency_ms + tool_calls * self.mcp_latency_ms
+
+    def stop(self):
+        for process in self.processes:
+            process.terminate()
+        for process in self.processes:
+            try:
+                process.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+
+def summarize(samples):
+    """Mean, median, min and max of a list of numbers."""
+    if not samples:
+        return None
+    return {
+        "mean": statistics.fmean(samples),
+        "p50": statistics.median(samples),
+        "min": min(samples),
+        "max": max(samples),
+        "n": len(samples),
+    }
+
+
+async def bench_agent(stubs, coin_name, iterations):
+    """End-to-end and per-stage overhead of agent.main."""
+    import agent
+
+    rows = []
+    for _ in range(iterations):
+        before = stubs.llm_stats()
+        started = time.perf_counter()
+        result = await agent.main(coin_name)
+        wall_ms = (time.perf_counter() - started) * 1000
+        after = stubs.llm_stats()
+        metrics = result.get("metrics") or {}
+        stub_ms = stubs.stub_time_ms(before, after)
+        rows.append({
+            "wall_ms": wall_ms,
+            "research_ms": metrics.get("research_ms", 0.0),
+            "extraction_ms": metrics.get("extraction_ms", 0.0),
+            "stub_ms": stub_ms,
+            "overhead_ms": wall_ms - stub_ms,
+            "decision": (result.get("structured_decision") or {}).get("decision"),
+        })
+    return {key: summarize([row[key] for row in rows]) for key in
+            ("wall_ms", "research_ms", "extraction_ms", "stub_ms", "overhead_ms")}
+
+
+async def bench_runner(stubs, coin_name, iterations, max_retries=2):
+    """Overhead of runner.run_with_feedback_loop beyond stub latency and evaluation windows."""
+    import runner
+
+    rows = []
+    for _ in range(iterations):
+        before = stubs.llm_stats()
+        started = time.perf_counter()
+        _, attempts = await runner.run_with_feedback_loop(coin_name, max_retries=max_retries)
+        wall_ms = (time.perf_counter() - started) * 1000
+        after = stubs.llm_stats()
+        waited_ms = attempts * stubs.eval_window_seconds * 1000
+        stub_ms = stubs.stub_time_ms(before, after)
+        rows.append({
+            "wall_ms": wall_ms,
+            "attempts": attempts,
+            "stub_ms": stub_ms,
+            "overhead_ms": wall_ms - stub_ms - waited_ms,
+        })
+    return {key: summarize([row[key] for row in rows]) for key in ("wall_ms", "stub_ms", "overhead_ms")}
+
+
+async def bench_api_server(stubs, coin_name, iterations):
+    """Time to first SSE event and to completion for POST /api/run with an embedded worker."""
+    import httpx
+
+    port = free_port()
+    env = dict(os.environ, PORT=str(port), EMBEDDED_WORKERS="1")
+    process = subprocess.Popen([sys.executable, str(REPO_DIR / "api_server.py")], cwd=REPO_DIR, env=env)
+    try:
+        wait_for_port(port, timeout=30)
+        rows = []
+        async with httpx.AsyncClient(timeout=None) as client:
+            for _ in range(iterations):
+                before = stubs.llm_stats()
+                started = time.perf_counter()
+                first_event_ms = None
+                async with client.stream("POST", f"http://127.0.0.1:{port}/api/run",
+                                         json={"coin_name": coin_name, "max_retries": 1}) as response:
+                    async for line in response.aiter_lines():
+                        if not line.startswith("data: "):
+                            continue
+                        if first_event_ms is None:
+                            first_event_ms = (time.perf_counter() - started) * 1000
+                        if json.loads(line[6:]).get("type") in ("complete", "error"):
+                            break
+                wall_ms = (time.perf_counter() - started) * 1000
+                stub_ms = stubs.stub_time_ms(before, stubs.llm_stats())
+                rows.append({
+                    "first_event_ms": first_event_ms,
+                    "wall_ms": wall_ms,
+                    "overhead_ms": wall_ms - stub_ms - stubs.eval_window_seconds * 1000,
+                })
+    finally:
+        process.terminate()
+        process.wait(timeout=10)
+    return {key: summarize([row[key] for row in rows if row[key] is not None])
+            for key in ("first_event_ms", "wall_ms", "overhead_ms")}
+
+
+SCENARIOS = {
+    "agent": bench_agent,
+    "runner": bench_runner,
+    "api_server": bench_api_server,
+}
+
+
+async def run_benchmarks(stubs, coin_name, iterations, scenarios):
+    results = {}
+    for name in scenarios:
+        print(f"Running scenario {name} ({iterations} iterations)...", flush=True)
+        results[name] = await SCENARIOS[name](stubs, coin_name, iterations)
+    return results
+
+
+def print_results(results):
+    for scenario, metrics in results.items():
+        print(f"\n{scenario}")
+        for metric, summary in metrics.items():
+            if summary:
+                print(f"  {metric:<16} mean {summary['mean']:9.1f}  p50 {summary['p50']:9.1f}  "
+                      f"max {summary['max']:9.1f}  (n={summary['n']})")
+
+
+def print_history(limit=20):
+    """Show overhead per scenario for recent recorded runs."""
+    if not RESULTS_FILE.exists():
+        print("No benchmark results recorded yet.")
+        return
+    entries = [json.loads(line) for line in RESULTS_FILE.read_text().splitlines() if line.strip()]
+    print(f"{'commit':<10} {'timestamp':<20} " + " ".join(f"{name + ' ovh ms':>20}" for name in SCENARIOS))
+    for entry in entries[-limit:]:
+        cells = []
+        for name in SCENARIOS:
+            overhead = (entry["results"].get(name) or {}).get("overhead_ms")
+            cells.append(f"{overhead['mean']:>20.1f}" if overhead else f"{'-':>20}")
+        print(f"{entry['commit']:<10} {entry['timestamp'][:19]:<20} " + " ".join(cells))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline benchmarks with stub LLM, MCP and price services")
+    parser.add_argument("--coin-name", default="BTC")
+    parser.add_argument("--iterations", type=int, default=3)
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help="Comma separated subset of: " + ", ".join(SCENARIOS))
+    parser.add_argument("--llm-ttft-ms", type=float, default=200)
+    parser.add_argument("--llm-latency-ms", type=float, default=800)
+    parser.add_argument("--mcp-latency-ms", type=float, default=300)
+    parser.add_argument("--price-latency-ms", type=float, default=50)
+    parser.add_argument("--tool-calls", type=int, default=2, help="MCP tool calls per research session")
+    parser.add_argument("--eval-window", type=int, default=1, help="Evaluation window in seconds")
+    parser.add_argument("--no-record", action="store_true", help="Do not append to bench/results.jsonl")
+    parser.add_argument("--history", action="store_true", help="Print recorded results and exit")
+    args = parser.parse_args()
+
+    if args.history:
+        print_history()
+        return
+
+    scenarios = [name.strip() for name in args.scenarios.split(",") if name.strip()]
+    sys.path.insert(0, str(REPO_DIR))
+    with tempfile.TemporaryDirectory(prefix="agent-bench-") as workdir:
+        stubs = StubServices(workdir, args.llm_ttft_ms, args.llm_latency_ms, args.mcp_latency_ms,
+                             args.price_latency_ms, args.tool_calls, args.eval_window)
+        stubs.start()
+        try:
+            results = asyncio.run(run_benchmarks(stubs, args.coin_name, args.iterations, scenarios))
+        finally:
+            stubs.stop()
+
+    print_results(results)
+    if not args.no_record:
+        entry = {
+            "commit": git_commit(),
+            "timestamp": datetime.now().isoformat(),
+            "config": {key: value for key, value in vars(args).items() if key not in ("history", "no_record")},
+            "results": results,
+        }
+        with open(RESULTS_FILE, "a", encoding="utf-8") as f:
+            f.write(json.dumps(entry) + "\n")
+        print(f"\nRecorded results for commit {entry['commit']} in {RESULTS_FILE}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+"""
+Micro-benchmark for the session log serializer.
+
+Serializes typical SDK messages (a Brave search result, a CoinGecko markets result and
+an assistant turn with a tool call) with the previous approach (json.dumps per attribute
+as a serializability test, then the whole entry again) and with log_serializer, using
+orjson when installed and the json module otherwise. Reports time per log line and
+line size.
+
+Usage:
+    python bench/serializer_bench.py --iterations 2000
+"""
+import argparse
+import dataclasses
+import json
+import sys
+import time
+from pathlib import Path
+
+BENCH_DIR = Path(__file__).resolve().parent
+sys.path.insert(0, str(BENCH_DIR.parent))
+
+import log_serializer  # noqa: E402
+from bench.stub_mcp import brave_payload, coingecko_payload  # noqa: E402
+
+try:
+    from claude_agent_sdk.types import AssistantMessage, TextBlock, ToolResultBlock, ToolUseBlock, UserMessage
+except ImportError:
+    # Same shapes as the SDK types, so the benchmark runs without the SDK installed
+    @dataclasses.dataclass
+    class TextBlock:
+        text: str
+
+    @dataclasses.dataclass
+    class ToolUseBlock:
+        id: str
+        name: str
+        input: dict
+
+    @dataclasses.dataclass
+    class ToolResultBlock:
+        tool_use_id: str
+        content: object = None
+        is_error: bool = None
+
+    @dataclasses.dataclass
+    class UserMessage:
+        content: object
+
+    @dataclasses.dataclass
+    class AssistantMessage:
+        content: list
+        model: str
+
+
+def sample_messages():
+    """Messages shaped like a typical research session's tool traffic."""
+    return {
+        "brave_result": UserMessage(content=[ToolResultBlock(
+            tool_use_id="toolu_01", content=[{"type": "text", "text": brave_payload("bitcoin news", results=20)}]
+        )]),
+        "coingecko_result": UserMessage(content=[ToolResultBlock(
+            tool_use_id="toolu_02", content=[{"type": "text", "text": coingecko_payload("bitcoin,ethereum,solana")}]
+        )]),
+        "assistant_turn": AssistantMessage(model="claude-haiku-4-5", content=[
+            TextBlock(text="Checking recent news and market data before deciding."),
+            ToolUseBlock(id="toolu_03", name="mcp__brave-search__brave_web_search",
+                         input={"query": "bitcoin price news today", "count": 10}),
+        ]),
+    }
+
+
+def legacy_line(message):
+    """How agent.py serialized a message into a log line before log_serializer."""
+    data = {}
+    for key, value in message.__dict__.items():
+        try:
+            json.dumps(value)
+            data[key] = value
+        except (TypeError, ValueError):
+            data[key] = str(value)
+    data["_message_type"] = type(message).__name__
+    return json.dumps({"timestamp": "2025-01-01T00:00:00", "type": "agent_message", "data": data},
+                      ensure_ascii=False)
+
+
+def new_line(message):
+    return log_serializer.encode_log_entry("2025-01-01T00:00:00", "agent_message", message)
+
+
+def time_per_call(func, message, iterations):
+    func(message)
+    started = time.perf_counter()
+    for _ in range(iterations):
+        func(message)
+    return (time.perf_counter() - started) / iterations * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Session log serializer micro-benchmark")
+    parser.add_argument("--iterations", type=int, default=2000)
+    args = parser.parse_args()
+
+    orjson_module = log_serializer.orjson
+    variants = [("legacy json", legacy_line), ("capped json", None)]
+    if orjson_module is not None:
+        variants.append(("capped orjson", None))
+
+    print(f"{'payload':<18} {'serializer':<14} {'us/line':>10} {'bytes/line':>11}")
+    for name, message in sample_messages().items():
+        for variant, func in variants:
+            # Select the backend by swapping the module's optional import
+            log_serializer.orjson = orjson_module if variant == "capped orjson" else None
+            func = func or new_line
+            micros = time_per_call(func, message, args.iterations)
+            print(f"{name:<18} {variant:<14} {micros:>10.1f} {len(func(message).encode('utf-8')):>11}")
+    log_serializer.orjson = orjson_module
+
+
+if __name__ == "__main__":
+    main()
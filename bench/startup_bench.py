@@ -0,0 +1,103 @@
+"""
+Startup benchmark for agent.py, runner.py and api_server.py.
+
+Each measurement runs in a fresh interpreter so nothing is cached between samples:
+
+- import: wall time of `import <module>` (the interpreter's own startup is excluded)
+- first run: the module's first piece of real work after importing it. For agent and
+  runner that is building the runtime context (.env, seed prompt, MCP configs and agent
+  options, including the lazily imported SDK), plus for agent the options for a second
+  prompt; for api_server it is the first GET /api/health through the ASGI app.
+
+The heaviest imports come from `python -X importtime`. Compare commits by running the
+script on each one (`git stash` / `git checkout <rev>`); nothing is recorded.
+
+Usage:
+    python bench/startup_bench.py --samples 10
+    python bench/startup_bench.py --modules agent --top 15
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+BENCH_DIR = Path(__file__).resolve().parent
+REPO_DIR = BENCH_DIR.parent
+
+FIRST_RUN = {
+    "agent": "agent.get_runtime().options_for('Benchmark prompt')",
+    "runner": "runner.get_runtime()",
+    "api_server": (
+        "from fastapi.testclient import TestClient\n"
+        "TestClient(api_server.app).get('/api/health')"
+    ),
+}
+
+SAMPLE_SCRIPT = """
+import json, time
+started = time.perf_counter()
+import {module}
+imported = time.perf_counter()
+{first_run}
+done = time.perf_counter()
+print(json.dumps({{"import_ms": (imported - started) * 1000, "first_run_ms": (done - imported) * 1000}}))
+"""
+
+
+def run_sample(module, env):
+    script = SAMPLE_SCRIPT.format(module=module, first_run=FIRST_RUN[module])
+    output = subprocess.check_output([sys.executable, "-c", script], cwd=REPO_DIR, env=env, text=True)
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def heaviest_imports(module, env, top):
+    """(cumulative ms, package) for the slowest top-level imports, from -X importtime."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=REPO_DIR, env=env, capture_output=True, text=True, check=True
+    )
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        # Names are indented two spaces per nesting level; keep the module's direct imports
+        name = name[1:]
+        if name.startswith("  ") and not name.startswith("   "):
+            rows.append((int(cumulative) / 1000, name.strip()))
+    return sorted(rows, reverse=True)[:top]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import time and first-run latency per entry point")
+    parser.add_argument("--modules", default=",".join(FIRST_RUN), help="Comma separated subset of: " + ", ".join(FIRST_RUN))
+    parser.add_argument("--samples", type=int, default=5)
+    parser.add_argument("--top", type=int, default=8, help="Heaviest imports to list per module")
+    args = parser.parse_args()
+
+    modules = [name.strip() for name in args.modules.split(",") if name.strip()]
+    with tempfile.TemporaryDirectory(prefix="startup-bench-") as workdir:
+        # Keep the SQLite stores and logs the modules create out of the repo
+        env = dict(os.environ, DATA_DIR=str(Path(workdir) / "data"), LOGS_DIR=str(Path(workdir) / "logs"))
+        print(f"{'module':<12} {'import ms p50':>14} {'import ms max':>14} {'first run ms p50':>17}")
+        heaviest = {}
+        for module in modules:
+            samples = [run_sample(module, env) for _ in range(args.samples)]
+            import_ms = [sample["import_ms"] for sample in samples]
+            first_run_ms = [sample["first_run_ms"] for sample in samples]
+            print(f"{module:<12} {statistics.median(import_ms):>14.1f} {max(import_ms):>14.1f} "
+                  f"{statistics.median(first_run_ms):>17.1f}")
+            heaviest[module] = heaviest_imports(module, env, args.top)
+
+    for module, rows in heaviest.items():
+        print(f"\nHeaviest imports under {module}")
+        for cumulative_ms, name in rows:
+            print(f"  {cumulative_ms:8.1f} ms  {name}")
+
+
+if __name__ == "__main__":
+    main()
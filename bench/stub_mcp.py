@@ -0,0 +1,139 @@
+"""
+Stub MCP stdio server for offline benchmarks.
+
+Speaks newline-delimited JSON-RPC on stdin/stdout like the real servers and answers
+tool calls with canned payloads shaped like Brave Search or CoinGecko responses, after
+a configurable delay.
+
+Usage: python bench/stub_mcp.py --flavor brave --latency-ms 300
+"""
+import argparse
+import json
+import sys
+import time
+
+
+BRAVE_TOOLS = [
+    {
+        "name": "brave_web_search",
+        "description": "Performs a web search using the Brave Search API.",
+        "inputSchema": {
+            "type": "object",
+            "properties": {"query": {"type": "string"}, "count": {"type": "number"}},
+            "required": ["query"],
+        },
+    },
+]
+
+COINGECKO_TOOLS = [
+    {
+        "name": "get_coins_markets",
+        "description": "Market data (price, volume, market cap) for coins.",
+        "inputSchema": {
+            "type": "object",
+            "properties": {"ids": {"type": "string"}, "vs_currency": {"type": "string"}},
+        },
+    },
+]
+
+
+def brave_payload(query, results=10):
+    """A Brave web search response with the fields the real server returns."""
+    return "\n\n".join(
+        f"Title: {query} headline {i} - market moves as traders react\n"
+        f"Description: Analysts discuss {query} price action, volume spikes and what "
+        f"Reddit threads are saying about the next move. " * 3 + "\n"
+        f"URL: https://news.example.com/{i}"
+        for i in range(results)
+    )
+
+
+def coingecko_payload(ids="bitcoin"):
+    """A CoinGecko markets response with a realistic number of fields."""
+    return json.dumps([
+        {
+            "id": coin_id,
+            "symbol": coin_id[:3],
+            "name": coin_id.title(),
+            "image": f"https://assets.example.com/{coin_id}.png",
+            "current_price": 100000.0,
+            "market_cap": 2000000000000,
+            "market_cap_rank": 1,
+            "fully_diluted_valuation": 2100000000000,
+            "total_volume": 45000000000,
+            "high_24h": 101000.0,
+            "low_24h": 98000.0,
+            "price_change_24h": 1200.0,
+            "price_change_percentage_24h": 1.2,
+            "market_cap_change_24h": 24000000000,
+            "market_cap_change_percentage_24h": 1.2,
+            "circulating_supply": 19800000,
+            "total_supply": 21000000,
+            "max_supply": 21000000,
+            "ath": 110000.0,
+            "ath_change_percentage": -9.1,
+            "ath_date": "2025-10-01T00:00:00.000Z",
+            "atl": 67.81,
+            "atl_change_percentage": 147000.0,
+            "atl_date": "2013-07-06T00:00:00.000Z",
+            "roi": None,
+            "last_updated": "2025-11-20T12:00:00.000Z",
+        }
+        for coin_id in ids.split(",")
+    ])
+
+
+def handle(request, flavor, latency_ms):
+    """Return the JSON-RPC response for one request, or None for notifications."""
+    method = request.get("method")
+    params = request.get("params") or {}
+    if "id" not in request:
+        return None
+
+    if method == "initialize":
+        result = {
+            "protocolVersion": params.get("protocolVersion", "2024-11-05"),
+            "capabilities": {"tools": {}},
+            "serverInfo": {"name": f"stub-{flavor}", "version": "0.0.1"},
+        }
+    elif method == "tools/list":
+        result = {"tools": BRAVE_TOOLS if flavor == "brave" else COINGECKO_TOOLS}
+    elif method == "tools/call":
+        time.sleep(latency_ms / 1000)
+        arguments = params.get("arguments") or {}
+        if flavor == "brave":
+            text = brave_payload(arguments.get("query", "crypto"))
+        else:
+            text = coingecko_payload(arguments.get("ids", "bitcoin"))
+        result = {"content": [{"type": "text", "text": text}], "isError": False}
+    elif method == "ping":
+        result = {}
+    elif method in ("resources/list", "prompts/list"):
+        result = {method.split("/")[0]: []}
+    else:
+        return {"jsonrpc": "2.0", "id": request["id"],
+                "error": {"code": -32601, "message": f"Method not found: {method}"}}
+    return {"jsonrpc": "2.0", "id": request["id"], "result": result}
+
+
+def main(flavor, latency_ms):
+    for line in sys.stdin:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            request = json.loads(line)
+        except ValueError:
+            continue
+        response = handle(request, flavor, latency_ms)
+        if response is not None:
+            sys.stdout.write(json.dumps(response) + "\n")
+            sys.stdout.flush()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Stub MCP stdio server")
+    parser.add_argument("--flavor", choices=["brave", "coingecko"], default="brave")
+    parser.add_argument("--latency-ms", type=float, default=300, help="Delay before each tool result")
+    args = parser.parse_args()
+    main(args.flavor, args.latency_ms)
@@ -0,0 +1,103 @@
+"""
+Stub CoinGecko price API for offline benchmarks.
+
+Serves GET /api/v3/simple/price?ids=...&vs_currencies=usd with a random walk per coin
+id, after a configurable delay, plus a small fixed /coins/list and /coins/markets so the
+coin index loads from the stub instead of falling back. Point the code at it with
+COINGECKO_API_URL=http://127.0.0.1:<port>/api/v3.
+
+Usage: python bench/stub_price.py --port 8102 --latency-ms 50
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+
+# (id, symbol, name) in market cap order, enough for the coins the benchmarks use
+COINS = (
+    ("bitcoin", "btc", "Bitcoin"),
+    ("ethereum", "eth", "Ethereum"),
+    ("tether", "usdt", "Tether"),
+    ("binancecoin", "bnb", "BNB"),
+    ("solana", "sol", "Solana"),
+    ("ripple", "xrp", "XRP"),
+    ("dogecoin", "doge", "Dogecoin"),
+    ("cardano", "ada", "Cardano"),
+)
+
+
+class PriceWalk:
+    """Random-walk prices per coin id, shared across request threads."""
+
+    def __init__(self, seed=None, volatility=0.0005):
+        self.rng = random.Random(seed)
+        self.volatility = volatility
+        self.prices = {}
+        self.lock = threading.Lock()
+
+    def next_price(self, coin_id):
+        with self.lock:
+            price = self.prices.get(coin_id, 100.0 + self.rng.random() * 1000.0)
+            price *= 1 + self.rng.gauss(0, self.volatility)
+            self.prices[coin_id] = price
+            return round(price, 6)
+
+
+def make_handler(walk, latency_ms):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            pass
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            time.sleep(latency_ms / 1000)
+            if url.path.endswith("/simple/price"):
+                ids = parse_qs(url.query).get("ids", [""])[0]
+                payload = {coin_id: {"usd": walk.next_price(coin_id)} for coin_id in ids.split(",") if coin_id}
+                self._send_json(200, payload)
+            elif url.path.endswith("/coins/list"):
+                self._send_json(200, [{"id": coin_id, "symbol": symbol, "name": name}
+                                      for coin_id, symbol, name in COINS])
+            elif url.path.endswith("/coins/markets"):
+                # Every stub coin fits on the first page
+                page = int(parse_qs(url.query).get("page", ["1"])[0])
+                markets = [
+                    {"id": coin_id, "symbol": symbol, "name": name,
+                     "current_price": walk.next_price(coin_id), "market_cap_rank": rank}
+                    for rank, (coin_id, symbol, name) in enumerate(COINS, start=1)
+                ] if page == 1 else []
+                self._send_json(200, markets)
+            else:
+                self._send_json(404, {"error": f"Unknown path {url.path}"})
+
+        def _send_json(self, status, payload):
+            data = json.dumps(payload).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+    return Handler
+
+
+def serve(port, latency_ms=50, seed=None):
+    """Run the stub price API until interrupted."""
+    server = ThreadingHTTPServer(("127.0.0.1", port), make_handler(PriceWalk(seed), latency_ms))
+    print(f"Stub price API on http://127.0.0.1:{port}/api/v3 (latency {latency_ms}ms)", flush=True)
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Stub CoinGecko price and coin list API")
+    parser.add_argument("--port", type=int, default=8102)
+    parser.add_argument("--latency-ms", type=float, default=50)
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+    serve(args.port, args.latency_ms, args.seed)
@@ -0,0 +1,204 @@
+"""
+Record/replay cassettes for full agent sessions.
+
+With CASSETTE_MODE=record, every Claude Agent SDK message (including tool results), every
+Anthropic response used by extract_structured_decision and get_updated_prompt, and every
+CoinGecko price read by the runner is appended to the gzip-compressed JSONL file named by
+CASSETTE_PATH, which is truncated when recording starts. With CASSETTE_MODE=replay the same calls are answered from the file with no
+network, and the runner skips the evaluation wait, so prompt-loop regression runs take
+milliseconds and are reproducible. Live Anthropic calls go through the shared rate
+limiter (rate_limit.py); replayed ones do not.
+
+Interactions are matched by a key (a hash of the request) first and otherwise in
+recorded order per kind, because some requests (prompt rewrites) embed timestamped logs.
+"""
+import dataclasses
+import gzip
+import hashlib
+import json
+import os
+import threading
+from types import SimpleNamespace
+
+from rate_limit import get_upstream
+
+
+def encode(value):
+    """Convert SDK dataclasses (recursively) into JSON-safe data tagged with their type."""
+    if dataclasses.is_dataclass(value) and not isinstance(value, type):
+        encoded = {"__type__": type(value).__name__}
+        for field in dataclasses.fields(value):
+            encoded[field.name] = encode(getattr(value, field.name))
+        return encoded
+    if isinstance(value, dict):
+        return {str(key): encode(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [encode(item) for item in value]
+    if value is None or isinstance(value, (str, int, float, bool)):
+        return value
+    return str(value)
+
+
+def decode(value):
+    """Rebuild SDK dataclasses from encode() output."""
+    if isinstance(value, list):
+        return [decode(item) for item in value]
+    if not isinstance(value, dict):
+        return value
+    fields = {key: decode(item) for key, item in value.items() if key != "__type__"}
+    type_name = value.get("__type__")
+    if type_name is None:
+        return fields
+    from claude_agent_sdk import types as sdk_types
+    cls = getattr(sdk_types, type_name, None)
+    if cls is not None and dataclasses.is_dataclass(cls):
+        known = {field.name for field in dataclasses.fields(cls)}
+        try:
+            return cls(**{key: item for key, item in fields.items() if key in known})
+        except TypeError:
+            pass
+    return SimpleNamespace(**fields)
+
+
+def request_key(*parts):
+    """Stable short hash of the parts of a request."""
+    payload = json.dumps(encode(list(parts)), sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+
+
+class Cassette:
+    """A cassette file in record or replay mode."""
+
+    def __init__(self, path, mode):
+        self.path = path
+        self.mode = mode
+        self._lock = threading.Lock()
+        self._entries = []
+        self._used = set()
+        if mode == "replay":
+            with gzip.open(path, "rt", encoding="utf-8") as f:
+                self._entries = [json.loads(line) for line in f if line.strip()]
+        elif mode == "record":
+            # Start a fresh file; appending after an old session would replay its entries first
+            with open(path, "wb"):
+                pass
+
+    @property
+    def replaying(self):
+        return self.mode == "replay"
+
+    def record(self, kind, key, payload):
+        """Append one interaction to the cassette."""
+        line = json.dumps({"kind": kind, "key": key, "payload": payload}, ensure_ascii=False)
+        with self._lock:
+            # Appending writes a new gzip member; gzip readers treat members as one stream
+            with gzip.open(self.path, "at", encoding="utf-8") as f:
+                f.write(line + "\n")
+
+    def take(self, kind, key):
+        """Return the recorded payload for a request: exact key first, then next in order."""
+        with self._lock:
+            candidates = [
+                index for index, entry in enumerate(self._entries)
+                if entry["kind"] == kind and index not in self._used
+            ]
+            for index in candidates:
+                if self._entries[index]["key"] == key:
+                    break
+            else:
+                if not candidates:
+                    raise LookupError(f"Cassette {self.path} has no more '{kind}' interactions")
+                index = candidates[0]
+            self._used.add(index)
+            return self._entries[index]["payload"]
+
+
+_cassette = None
+_cassette_config = None
+
+
+def get_cassette():
+    """Return the active cassette (from CASSETTE_MODE/CASSETTE_PATH), or None."""
+    global _cassette, _cassette_config
+    mode = os.environ.get("CASSETTE_MODE", "off")
+    path = os.environ.get("CASSETTE_PATH")
+    if mode not in ("record", "replay") or not path:
+        return None
+    if _cassette_config != (mode, path):
+        _cassette = Cassette(path, mode)
+        _cassette_config = (mode, path)
+    return _cassette
+
+
+def is_replaying():
+    """True when calls are being answered from a cassette."""
+    cassette = get_cassette()
+    return cassette is not None and cassette.replaying
+
+
+async def query_messages(query, prompt, options):
+    """Stream SDK messages for a query, recording or replaying them through the cassette."""
+    cassette = get_cassette()
+    key = request_key(prompt, getattr(options, "system_prompt", None), getattr(options, "model", None))
+    if cassette is not None and cassette.replaying:
+        for message in cassette.take("query", key):
+            yield decode(message)
+        return
+
+    recorded = []
+    # A research session counts as one Anthropic call for rate limiting and the breaker
+    upstream = get_upstream("anthropic")
+    await upstream.acquire()
+    succeeded = True
+    try:
+        async for message in query(prompt=prompt, options=options):
+            if cassette is not None:
+                recorded.append(encode(message))
+            if hasattr(message, "total_cost_usd"):
+                succeeded = not getattr(message, "is_error", False)
+            yield message
+    except Exception:
+        upstream.record_result(False)
+        raise
+    except BaseException:
+        upstream.breaker.release()
+        raise
+    upstream.record_result(succeeded)
+    if cassette is not None:
+        cassette.record("query", key, recorded)
+
+
+def create_message(client, **kwargs):
+    """client.beta.messages.create, recorded or replayed through the cassette."""
+    cassette = get_cassette()
+    key = request_key(kwargs.get("model"), kwargs.get("messages"))
+    if cassette is not None and cassette.replaying:
+        payload = cassette.take("anthropic", key)
+        return SimpleNamespace(
+            content=[SimpleNamespace(type="text", text=payload["text"])],
+            usage=SimpleNamespace(**payload["usage"]) if payload.get("usage") else None,
+        )
+
+    with get_upstream("anthropic").guard_sync():
+        response = client.beta.messages.create(**kwargs)
+    if cassette is not None:
+        usage = getattr(response, "usage", None)
+        cassette.record("anthropic", key, {
+            "text": response.content[0].text,
+            "usage": {
+                "input_tokens": usage.input_tokens,
+                "output_tokens": usage.output_tokens,
+            } if usage else None,
+        })
+    return response
+
+
+async def coin_price(fetch, coin_name):
+    """Fetch a price through the cassette (recorded values are replayed in order)."""
+    cassette = get_cassette()
+    if cassette is not None and cassette.replaying:
+        return cassette.take("price", coin_name)
+    price = await fetch(coin_name)
+    if cassette is not None:
+        cassette.record("price", coin_name, price)
+    return price
@@ -0,0 +1,201 @@
+"""
+Cached CoinGecko symbol/name/id index.
+
+The full coin list (/coins/list) and the market cap ranks of the top coins
+(/coins/markets) are fetched once and saved to data/coingecko_coins.json, then
+refreshed after COIN_INDEX_TTL_SECONDS (default one day). Lookups are a single dict
+access on the lower-cased input, which may be a CoinGecko id, a ticker symbol or a coin
+name. An exact id is checked first. Many coins share a symbol (and some share names), so
+each symbol and name maps to the matching coin with the best market cap rank.
+
+When the list cannot be fetched and nothing is cached, the ten coins the app always
+supported are used.
+"""
+import asyncio
+import json
+import os
+import threading
+import time
+
+from rate_limit import get_upstream
+from storage import get_data_dir
+
+
+FALLBACK_COINS = [
+    {"id": "bitcoin", "symbol": "btc", "name": "Bitcoin", "rank": 1},
+    {"id": "ethereum", "symbol": "eth", "name": "Ethereum", "rank": 2},
+    {"id": "tether", "symbol": "usdt", "name": "Tether", "rank": 3},
+    {"id": "binancecoin", "symbol": "bnb", "name": "BNB", "rank": 4},
+    {"id": "solana", "symbol": "sol", "name": "Solana", "rank": 5},
+    {"id": "usd-coin", "symbol": "usdc", "name": "USD Coin", "rank": 6},
+    {"id": "ripple", "symbol": "xrp", "name": "XRP", "rank": 7},
+    {"id": "dogecoin", "symbol": "doge", "name": "Dogecoin", "rank": 8},
+    {"id": "cardano", "symbol": "ada", "name": "Cardano", "rank": 9},
+    {"id": "tron", "symbol": "trx", "name": "TRON", "rank": 10},
+]
+RETRY_SECONDS = 300
+
+
+def get_default_cache_path():
+    """Return the coin list cache path (override with COIN_INDEX_PATH)."""
+    return os.environ.get("COIN_INDEX_PATH") or str(get_data_dir() / "coingecko_coins.json")
+
+
+def coingecko_url(path):
+    return f"{os.environ.get('COINGECKO_API_URL', 'https://api.coingecko.com/api/v3')}{path}"
+
+
+def fetch_coin_list(ranked_pages=4):
+    """Download every coin plus market cap ranks for the top ranked_pages * 250."""
+    import httpx
+
+    api_key = os.environ.get("COINGECKO_API_KEY")
+    headers = {"x-cg-api-key": api_key} if api_key else {}
+    upstream = get_upstream("coingecko")
+    with httpx.Client(timeout=30, headers=headers) as client:
+        with upstream.guard_sync():
+            response = client.get(coingecko_url("/coins/list"))
+            response.raise_for_status()
+        coins = {coin["id"]: {"id": coin["id"], "symbol": coin["symbol"], "name": coin["name"], "rank": None}
+                 for coin in response.json()}
+        for page in range(1, ranked_pages + 1):
+            with upstream.guard_sync():
+                response = client.get(coingecko_url("/coins/markets"), params={
+                    "vs_currency": "usd", "order": "market_cap_desc", "per_page": 250, "page": page
+                })
+                response.raise_for_status()
+            for market in response.json():
+                if market["id"] in coins:
+                    coins[market["id"]]["rank"] = market.get("market_cap_rank")
+    return list(coins.values())
+
+
+def rank_key(coin):
+    """Sort key putting the largest market cap first and unranked coins last."""
+    return coin["rank"] if coin["rank"] is not None else float("inf")
+
+
+class CoinIndex:
+    """O(1) id/symbol/name lookups over the CoinGecko coin list, cached on disk."""
+
+    def __init__(self, cache_path=None, ttl_seconds=None):
+        self.cache_path = cache_path or get_default_cache_path()
+        self.ttl_seconds = ttl_seconds if ttl_seconds is not None else float(
+            os.environ.get("COIN_INDEX_TTL_SECONDS", 86400)
+        )
+        self._lock = threading.Lock()
+        self._coins = []
+        self._by_id = {}
+        self._by_key = {}
+        self._loaded_at = 0.0
+        self._retry_at = 0.0
+
+    def _build(self, coins):
+        ranked = sorted(coins, key=rank_key)
+        by_key = {}
+        # Best-ranked coin first, so setdefault keeps the best match for each symbol and name
+        for coin in ranked:
+            for key in (coin["symbol"].lower(), coin["name"].lower()):
+                by_key.setdefault(key, coin)
+        self._coins = ranked
+        self._by_id = {coin["id"]: coin for coin in ranked}
+        self._by_key = by_key
+
+    def _read_cache(self):
+        try:
+            with open(self.cache_path, "r", encoding="utf-8") as f:
+                cached = json.load(f)
+            return cached["fetched_at"], cached["coins"]
+        except (OSError, ValueError, KeyError):
+            return None, None
+
+    def _write_cache(self, coins):
+        tmp_path = f"{self.cache_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"fetched_at": time.time(), "coins": coins}, f)
+        os.replace(tmp_path, self.cache_path)
+
+    def fresh(self, now=None):
+        """True if the index is loaded and younger than the TTL."""
+        return bool(self._by_key) and (now or time.time()) - self._loaded_at < self.ttl_seconds
+
+    def load(self, force=False):
+        """Make sure the index is loaded and fresh; blocking, so call it off the event loop."""
+        with self._lock:
+            now = time.time()
+            if not force and self.fresh(now):
+                return
+            if not self._by_key:
+                fetched_at, coins = self._read_cache()
+                if coins:
+                    self._build(coins)
+                    self._loaded_at = fetched_at
+                    if not force and self.fresh(now):
+                        return
+            if not force and self._by_key and now < self._retry_at:
+                return
+            try:
+                coins = fetch_coin_list()
+                self._write_cache(coins)
+                self._build(coins)
+                self._loaded_at = now
+            except Exception as e:
+                print(f"Error fetching CoinGecko coin list: {e}")
+                self._retry_at = now + RETRY_SECONDS
+                # A stale cache beats the short fallback list
+                if not self._by_key:
+                    self._build(FALLBACK_COINS)
+
+    def lookup(self, coin_name):
+        """The coin record for an id, symbol or name, or None.
+
+        An exact CoinGecko id wins over a better-ranked coin whose symbol or name matches it.
+        """
+        key = coin_name.strip().lower()
+        return self._by_id.get(key) or self._by_key.get(key)
+
+    def resolve(self, coin_name):
+        """CoinGecko id for an id, symbol or name; unknown inputs pass through lower-cased."""
+        coin = self.lookup(coin_name)
+        return coin["id"] if coin else coin_name.strip().lower()
+
+    def candidates(self, symbol):
+        """Every coin sharing a symbol, best market cap first."""
+        symbol = symbol.strip().lower()
+        return [coin for coin in self._coins if coin["symbol"] == symbol]
+
+    def top(self, limit=10):
+        """The highest ranked coins."""
+        return [coin for coin in self._coins[:limit] if coin["rank"] is not None]
+
+    def search(self, query, limit=20):
+        """Coins whose symbol, name or id starts with the query, best ranked first."""
+        query = query.strip().lower()
+        exact = self.lookup(query)
+        matches = [exact] if exact else []
+        for coin in self._coins:
+            if len(matches) >= limit:
+                break
+            if coin is not exact and (coin["symbol"].startswith(query) or coin["name"].lower().startswith(query)
+                                      or coin["id"].startswith(query)):
+                matches.append(coin)
+        return matches
+
+
+_index = None
+
+
+def get_coin_index():
+    """Return the process-wide CoinIndex (call load() or resolve_coin_id before lookups)."""
+    global _index
+    if _index is None:
+        _index = CoinIndex()
+    return _index
+
+
+async def resolve_coin_id(coin_name):
+    """Map a coin symbol, name or id to its CoinGecko id, loading the index if needed."""
+    index = get_coin_index()
+    if not index.fresh():
+        await asyncio.to_thread(index.load)
+    return index.resolve(coin_name)
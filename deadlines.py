@@ -0,0 +1,65 @@
+"""
+Deadline budget for one agent attempt.
+
+The trading horizon is 1-2 minutes, so a decision is only useful if research, extraction
+and the entry price fetch finish quickly. A DeadlineBudget covers the whole attempt and
+also caps each stage separately; each stage gets whichever is smaller, its own limit or
+what is left of the total. Limits come from the environment:
+
+    RUN_DEADLINE_SECONDS          whole attempt, up to the T0 price (default 150)
+    RESEARCH_DEADLINE_SECONDS     query_agent, including tool calls (default 90)
+    EXTRACTION_DEADLINE_SECONDS   structured decision extraction (default 20)
+    PRICE_DEADLINE_SECONDS        each CoinGecko price fetch (default 10)
+    STALE_DECISION_SECONDS        decisions older than this are not traded (default 120)
+"""
+import os
+import time
+
+
+STAGE_DEFAULTS = {
+    "research": ("RESEARCH_DEADLINE_SECONDS", 90.0),
+    "extraction": ("EXTRACTION_DEADLINE_SECONDS", 20.0),
+    "price": ("PRICE_DEADLINE_SECONDS", 10.0),
+}
+
+
+def env_seconds(name, default):
+    """Read a number of seconds from the environment."""
+    return float(os.environ.get(name, default))
+
+
+def stage_limit(stage):
+    """Configured limit in seconds for one stage, ignoring the overall budget."""
+    name, default = STAGE_DEFAULTS[stage]
+    return env_seconds(name, default)
+
+
+def stale_decision_seconds():
+    """Age after which a decision is reported as stale instead of being scored."""
+    return env_seconds("STALE_DECISION_SECONDS", 120.0)
+
+
+class DeadlineBudget:
+    """Time budget for one attempt with per-stage limits."""
+
+    def __init__(self, total=None, **stage_limits):
+        self.total = total if total is not None else env_seconds("RUN_DEADLINE_SECONDS", 150.0)
+        self.stage_limits = {
+            stage: stage_limits[stage] if stage_limits.get(stage) is not None else stage_limit(stage)
+            for stage in STAGE_DEFAULTS
+        }
+        self.started = time.monotonic()
+
+    def elapsed(self):
+        """Seconds since the budget started; for a decision, how old its research is."""
+        return time.monotonic() - self.started
+
+    def remaining(self):
+        return max(0.0, self.total - self.elapsed())
+
+    def expired(self):
+        return self.remaining() <= 0
+
+    def timeout_for(self, stage):
+        """Seconds the given stage may take right now."""
+        return min(self.stage_limits[stage], self.remaining())
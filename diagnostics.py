@@ -0,0 +1,269 @@
+"""
+Event-loop lag monitor and on-demand profiling for the API server.
+
+LoopLagMonitor wakes up every LOOP_LAG_INTERVAL seconds (default 0.1, 0 disables) and
+records how late each wake-up was: how long any callback scheduled at that moment had
+to wait for the loop. It keeps the last LOOP_LAG_WINDOW samples (default 6000, ten
+minutes at the default interval) for GET /api/loop-lag. When a wake-up is more than
+LOOP_LAG_STALL_MS overdue (default 250), a watchdog thread captures the loop thread's
+stack while it is still blocked, so a stall names the code that caused it.
+
+profile_stacks() is a sampling CPU profiler: it reads every thread's Python stack every
+few milliseconds for N seconds and returns collapsed stacks ("frame;frame;frame count"
+per line), the input format of flamegraph.pl and speedscope. MemoryTracer wraps
+tracemalloc: start() takes a baseline snapshot and diff() lists the tracebacks whose
+allocations grew most since then. Both are exposed as admin endpoints in api_server.py.
+"""
+import asyncio
+import linecache
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter, deque
+
+from stats import percentile
+
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+STALL_STACK_FRAMES = 30
+
+
+def short_path(filename):
+    """A file name relative to the app directory, or its last two components elsewhere."""
+    if filename.startswith(APP_DIR + os.sep):
+        return filename[len(APP_DIR) + 1:]
+    return os.sep.join(filename.split(os.sep)[-2:])
+
+
+def format_frame(frame, current_line=True):
+    """"function (file:line)", at the line running now or, for profiles, where the function starts."""
+    code = frame.f_code
+    line = frame.f_lineno if current_line else code.co_firstlineno
+    return f"{code.co_name} ({short_path(code.co_filename)}:{line})"
+
+
+def frame_stack(frame, current_line=True):
+    """A frame and its callers, outermost first."""
+    stack = []
+    while frame is not None:
+        stack.append(format_frame(frame, current_line))
+        frame = frame.f_back
+    return stack[::-1]
+
+
+class LoopLagMonitor:
+    """Measures how late the event loop runs a periodic callback."""
+
+    def __init__(self, interval=None, window=None, stall_ms=None):
+        self.interval = interval if interval is not None else float(os.environ.get("LOOP_LAG_INTERVAL", 0.1))
+        window = window or int(os.environ.get("LOOP_LAG_WINDOW", 6000))
+        self.stall_ms = stall_ms if stall_ms is not None else float(os.environ.get("LOOP_LAG_STALL_MS", 250))
+        self.samples = deque(maxlen=window)  # (monotonic time, lag ms)
+        self.stalls = deque(maxlen=20)
+        self.max_lag_ms = 0.0
+        self.total_samples = 0
+        self._lock = threading.Lock()
+        self._last_beat = None
+        self._stalled = False
+        self._loop_thread = None
+
+    async def run(self):
+        """Sample the loop forever; run it as a task on the loop to watch."""
+        loop = asyncio.get_running_loop()
+        self._loop_thread = threading.get_ident()
+        self._last_beat = time.monotonic()
+        threading.Thread(target=self._watch, name="loop-lag-watchdog", daemon=True).start()
+        while True:
+            expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            lag_ms = max(0.0, (loop.time() - expected) * 1000)
+            now = time.monotonic()
+            with self._lock:
+                self._last_beat = now
+                self.samples.append((now, lag_ms))
+                self.total_samples += 1
+                self.max_lag_ms = max(self.max_lag_ms, lag_ms)
+                if self._stalled:
+                    # The watchdog saw this stall begin; now its full length is known
+                    self.stalls[-1]["lag_ms"] = lag_ms
+                    self._stalled = False
+
+    def _watch(self):
+        """Capture the loop thread's stack once per stall, while it is still blocked."""
+        while True:
+            time.sleep(self.stall_ms / 2000)
+            with self._lock:
+                overdue_ms = (time.monotonic() - self._last_beat - self.interval) * 1000
+                if self._stalled or overdue_ms < self.stall_ms:
+                    continue
+                # Appended together with the flag, so run() always finds this stall to update
+                stall = {"at": time.time(), "lag_ms": overdue_ms, "stack": []}
+                self.stalls.append(stall)
+                self._stalled = True
+            frame = sys._current_frames().get(self._loop_thread)
+            stack = frame_stack(frame)[-STALL_STACK_FRAMES:] if frame is not None else []
+            with self._lock:
+                stall["stack"] = stack
+
+    def snapshot(self, seconds=None):
+        """Lag distribution over the last `seconds` (or the whole window), plus recent stalls."""
+        cutoff = time.monotonic() - seconds if seconds else None
+        with self._lock:
+            lags = sorted(lag for at, lag in self.samples if cutoff is None or at >= cutoff)
+            stalls = [dict(stall) for stall in self.stalls]
+            total_samples = self.total_samples
+            max_lag_ms = self.max_lag_ms
+        return {
+            "interval_ms": self.interval * 1000,
+            "samples": len(lags),
+            "p50_ms": percentile(lags, 0.50),
+            "p99_ms": percentile(lags, 0.99),
+            "max_ms": lags[-1] if lags else None,
+            "stall_threshold_ms": self.stall_ms,
+            "stalled_samples": sum(1 for lag in lags if lag >= self.stall_ms),
+            "total_samples": total_samples,
+            "max_ms_since_start": max_lag_ms,
+            "recent_stalls": stalls,
+        }
+
+
+_monitor = None
+
+
+def get_loop_lag_monitor():
+    """Return the process-wide LoopLagMonitor, creating it on first use."""
+    global _monitor
+    if _monitor is None:
+        _monitor = LoopLagMonitor()
+    return _monitor
+
+
+_profile_lock = threading.Lock()
+
+
+def profile_stacks(seconds, interval=0.005):
+    """Sample every other thread's Python stack for `seconds`; returns {collapsed stack: samples}.
+
+    Raises RuntimeError if a profile is already running in this process.
+    """
+    if not _profile_lock.acquire(blocking=False):
+        raise RuntimeError("A profile is already running")
+    try:
+        own_thread = threading.get_ident()
+        counts = Counter()
+        names = {}
+        deadline = time.monotonic() + seconds
+        while time.monotonic() < deadline:
+            frames = sys._current_frames()
+            if frames.keys() - names.keys():
+                names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for thread_id, frame in frames.items():
+                if thread_id == own_thread:
+                    continue
+                # One frame per function, so a function's samples merge into one flamegraph box
+                stack = [names.get(thread_id, f"thread-{thread_id}"), *frame_stack(frame, current_line=False)]
+                # Collapsed stacks separate frames with ';' and end with the count after the last space
+                counts[";".join(name.replace(";", ":") for name in stack)] += 1
+            time.sleep(interval)
+        return counts
+    finally:
+        _profile_lock.release()
+
+
+def collapsed(counts):
+    """Collapsed stack text, one "frame;frame;frame count" line per distinct stack."""
+    return "".join(f"{stack} {count}\n" for stack, count in counts.most_common())
+
+
+class MemoryTracer:
+    """tracemalloc snapshots diffed against a baseline taken at start()."""
+
+    GROUPS = ("traceback", "lineno", "filename")
+
+    def __init__(self):
+        self.baseline = None
+        self.started_at = None
+        self._lock = threading.Lock()
+
+    def start(self, frames=25):
+        """Start tracing and take the baseline snapshot.
+
+        If tracing is already running with a different traceback depth it is restarted
+        with `frames`; memory allocated before that is no longer attributed.
+        """
+        with self._lock:
+            if tracemalloc.is_tracing() and tracemalloc.get_traceback_limit() != frames:
+                tracemalloc.stop()
+            if not tracemalloc.is_tracing():
+                tracemalloc.start(frames)
+            self.baseline = tracemalloc.take_snapshot()
+            self.started_at = time.time()
+        return self.status()
+
+    def stop(self):
+        with self._lock:
+            tracemalloc.stop()
+            self.baseline = None
+            self.started_at = None
+
+    def status(self):
+        tracing = tracemalloc.is_tracing()
+        current, peak = tracemalloc.get_traced_memory() if tracing else (0, 0)
+        return {
+            "tracing": tracing,
+            "frames": tracemalloc.get_traceback_limit() if tracing else None,
+            "started_at": self.started_at,
+            "traced_kb": current / 1024,
+            "peak_kb": peak / 1024,
+        }
+
+    def diff(self, limit=25, group_by="traceback", scope="app", reset=False):
+        """The allocations that grew most since the baseline, largest first.
+
+        scope="app" keeps allocations with any frame in this repository; reset=True makes
+        this snapshot the new baseline. Raises RuntimeError if tracing was not started.
+        """
+        filters = [
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap*>"),
+            tracemalloc.Filter(False, "<unknown>"),
+        ]
+        if scope == "app":
+            filters.append(tracemalloc.Filter(True, os.path.join(APP_DIR, "*"), all_frames=True))
+        with self._lock:
+            if self.baseline is None or not tracemalloc.is_tracing():
+                raise RuntimeError("tracemalloc is not running; start it first")
+            snapshot = tracemalloc.take_snapshot()
+            baseline = self.baseline
+            if reset:
+                self.baseline = snapshot
+        stats = snapshot.filter_traces(filters).compare_to(baseline.filter_traces(filters), group_by)
+        return {
+            **self.status(),
+            "group_by": group_by,
+            "scope": scope,
+            "top": [
+                {
+                    "size_diff_kb": stat.size_diff / 1024,
+                    "size_kb": stat.size / 1024,
+                    "count_diff": stat.count_diff,
+                    "count": stat.count,
+                    # Innermost frame first, with its source line
+                    "traceback": [
+                        f"{short_path(frame.filename)}:{frame.lineno}  "
+                        f"{linecache.getline(frame.filename, frame.lineno).strip()}"
+                        for frame in reversed(stat.traceback)
+                    ],
+                }
+                for stat in stats[:limit]
+            ],
+        }
+
+
+_tracer = MemoryTracer()
+
+
+def get_memory_tracer():
+    return _tracer
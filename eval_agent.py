@@ -1,9 +1,15 @@
 import asyncio
 import argparse
 import os
+import random
+import time
 from pathlib import Path
 import httpx
 from agent import main as agent_main
+from random_eval_agent import score_random_sides, summarize_profits
+from stats import wilson_interval, mean_confidence_interval, percentile, two_proportion_z, sign_flip_p_value
+from coin_index import resolve_coin_id
+from rate_limit import get_upstream, parse_retry_after
 import anyio
 
 
@@ -19,69 +25,44 @@ def load_env_file():
                     os.environ[key.strip()] = value.strip()
 
 
-async def get_coin_price(coin_name):
-    """Get current price of a coin from CoinGecko API."""
-    # Map common coin symbols to CoinGecko IDs (Top 10 cryptocurrencies)
-    coin_id_map = {
-        # Bitcoin
-        "BTC": "bitcoin",
-        "bitcoin": "bitcoin",
-        # Ethereum
-        "ETH": "ethereum",
-        "ethereum": "ethereum",
-        # Tether
-        "USDT": "tether",
-        "tether": "tether",
-        # BNB
-        "BNB": "binancecoin",
-        "binancecoin": "binancecoin",
-        # Solana
-        "SOL": "solana",
-        "solana": "solana",
-        # USDC
-        "USDC": "usd-coin",
-        "usd-coin": "usd-coin",
-        # XRP
-        "XRP": "ripple",
-        "ripple": "ripple",
-        # Dogecoin
-        "DOGE": "dogecoin",
-        "dogecoin": "dogecoin",
-        # Cardano
-        "ADA": "cardano",
-        "cardano": "cardano",
-        # TRON
-        "TRX": "tron",
-        "tron": "tron"
-    }
-    
-    # Get CoinGecko ID (default to lowercase coin_name if not in map)
-    coin_id = coin_id_map.get(coin_name.upper(), coin_name.lower())
+async def get_coin_price(coin_name, client=None):
+    """Get current price of a coin from CoinGecko API (optionally on a shared client)."""
+    coin_id = await resolve_coin_id(coin_name)
     
     # Get API key from environment (optional, but recommended)
     api_key = os.environ.get("COINGECKO_API_KEY")
     
-    async with httpx.AsyncClient() as client:
-        try:
-            headers = {}
-            if api_key:
-                headers["x-cg-api-key"] = api_key
-            
+    owns_client = client is None
+    client = client or httpx.AsyncClient()
+    try:
+        headers = {}
+        if api_key:
+            headers["x-cg-api-key"] = api_key
+        
+        # Harness trials run concurrently, so they share the process-wide CoinGecko budget
+        upstream = get_upstream("coingecko")
+        async with upstream.guard():
             response = await client.get(
-                "https://api.coingecko.com/api/v3/simple/price",
+                f"{os.environ.get('COINGECKO_API_URL', 'https://api.coingecko.com/api/v3')}/simple/price",
                 params={"ids": coin_id, "vs_currencies": "usd"},
                 headers=headers
             )
+            if response.status_code == 429:
+                # Hold every caller in this process back for as long as CoinGecko asks
+                upstream.bucket.pause(parse_retry_after(response.headers.get("Retry-After")))
             response.raise_for_status()
-            data = response.json()
-            
-            if coin_id in data:
-                return data[coin_id]["usd"]
-            
-            return None
-        except Exception as e:
-            print(f"Error fetching price: {e}")
-            return None
+        data = response.json()
+        
+        if coin_id in data:
+            return data[coin_id]["usd"]
+        
+        return None
+    except Exception as e:
+        print(f"Error fetching price: {e}")
+        return None
+    finally:
+        if owns_client:
+            await client.aclose()
 
 
 async def evaluate_agent(coin_name):
@@ -90,7 +71,7 @@ async def evaluate_agent(coin_name):
     
     # Step 1: Call agent.py to get buy/sell decision
     print(f"Calling agent for {coin_name}...")
-    agent_result = await agent_main(coin_name)
+    agent_result = await agent_main(coin_name, incremental=False)
     
     if not agent_result or not agent_result.get("structured_decision"):
         print("Failed to get decision from agent")
@@ -143,11 +124,193 @@ async def evaluate_agent(coin_name):
     return result
 
 
+async def evaluate_agent_trial(coin_name, repetition, client, semaphore, hold_seconds=30):
+    """Run the agent once for a coin and score its decision over hold_seconds."""
+    trial = {"coin": coin_name, "repetition": repetition, "status": "no_decision",
+             "decision": None, "price_before": None, "price_after": None, "profit": None,
+             "success": False, "latency_ms": None, "cost_usd": 0.0}
+    
+    async with semaphore:
+        started = time.perf_counter()
+        try:
+            # Each trial researches from scratch so trials stay independent
+            agent_result = await agent_main(coin_name, incremental=False)
+        except Exception as e:
+            print(f"[{coin_name} #{repetition}] Agent failed: {e}")
+            trial["status"] = "error"
+            return trial
+        trial["latency_ms"] = (time.perf_counter() - started) * 1000
+    
+    metrics = agent_result.get("metrics") or {}
+    trial["cost_usd"] = metrics.get("cost_usd", 0.0)
+    if not agent_result.get("structured_decision"):
+        return trial
+    
+    # The holding window runs outside the semaphore: it needs no agent resources
+    decision = agent_result["structured_decision"]["decision"]
+    trial["decision"] = decision
+    price_before = await get_coin_price(coin_name, client)
+    await asyncio.sleep(hold_seconds)
+    price_after = await get_coin_price(coin_name, client)
+    if price_before is None or price_after is None:
+        trial["status"] = "price_error"
+        return trial
+    
+    profit = price_after - price_before if decision == "BUY" else price_before - price_after
+    trial.update(status="evaluated", price_before=price_before, price_after=price_after,
+                 profit=profit, success=profit > 0)
+    print(f"[{coin_name} #{repetition}] {decision}: profit ${profit:.4f} "
+          f"(agent {trial['latency_ms'] / 1000:.1f}s)")
+    return trial
+
+
+def summarize_trials(trials):
+    """Win rate with Wilson interval, mean PnL, latency distribution and cost per decision."""
+    evaluated = [trial for trial in trials if trial["status"] == "evaluated"]
+    profits = [trial["profit"] for trial in evaluated]
+    wins = sum(1 for trial in evaluated if trial["success"])
+    latencies = sorted(trial["latency_ms"] for trial in trials if trial["latency_ms"] is not None)
+    decisions = sum(1 for trial in trials if trial["decision"])
+    total_cost = sum(trial["cost_usd"] or 0.0 for trial in trials)
+    mean, variance, low, high = mean_confidence_interval(
+        sum(profits), sum(profit * profit for profit in profits), len(profits)
+    )
+    return {
+        "runs": len(trials),
+        "decisions": decisions,
+        "evaluated": len(evaluated),
+        "wins": wins,
+        "win_rate": wins / len(evaluated) if evaluated else None,
+        "win_rate_ci": wilson_interval(wins, len(evaluated)),
+        "mean_profit": mean,
+        "profit_variance": variance,
+        "mean_profit_ci": (low, high),
+        "latency_ms": {
+            "p50": percentile(latencies, 0.50),
+            "p90": percentile(latencies, 0.90),
+            "p99": percentile(latencies, 0.99),
+            "max": latencies[-1] if latencies else None,
+        },
+        "total_cost_usd": total_cost,
+        "cost_per_decision_usd": total_cost / decisions if decisions else None,
+    }
+
+
+def compare_to_baseline(agent_summary, baseline_summary, agent_profits):
+    """Head-to-head comparison of the agent and the random baseline on the same moves.
+    
+    The baseline counts as K samples (its windows), not as its number of draws. The
+    paired test is sign_flip_p_value: how often random sides on the agent's own K moves
+    earn at least the agent's PnL.
+    """
+    agent_rate = agent_summary["win_rate"]
+    baseline_rate = baseline_summary["win_rate"]
+    samples = baseline_summary["samples"]
+    z = two_proportion_z(
+        agent_summary["wins"], agent_summary["evaluated"],
+        (baseline_rate or 0.0) * samples, samples
+    )
+    return {
+        "agent_win_rate": agent_rate,
+        "baseline_win_rate": baseline_rate,
+        "win_rate_lift": agent_rate - baseline_rate if agent_rate is not None and baseline_rate is not None else None,
+        "z_score": z,
+        "sign_flip_p": sign_flip_p_value(agent_profits),
+    }
+
+
+def random_baseline(trials, num_draws=1000, seed=None):
+    """Random BUY/SELL baseline over the agent trials' own holding windows.
+    
+    Every draw takes the entry and exit prices of one evaluated trial and a random side,
+    so the baseline is scored at the same timestamps and over the same hold as the agent.
+    """
+    moves = [trial["price_after"] - trial["price_before"] for trial in trials if trial["status"] == "evaluated"]
+    # The draws only resample these K moves, so K is the baseline's sample size
+    summary = summarize_profits(score_random_sides(moves, num_draws, random.Random(seed)), samples=len(moves))
+    summary["windows"] = len(moves)
+    return summary
+
+
+async def run_evaluation_harness(coin_names, repetitions=5, concurrency=4, hold_seconds=30,
+                                 baseline_draws=1000):
+    """Run the agent K times per coin with bounded parallelism and compare against random.
+    
+    Price fetches share one HTTP client; the semaphore bounds concurrent agent sessions and
+    therefore the number of MCP server processes alive at once. The random baseline is
+    scored over the windows the agent's decisions were held in (see random_baseline).
+    """
+    load_env_file()
+    semaphore = asyncio.Semaphore(concurrency)
+    
+    async with httpx.AsyncClient() as client:
+        trials = await asyncio.gather(*(
+            evaluate_agent_trial(coin_name, repetition, client, semaphore, hold_seconds)
+            for coin_name in coin_names
+            for repetition in range(1, repetitions + 1)
+        ))
+    
+    report = {"overall": summarize_trials(trials), "coins": {}}
+    for coin_name in coin_names:
+        coin_trials = [trial for trial in trials if trial["coin"] == coin_name]
+        coin_summary = summarize_trials(coin_trials)
+        baseline = random_baseline(coin_trials, baseline_draws)
+        coin_summary["baseline"] = baseline
+        coin_summary["vs_baseline"] = compare_to_baseline(
+            coin_summary, baseline, [trial["profit"] for trial in coin_trials if trial["status"] == "evaluated"]
+        )
+        report["coins"][coin_name] = coin_summary
+    return report
+
+
+def format_rate(rate, interval):
+    """Format a win rate with its confidence interval."""
+    if rate is None:
+        return "n/a"
+    return f"{rate:.1%} (95% CI {interval[0]:.1%} - {interval[1]:.1%})"
+
+
+def print_harness_report(report):
+    """Print a harness report."""
+    for coin_name, summary in [("ALL", report["overall"])] + list(report["coins"].items()):
+        print(f"\n{coin_name}: {summary['evaluated']}/{summary['runs']} runs evaluated")
+        print(f"  Agent win rate: {format_rate(summary['win_rate'], summary['win_rate_ci'])}")
+        if summary["mean_profit"] is not None:
+            low, high = summary["mean_profit_ci"]
+            print(f"  Mean PnL: ${summary['mean_profit']:.4f} (95% CI ${low:.4f} - ${high:.4f})")
+        latency = summary["latency_ms"]
+        if latency["p50"] is not None:
+            print(f"  Agent latency: p50 {latency['p50'] / 1000:.1f}s, p90 {latency['p90'] / 1000:.1f}s, "
+                  f"max {latency['max'] / 1000:.1f}s")
+        if summary["cost_per_decision_usd"] is not None:
+            print(f"  Cost per decision: ${summary['cost_per_decision_usd']:.4f}")
+        if "vs_baseline" in summary:
+            baseline = summary["baseline"]
+            comparison = summary["vs_baseline"]
+            print(f"  Random baseline win rate: {format_rate(baseline['win_rate'], baseline['win_rate_ci'])}")
+            if comparison["win_rate_lift"] is not None:
+                print(f"  Lift over random: {comparison['win_rate_lift']:+.1%} (z = {comparison['z_score']:.2f})")
+            if comparison["sign_flip_p"] is not None:
+                print(f"  Paired sign-flip p (random sides on the same moves earn as much): "
+                      f"{comparison['sign_flip_p']:.3f}")
+
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Evaluate crypto agent decision")
-    parser.add_argument("--coin-name", required=True, help="Coin name to evaluate (e.g., BTC, ETH)")
+    parser.add_argument("--coin-name", required=True, help="Coin name(s) to evaluate, comma separated (e.g., BTC or BTC,ETH)")
+    parser.add_argument("--repetitions", type=int, default=1, help="Agent runs per coin; above 1 runs the statistical harness")
+    parser.add_argument("--concurrency", type=int, default=4, help="Maximum concurrent agent sessions (default: 4)")
+    parser.add_argument("--hold", type=float, default=30, help="Seconds each decision is held before scoring (default: 30)")
     args = parser.parse_args()
     
-    result = anyio.run(evaluate_agent, args.coin_name)
-    print(f"\nFinal result: {result}")
+    coin_names = [coin.strip() for coin in args.coin_name.split(",") if coin.strip()]
+    if args.repetitions == 1 and len(coin_names) == 1:
+        result = anyio.run(evaluate_agent, coin_names[0])
+        print(f"\nFinal result: {result}")
+    else:
+        report = anyio.run(run_evaluation_harness, coin_names, args.repetitions, args.concurrency, args.hold)
+        print("\n" + "="*50)
+        print("EVALUATION REPORT")
+        print("="*50)
+        print_harness_report(report)
 
@@ -0,0 +1,279 @@
+"""
+Durable local job queue for agent runs.
+
+The API server enqueues runs, standalone worker processes (``python runner.py --worker``)
+claim them with a time-limited lease, and every progress event is published to a shared
+store that the SSE endpoints tail. Workers also publish their upstream rate limiter and
+circuit breaker metrics there, since the API server makes none of those calls itself.
+Everything lives in one SQLite file, so it works on a single Linux box with no outside
+services.
+"""
+import abc
+import asyncio
+import json
+import os
+import socket
+import threading
+import time
+import uuid
+
+from storage import connect, get_data_dir
+
+
+TERMINAL_EVENT_TYPES = ("complete", "error")
+DEFAULT_LEASE_SECONDS = 30
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    coin_name TEXT NOT NULL,
+    max_retries INTEGER NOT NULL,
+    status TEXT NOT NULL,
+    worker_id TEXT,
+    lease_expires REAL,
+    claims INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_status_created ON jobs (status, created_at);
+CREATE TABLE IF NOT EXISTS job_events (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    job_id TEXT NOT NULL,
+    type TEXT NOT NULL,
+    data TEXT NOT NULL,
+    timestamp REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_job_events_job ON job_events (job_id, id);
+CREATE TABLE IF NOT EXISTS worker_upstreams (
+    process TEXT PRIMARY KEY,
+    metrics TEXT NOT NULL,
+    updated_at REAL NOT NULL
+);
+"""
+
+
+def get_default_queue_path():
+    """Return the queue database path (override with JOB_QUEUE_DB)."""
+    return os.environ.get("JOB_QUEUE_DB") or str(get_data_dir() / "jobs.db")
+
+
+def make_worker_id():
+    """Build a worker id that is unique across processes and hosts."""
+    return f"{process_id()}:{uuid.uuid4().hex[:8]}"
+
+
+def process_id():
+    """"host:pid" of this process; workers in one process share its upstream limiters."""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+class JobBroker(abc.ABC):
+    """Minimal broker interface shared by the API server and the run workers."""
+
+    @abc.abstractmethod
+    def enqueue(self, coin_name, max_retries):
+        """Add a run to the queue and return its job id."""
+
+    @abc.abstractmethod
+    def claim(self, worker_id, lease_seconds=DEFAULT_LEASE_SECONDS):
+        """Claim the oldest runnable job, or return None if the queue is empty."""
+
+    @abc.abstractmethod
+    def renew_lease(self, job_id, worker_id, lease_seconds=DEFAULT_LEASE_SECONDS):
+        """Extend a lease; returns False if the worker no longer owns the job."""
+
+    @abc.abstractmethod
+    def finish(self, job_id, worker_id, error=None):
+        """Mark a claimed job as done or failed."""
+
+    @abc.abstractmethod
+    def get_job(self, job_id):
+        """Return a job as a dict, or None."""
+
+    @abc.abstractmethod
+    def publish(self, job_id, event_type, data):
+        """Append a progress event for a job."""
+
+    @abc.abstractmethod
+    def read_events(self, job_id, after_id=0, limit=500, event_type=None):
+        """Return events for a job with id greater than ``after_id``, optionally of one type."""
+
+    def read_events_many(self, cursors, limit=500):
+        """Return {job_id: events} for several jobs, each read after its own cursor."""
+        return {job_id: self.read_events(job_id, after_id, limit) for job_id, after_id in cursors.items()}
+
+    @abc.abstractmethod
+    def publish_upstreams(self, process, metrics):
+        """Store a worker process's latest upstream metrics."""
+
+    @abc.abstractmethod
+    def read_upstreams(self, max_age_seconds):
+        """Return {process: {"updated_at", "upstreams"}} for processes that published recently."""
+
+
+class SQLiteJobBroker(JobBroker):
+    """JobBroker backed by a single SQLite database in WAL mode."""
+
+    def __init__(self, db_path=None, max_claims=3):
+        self.db_path = db_path or get_default_queue_path()
+        self.max_claims = max_claims
+        self._lock = threading.Lock()
+        self._conn = connect(self.db_path)
+        self._conn.executescript(SCHEMA)
+
+    def enqueue(self, coin_name, max_retries):
+        job_id = str(uuid.uuid4())
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO jobs (id, coin_name, max_retries, status, created_at, updated_at) "
+                "VALUES (?, ?, ?, 'queued', ?, ?)",
+                (job_id, coin_name, max_retries, now, now)
+            )
+        return job_id
+
+    def claim(self, worker_id, lease_seconds=DEFAULT_LEASE_SECONDS):
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                # Jobs whose lease ran out belonged to a worker that died; give up on
+                # them after max_claims so a poison job cannot loop forever.
+                expired = self._conn.execute(
+                    "SELECT id FROM jobs WHERE status = 'running' AND lease_expires < ? AND claims >= ?",
+                    (now, self.max_claims)
+                ).fetchall()
+                for row in expired:
+                    self._mark_failed(row["id"], "Lease expired too many times", now)
+
+                row = self._conn.execute(
+                    "SELECT * FROM jobs WHERE status = 'queued' "
+                    "OR (status = 'running' AND lease_expires < ?) "
+                    "ORDER BY created_at LIMIT 1",
+                    (now,)
+                ).fetchone()
+                if row is None:
+                    self._conn.execute("COMMIT")
+                    return None
+
+                self._conn.execute(
+                    "UPDATE jobs SET status = 'running', worker_id = ?, lease_expires = ?, "
+                    "claims = claims + 1, updated_at = ? WHERE id = ?",
+                    (worker_id, now + lease_seconds, now, row["id"])
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+        job = dict(row)
+        job.update(status="running", worker_id=worker_id, claims=row["claims"] + 1)
+        return job
+
+    def renew_lease(self, job_id, worker_id, lease_seconds=DEFAULT_LEASE_SECONDS):
+        now = time.time()
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE jobs SET lease_expires = ?, updated_at = ? "
+                "WHERE id = ? AND worker_id = ? AND status = 'running'",
+                (now + lease_seconds, now, job_id, worker_id)
+            )
+        return cursor.rowcount == 1
+
+    def finish(self, job_id, worker_id, error=None):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, error = ?, lease_expires = NULL, updated_at = ? "
+                "WHERE id = ? AND worker_id = ?",
+                ("failed" if error else "done", error, now, job_id, worker_id)
+            )
+
+    def get_job(self, job_id):
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return dict(row) if row else None
+
+    def publish(self, job_id, event_type, data):
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO job_events (job_id, type, data, timestamp) VALUES (?, ?, ?, ?)",
+                (job_id, event_type, json.dumps(data), time.time())
+            )
+
+    def read_events(self, job_id, after_id=0, limit=500, event_type=None):
+        type_clause = "AND type = ? " if event_type else ""
+        params = (job_id, after_id, event_type, limit) if event_type else (job_id, after_id, limit)
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, type, data, timestamp FROM job_events "
+                f"WHERE job_id = ? AND id > ? {type_clause}ORDER BY id LIMIT ?",
+                params
+            ).fetchall()
+        return [
+            {"id": row["id"], "type": row["type"], "data": json.loads(row["data"]), "timestamp": row["timestamp"]}
+            for row in rows
+        ]
+
+    def read_events_many(self, cursors, limit=500):
+        if not cursors:
+            return {}
+        # One statement for every subscription; each branch is a range scan on (job_id, id)
+        branch = (
+            "SELECT * FROM (SELECT job_id, id, type, data, timestamp FROM job_events "
+            "WHERE job_id = ? AND id > ? ORDER BY id LIMIT ?)"
+        )
+        params = []
+        for job_id, after_id in cursors.items():
+            params += [job_id, after_id, limit]
+        with self._lock:
+            rows = self._conn.execute(" UNION ALL ".join([branch] * len(cursors)), params).fetchall()
+        events = {job_id: [] for job_id in cursors}
+        for row in rows:
+            events[row["job_id"]].append({
+                "id": row["id"], "type": row["type"], "data": json.loads(row["data"]), "timestamp": row["timestamp"]
+            })
+        return events
+
+    def publish_upstreams(self, process, metrics):
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO worker_upstreams (process, metrics, updated_at) VALUES (?, ?, ?) "
+                "ON CONFLICT (process) DO UPDATE SET metrics = excluded.metrics, updated_at = excluded.updated_at",
+                (process, json.dumps(metrics), time.time())
+            )
+
+    def read_upstreams(self, max_age_seconds):
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT process, metrics, updated_at FROM worker_upstreams WHERE updated_at >= ? ORDER BY process",
+                (time.time() - max_age_seconds,)
+            ).fetchall()
+        return {
+            row["process"]: {"updated_at": row["updated_at"], "upstreams": json.loads(row["metrics"])}
+            for row in rows
+        }
+
+    def _mark_failed(self, job_id, error, now):
+        self._conn.execute(
+            "UPDATE jobs SET status = 'failed', error = ?, lease_expires = NULL, updated_at = ? WHERE id = ?",
+            (error, now, job_id)
+        )
+        self._conn.execute(
+            "INSERT INTO job_events (job_id, type, data, timestamp) VALUES (?, 'error', ?, ?)",
+            (job_id, json.dumps({"message": error}), now)
+        )
+
+
+class JobEventCallback:
+    """Progress callback used by workers; publishes runner updates to the broker."""
+
+    def __init__(self, broker, job_id):
+        self.broker = broker
+        self.job_id = job_id
+        self.session_id = job_id
+
+    async def send_update(self, update_type, data):
+        """Publish an update for the SSE endpoints to pick up."""
+        await asyncio.to_thread(self.broker.publish, self.job_id, update_type, data)
@@ -0,0 +1,324 @@
+"""
+Compressed, indexed archive for agent session logs.
+
+A compactor moves finished session logs (logs/agent_log_*.jsonl untouched for
+LOG_ARCHIVE_MIN_AGE_SECONDS, default 900) into append-only segment files. Each session
+is compressed as its own gzip member, or zstd frame when the zstandard package is
+installed and LOG_ARCHIVE_CODEC=zstd, so one session can be read back by seeking to its
+offset without decompressing the rest of the segment. A sidecar SQLite index next to
+the segments maps each session to its segment, offset, length, coin and start time.
+
+A log is claimed by renaming it to *.archiving and touching it. A claimed file that has
+not been touched for LOG_ARCHIVE_STALE_CLAIM_SECONDS (default 3600) was left behind by a
+compactor that died, and the next pass archives it.
+
+Segments roll over at LOG_SEGMENT_BYTES (default 64 MB). Segments whose newest session
+is older than LOG_RETENTION_DAYS (default 30, 0 keeps everything) are deleted.
+
+Usage:
+    python log_archive.py --compact            # one compaction and retention pass
+    python log_archive.py --list --coin BTC
+    python log_archive.py --show agent_log_BTC_20250101_120000_000000.jsonl
+"""
+import argparse
+import asyncio
+import gzip
+import os
+import re
+import threading
+import time
+import zlib
+from datetime import datetime
+from pathlib import Path
+
+from storage import connect, get_data_dir
+
+try:
+    import zstandard
+except ImportError:  # zstandard is optional; gzip is always available
+    zstandard = None
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    name TEXT PRIMARY KEY,
+    coin TEXT,
+    started_at REAL,
+    segment TEXT NOT NULL,
+    offset INTEGER NOT NULL,
+    length INTEGER NOT NULL,
+    raw_length INTEGER NOT NULL,
+    codec TEXT NOT NULL,
+    archived_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_sessions_coin_started ON sessions (coin, started_at);
+CREATE INDEX IF NOT EXISTS idx_sessions_started ON sessions (started_at);
+CREATE INDEX IF NOT EXISTS idx_sessions_segment ON sessions (segment);
+"""
+
+LOG_NAME_PATTERN = re.compile(r"^agent_log_(?P<coin>.+)_(?P<stamp>\d{8}_\d{6})(?:_(?P<micros>\d{6}))?\.jsonl$")
+CLAIM_SUFFIX = ".archiving"
+SEGMENT_SUFFIXES = {"gzip": ".jsonl.gz", "zstd": ".jsonl.zst"}
+READ_CHUNK_BYTES = 64 * 1024
+
+
+def get_default_archive_dir():
+    """Return the archive directory (override with LOG_ARCHIVE_DIR)."""
+    archive_dir = Path(os.environ.get("LOG_ARCHIVE_DIR") or get_data_dir() / "log_archive")
+    archive_dir.mkdir(parents=True, exist_ok=True)
+    return archive_dir
+
+
+def get_default_logs_dir():
+    """The directory agent.py writes session logs to."""
+    return Path(os.environ.get("LOGS_DIR") or Path(__file__).parent / "logs")
+
+
+def parse_log_name(name):
+    """Return (coin, started_at) from a session log file name, or (None, None)."""
+    match = LOG_NAME_PATTERN.match(name)
+    if not match:
+        return None, None
+    started = datetime.strptime(match.group("stamp"), "%Y%m%d_%H%M%S")
+    started_at = started.timestamp() + int(match.group("micros") or 0) / 1e6
+    return match.group("coin").upper(), started_at
+
+
+def get_codec():
+    """Compression codec for new segments: zstd if requested and installed, else gzip."""
+    if os.environ.get("LOG_ARCHIVE_CODEC", "gzip") == "zstd" and zstandard is not None:
+        return "zstd"
+    return "gzip"
+
+
+def compress(data, codec):
+    if codec == "zstd":
+        return zstandard.ZstdCompressor(level=3).compress(data)
+    return gzip.compress(data, compresslevel=6)
+
+
+def make_decompressor(codec):
+    """Incremental decompressor with a decompress(chunk) method."""
+    if codec == "zstd":
+        if zstandard is None:
+            raise RuntimeError("zstandard is required to read zstd log segments")
+        return zstandard.ZstdDecompressor().decompressobj()
+    return zlib.decompressobj(wbits=31)
+
+
+class LogArchive:
+    """Segment files plus a SQLite index of the sessions stored in them."""
+
+    def __init__(self, archive_dir=None, segment_bytes=None, retention_days=None):
+        self.archive_dir = Path(archive_dir) if archive_dir else get_default_archive_dir()
+        self.archive_dir.mkdir(parents=True, exist_ok=True)
+        self.segment_bytes = segment_bytes or int(os.environ.get("LOG_SEGMENT_BYTES", 64 * 1024 * 1024))
+        self.retention_days = (
+            retention_days if retention_days is not None
+            else float(os.environ.get("LOG_RETENTION_DAYS", 30))
+        )
+        self._lock = threading.Lock()
+        self._conn = connect(self.archive_dir / "index.db")
+        self._conn.executescript(SCHEMA)
+        # Each process appends to its own segment, so compactors never share a file
+        self._segment = None
+
+    def _current_segment(self, codec):
+        if (self._segment is None or not self._segment.name.endswith(SEGMENT_SUFFIXES[codec])
+                or (self._segment.exists() and self._segment.stat().st_size >= self.segment_bytes)):
+            stamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+            self._segment = self.archive_dir / f"segment-{stamp}-{os.getpid()}{SEGMENT_SUFFIXES[codec]}"
+        return self._segment
+
+    def archive_file(self, path, name=None):
+        """Compress one session log into the current segment and index it."""
+        path = Path(path)
+        name = name or path.name
+        data = path.read_bytes()
+        codec = get_codec()
+        blob = compress(data, codec)
+        coin, started_at = parse_log_name(name)
+        with self._lock:
+            segment = self._current_segment(codec)
+            with open(segment, "ab") as f:
+                offset = f.tell()
+                f.write(blob)
+                f.flush()
+                os.fsync(f.fileno())
+            self._conn.execute(
+                "INSERT OR REPLACE INTO sessions (name, coin, started_at, segment, offset, length, "
+                "raw_length, codec, archived_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (name, coin, started_at or os.path.getmtime(path), segment.name, offset, len(blob),
+                 len(data), codec, time.time())
+            )
+        return {"name": name, "segment": segment.name, "offset": offset, "length": len(blob), "raw_length": len(data)}
+
+    def compact(self, logs_dir=None, min_age_seconds=None, stale_claim_seconds=None):
+        """Archive every session log untouched for min_age_seconds, then delete the original.
+
+        A log is claimed by renaming it first, so several compactors can run at once; a
+        claim untouched for stale_claim_seconds is taken over. Returns the archived sessions.
+        """
+        logs_dir = Path(logs_dir) if logs_dir else get_default_logs_dir()
+        if min_age_seconds is None:
+            min_age_seconds = float(os.environ.get("LOG_ARCHIVE_MIN_AGE_SECONDS", 900))
+        if stale_claim_seconds is None:
+            stale_claim_seconds = float(os.environ.get("LOG_ARCHIVE_STALE_CLAIM_SECONDS", 3600))
+        if not logs_dir.exists():
+            return []
+        now = time.time()
+        archived = []
+        candidates = sorted(logs_dir.glob("agent_log_*.jsonl")) + sorted(logs_dir.glob(f"agent_log_*.jsonl{CLAIM_SUFFIX}"))
+        for path in candidates:
+            try:
+                if path.name.endswith(CLAIM_SUFFIX):
+                    # Claims are touched when made, so only one whose compactor died gets this old
+                    if path.stat().st_mtime > now - stale_claim_seconds:
+                        continue
+                    claimed = path
+                else:
+                    if path.stat().st_mtime > now - min_age_seconds:
+                        continue
+                    claimed = path.with_name(path.name + CLAIM_SUFFIX)
+                    os.rename(path, claimed)
+                    # rename keeps the old mtime; without this the claim would look stale
+                    os.utime(claimed)
+                archived.append(self.archive_file(claimed, name=claimed.name[:-len(CLAIM_SUFFIX)]))
+                claimed.unlink()
+            except FileNotFoundError:
+                # Another compactor claimed or finished it first
+                continue
+        return archived
+
+    def apply_retention(self):
+        """Delete segments whose newest session is older than the retention period."""
+        if not self.retention_days:
+            return []
+        cutoff = time.time() - self.retention_days * 86400
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT segment FROM sessions GROUP BY segment HAVING MAX(started_at) < ?", (cutoff,)
+            ).fetchall()
+            removed = []
+            for row in rows:
+                if self._segment is not None and row["segment"] == self._segment.name:
+                    continue
+                self._conn.execute("DELETE FROM sessions WHERE segment = ?", (row["segment"],))
+                (self.archive_dir / row["segment"]).unlink(missing_ok=True)
+                removed.append(row["segment"])
+        return removed
+
+    def get_session(self, name):
+        """Index entry for an archived session, or None."""
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM sessions WHERE name = ?", (name,)).fetchone()
+        return dict(row) if row else None
+
+    def find_sessions(self, coin=None, since=None, until=None, limit=100):
+        """Archived sessions, newest first, filtered by coin and start time (unix seconds)."""
+        clauses, params = [], []
+        if coin:
+            clauses.append("coin = ?")
+            params.append(coin.upper())
+        if since is not None:
+            clauses.append("started_at >= ?")
+            params.append(since)
+        if until is not None:
+            clauses.append("started_at < ?")
+            params.append(until)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT * FROM sessions {where} ORDER BY started_at DESC LIMIT ?", (*params, limit)
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def iter_session_chunks(self, name):
+        """Stream one session's decompressed bytes, reading only its slice of the segment."""
+        entry = self.get_session(name)
+        if entry is None:
+            raise KeyError(f"Session {name} is not in the log archive")
+        decompressor = make_decompressor(entry["codec"])
+        with open(self.archive_dir / entry["segment"], "rb") as f:
+            f.seek(entry["offset"])
+            remaining = entry["length"]
+            while remaining > 0:
+                chunk = f.read(min(READ_CHUNK_BYTES, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                data = decompressor.decompress(chunk)
+                if data:
+                    yield data
+
+    def iter_session_lines(self, name):
+        """Stream one session's JSONL lines as str."""
+        buffer = b""
+        for chunk in self.iter_session_chunks(name):
+            buffer += chunk
+            *lines, buffer = buffer.split(b"\n")
+            for line in lines:
+                yield line.decode("utf-8")
+        if buffer:
+            yield buffer.decode("utf-8")
+
+    def read_session(self, name):
+        """The full text of one archived session log."""
+        return b"".join(self.iter_session_chunks(name)).decode("utf-8")
+
+
+_archive = None
+
+
+def get_log_archive():
+    """Return the process-wide LogArchive, opening it on first use."""
+    global _archive
+    if _archive is None:
+        _archive = LogArchive()
+    return _archive
+
+
+async def run_compactor(logs_dir=None, interval=None):
+    """Compact finished logs and apply retention every interval seconds (LOG_ARCHIVE_INTERVAL)."""
+    interval = interval if interval is not None else float(os.environ.get("LOG_ARCHIVE_INTERVAL", 300))
+    archive = get_log_archive()
+    while True:
+        try:
+            archived = await asyncio.to_thread(archive.compact, logs_dir)
+            removed = await asyncio.to_thread(archive.apply_retention)
+            if archived or removed:
+                print(f"Log archive: {len(archived)} sessions archived, {len(removed)} segments expired")
+        except Exception as e:
+            print(f"Error compacting logs: {e}")
+        await asyncio.sleep(interval)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compressed, indexed archive of agent session logs")
+    parser.add_argument("--compact", action="store_true", help="Archive finished logs and apply retention")
+    parser.add_argument("--min-age", type=float, default=None, help="Only archive logs untouched for this many seconds")
+    parser.add_argument("--list", action="store_true", help="List archived sessions")
+    parser.add_argument("--coin", default=None)
+    parser.add_argument("--limit", type=int, default=20)
+    parser.add_argument("--show", default=None, help="Print one archived session log")
+    args = parser.parse_args()
+
+    archive = get_log_archive()
+    if args.compact:
+        archived = archive.compact(min_age_seconds=args.min_age)
+        removed = archive.apply_retention()
+        raw = sum(entry["raw_length"] for entry in archived)
+        stored = sum(entry["length"] for entry in archived)
+        print(f"Archived {len(archived)} sessions ({raw} -> {stored} bytes), expired {len(removed)} segments")
+    if args.list:
+        for entry in archive.find_sessions(coin=args.coin, limit=args.limit):
+            started = datetime.fromtimestamp(entry["started_at"]).isoformat(timespec="seconds")
+            print(f"{started}  {entry['coin'] or '-':<6} {entry['name']}  "
+                  f"{entry['raw_length']} -> {entry['length']} bytes in {entry['segment']}")
+    if args.show:
+        for line in archive.iter_session_lines(args.show):
+            print(line)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+"""
+Paged reads of session logs by byte offset.
+
+read_log_page() returns up to `limit` entries of one session log starting at a byte
+offset, plus the offset to continue from. Live logs are read with seek(); compacted ones
+are streamed out of the log archive (offsets are into the decompressed log), so neither
+is loaded whole. With a type filter, other lines are skipped by matching the entry's
+type field near the start of the line instead of parsing it, and one call scans at most
+LOG_PAGE_SCAN_BYTES (default 8 MB): a rare type on a large log yields a short page with
+next_offset moved forward rather than a request that reads the whole file.
+"""
+import json
+import os
+import re
+
+from log_archive import CLAIM_SUFFIX, LOG_NAME_PATTERN, get_default_logs_dir, get_log_archive
+
+
+# Entries are written as {"timestamp": ..., "type": ..., "data": ...}, so the first type
+# key on the line is the entry's
+TYPE_PATTERN = re.compile(rb'"type":\s*"([^"]*)"')
+TYPE_SEARCH_BYTES = 256
+
+
+def max_scan_bytes():
+    return int(os.environ.get("LOG_PAGE_SCAN_BYTES", 8 * 1024 * 1024))
+
+
+def entry_type(line):
+    match = TYPE_PATTERN.search(line, 0, TYPE_SEARCH_BYTES)
+    return match.group(1).decode("utf-8") if match else None
+
+
+def iter_file_lines(path, offset):
+    """(offset, line) for each complete line of a live log from offset on."""
+    with open(path, "rb") as f:
+        if offset > 0:
+            # An offset inside a line moves on to the next one
+            f.seek(offset - 1)
+            if f.read(1) != b"\n":
+                f.readline()
+        position = f.tell()
+        for line in iter(f.readline, b""):
+            if not line.endswith(b"\n"):
+                # The agent is still writing this line
+                return
+            yield position, line
+            position += len(line)
+
+
+def iter_archived_lines(name, offset):
+    """(offset, line) for each line of an archived log starting at or after offset."""
+    position = 0
+    buffer = b""
+    for chunk in get_log_archive().iter_session_chunks(name):
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            line += b"\n"
+            if position >= offset:
+                yield position, line
+            position += len(line)
+    if buffer and position >= offset:
+        yield position, buffer
+
+
+def locate_log(name):
+    """("file", path), ("archive", name) or (None, None) for a session log name."""
+    if not LOG_NAME_PATTERN.match(name):
+        return None, None
+    path = get_default_logs_dir() / name
+    if path.exists():
+        return "file", path
+    # The compactor may be moving it right now
+    claimed = path.with_name(name + CLAIM_SUFFIX)
+    if claimed.exists():
+        return "file", claimed
+    if get_log_archive().get_session(name) is not None:
+        return "archive", name
+    return None, None
+
+
+def read_log_page(name, offset=0, limit=200, types=None, scan_bytes=None):
+    """One page of a session log's entries; raises KeyError for an unknown log.
+
+    Returns {"entries": [{"offset", "timestamp", "type", "data"}], "next_offset",
+    "eof", "size", "archived"}. eof means the end of what has been written so far.
+    """
+    try:
+        return _read_page(name, offset, limit, types, scan_bytes)
+    except FileNotFoundError:
+        # Archived between locating and opening it; the archive has it now
+        return _read_page(name, offset, limit, types, scan_bytes)
+
+
+def _read_page(name, offset, limit, types, scan_bytes):
+    source, location = locate_log(name)
+    if source is None:
+        raise KeyError(f"Unknown session log {name}")
+    if source == "file":
+        lines = iter_file_lines(location, offset)
+        size = location.stat().st_size
+    else:
+        lines = iter_archived_lines(location, offset)
+        size = get_log_archive().get_session(location)["raw_length"]
+    scan_bytes = max_scan_bytes() if scan_bytes is None else scan_bytes
+    types = set(types) if types else None
+
+    entries = []
+    next_offset = offset
+    scanned = 0
+    eof = True
+    for line_offset, line in lines:
+        if len(entries) >= limit or scanned >= scan_bytes:
+            eof = False
+            break
+        scanned += len(line)
+        next_offset = line_offset + len(line)
+        if types is not None and entry_type(line) not in types:
+            continue
+        try:
+            entry = json.loads(line)
+        except ValueError:
+            continue
+        entries.append({"offset": line_offset, **entry})
+    return {"entries": entries, "next_offset": next_offset, "eof": eof, "size": size,
+            "archived": source == "archive"}
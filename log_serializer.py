@@ -0,0 +1,103 @@
+"""
+Size-capped serializer for session log entries.
+
+Values are converted to JSON-safe data in a single walk: SDK messages and content
+blocks (dataclasses) become dicts tagged with their type, and strings longer than
+LOG_MAX_FIELD_CHARS (default 8000) or lists longer than LOG_MAX_LIST_ITEMS (default 200)
+are cut down to a head plus the original length and a content hash, so one large tool
+output cannot blow up a log. orjson is used when installed, json otherwise.
+"""
+import dataclasses
+import hashlib
+import json
+import os
+
+try:
+    import orjson
+except ImportError:  # orjson is optional; the standard library is the fallback
+    orjson = None
+
+
+DEFAULT_MAX_FIELD_CHARS = 8000
+DEFAULT_MAX_LIST_ITEMS = 200
+SCALAR_TYPES = (type(None), bool, int, float)
+
+
+def get_caps():
+    """Field and list caps from the environment."""
+    return (
+        int(os.environ.get("LOG_MAX_FIELD_CHARS", DEFAULT_MAX_FIELD_CHARS)),
+        int(os.environ.get("LOG_MAX_LIST_ITEMS", DEFAULT_MAX_LIST_ITEMS)),
+    )
+
+
+def content_hash(data):
+    """Short sha256 of a str or bytes value."""
+    if isinstance(data, str):
+        data = data.encode("utf-8", "surrogatepass")
+    return hashlib.sha256(data).hexdigest()[:16]
+
+
+def truncate_text(text, max_chars):
+    """Replace an oversized string with its head, original length and hash."""
+    return {
+        "_truncated": True,
+        "head": text[:max_chars],
+        "length": len(text),
+        "sha256": content_hash(text),
+    }
+
+
+def to_loggable(value, max_chars=None, max_items=None):
+    """Convert a value to capped, JSON-safe data in one pass."""
+    if max_chars is None or max_items is None:
+        default_chars, default_items = get_caps()
+        max_chars = default_chars if max_chars is None else max_chars
+        max_items = default_items if max_items is None else max_items
+    return _walk(value, max_chars, max_items)
+
+
+def _walk(value, max_chars, max_items):
+    # Exact type checks first: they cover almost every value and are the cheapest test
+    value_type = type(value)
+    if value_type is str:
+        return value if len(value) <= max_chars else truncate_text(value, max_chars)
+    if value_type in SCALAR_TYPES:
+        return value
+    if isinstance(value, str):
+        return value if len(value) <= max_chars else truncate_text(value, max_chars)
+    if isinstance(value, SCALAR_TYPES):
+        return value
+    if isinstance(value, dict):
+        return {str(key): _walk(item, max_chars, max_items) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        items = [_walk(item, max_chars, max_items) for item in value[:max_items]]
+        if len(value) > max_items:
+            items.append({"_truncated": True, "length": len(value), "omitted": len(value) - max_items})
+        return items
+    if isinstance(value, (bytes, bytearray)):
+        return {"_bytes": True, "length": len(value), "sha256": content_hash(bytes(value))}
+    if dataclasses.is_dataclass(value) and not isinstance(value, type):
+        data = {
+            field.name: _walk(getattr(value, field.name), max_chars, max_items)
+            for field in dataclasses.fields(value)
+        }
+        data["_message_type"] = type(value).__name__
+        return data
+    if hasattr(value, "__dict__"):
+        data = {key: _walk(item, max_chars, max_items) for key, item in vars(value).items()}
+        data["_message_type"] = type(value).__name__
+        return data
+    return _walk(str(value), max_chars, max_items)
+
+
+def dumps(data):
+    """Serialize JSON-safe data to a str with the fastest available backend."""
+    if orjson is not None:
+        return orjson.dumps(data, option=orjson.OPT_NON_STR_KEYS, default=str).decode("utf-8")
+    return json.dumps(data, ensure_ascii=False, default=str)
+
+
+def encode_log_entry(timestamp, message_type, data):
+    """One JSONL log line (without the newline) for a log entry."""
+    return dumps({"timestamp": timestamp, "type": message_type, "data": to_loggable(data)})
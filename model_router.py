@@ -0,0 +1,303 @@
+"""
+Per-stage model routing from observed latency, cost and win rate.
+
+Three stages call a model: research (the agent session), extraction (the structured
+BUY/SELL decision) and rewrite (the prompt rewrite after a loss). Every call is recorded
+with its latency and cost; research and extraction calls also get the outcome of the
+trade they led to, and a rewrite counts as a success if it returned a prompt.
+
+Each stage has candidates in MODEL_ROUTER_<STAGE>_MODELS (comma separated; the first is
+the stage's default). To choose, the router looks at each candidate's last
+MODEL_ROUTER_WINDOW calls (default 50):
+
+1. candidates whose p90 latency does not fit the time the stage has left are dropped
+   (if none fit, the fastest is kept);
+2. candidates with fewer than MODEL_ROUTER_MIN_SAMPLES calls (default 10) are tried with
+   probability MODEL_ROUTER_EXPLORE (default 0.1), so they get measured;
+3. the rest are scored win rate - MODEL_ROUTER_COST_WEIGHT x mean cost in USD (default
+   1.0) - MODEL_ROUTER_LATENCY_WEIGHT x median latency in seconds (default 0.005).
+
+MODEL_ROUTER selects the mode: "shadow" (default) runs every stage on its default model
+and records what the router would have picked, "on" runs the router's pick, and "off"
+only uses the defaults. Shadow mode never changes the model that runs unless
+MODEL_ROUTER_SHADOW_EXPLORE (default 0) is set: with it above 0, shadow mode also runs an
+unmeasured candidate with that probability until it has MODEL_ROUTER_MIN_SAMPLES calls,
+which an operator opts into to measure the alternatives. Otherwise the shadow pick only
+differs from the default once "on"-mode sessions (or sessions with the alternative listed
+first) have measured the other candidates. Replayed sessions always use the defaults,
+since the cassette is keyed by model. `python model_router.py` and GET /api/models
+summarize each model per stage and how often the shadow pick differed from the model
+that ran.
+"""
+import argparse
+import os
+import random
+import threading
+import time
+
+from cassette import is_replaying
+from stats import percentile
+from storage import connect, get_data_dir
+
+
+STAGES = ("research", "extraction", "rewrite")
+DEFAULT_CANDIDATES = {
+    "research": ("claude-haiku-4-5", "claude-sonnet-4-5"),
+    "extraction": ("claude-sonnet-4-5", "claude-haiku-4-5"),
+    "rewrite": ("claude-sonnet-4-5", "claude-haiku-4-5"),
+}
+MODES = ("off", "shadow", "on")
+
+# USD per million input / output tokens, for stages that only report token counts
+MODEL_PRICES = {
+    "claude-haiku-4-5": (1.0, 5.0),
+    "claude-sonnet-4-5": (3.0, 15.0),
+    "claude-opus-4-5": (5.0, 25.0),
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS model_calls (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    stage TEXT NOT NULL,
+    model TEXT NOT NULL,
+    routed_model TEXT,
+    mode TEXT NOT NULL,
+    latency_ms REAL,
+    cost_usd REAL,
+    success INTEGER,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_model_calls_stage_model ON model_calls (stage, model, id);
+CREATE INDEX IF NOT EXISTS idx_model_calls_created ON model_calls (created_at);
+"""
+
+
+def get_default_router_path():
+    """Return the model call database path (override with MODEL_ROUTER_DB)."""
+    return os.environ.get("MODEL_ROUTER_DB") or str(get_data_dir() / "models.db")
+
+
+def routing_mode():
+    if is_replaying():
+        return "off"
+    mode = os.environ.get("MODEL_ROUTER", "shadow")
+    return mode if mode in MODES else "shadow"
+
+
+def stage_candidates(stage):
+    """Candidate models for a stage, default first."""
+    configured = os.environ.get(f"MODEL_ROUTER_{stage.upper()}_MODELS")
+    if configured:
+        models = tuple(model.strip() for model in configured.split(",") if model.strip())
+        if models:
+            return models
+    return DEFAULT_CANDIDATES[stage]
+
+
+def default_model(stage):
+    return stage_candidates(stage)[0]
+
+
+def token_cost(model, input_tokens, output_tokens):
+    """USD cost of a call from its token counts, or None for a model without a price."""
+    prices = MODEL_PRICES.get(model)
+    if prices is None or input_tokens is None or output_tokens is None:
+        return None
+    return (input_tokens * prices[0] + output_tokens * prices[1]) / 1_000_000
+
+
+class ModelRouter:
+    """SQLite record of model calls per stage, and the policy that picks a stage's model."""
+
+    def __init__(self, db_path=None):
+        self.db_path = db_path or get_default_router_path()
+        self.window = int(os.environ.get("MODEL_ROUTER_WINDOW", 50))
+        self.min_samples = int(os.environ.get("MODEL_ROUTER_MIN_SAMPLES", 10))
+        self.explore = float(os.environ.get("MODEL_ROUTER_EXPLORE", 0.1))
+        self.shadow_explore = float(os.environ.get("MODEL_ROUTER_SHADOW_EXPLORE", 0))
+        self.cost_weight = float(os.environ.get("MODEL_ROUTER_COST_WEIGHT", 1.0))
+        self.latency_weight = float(os.environ.get("MODEL_ROUTER_LATENCY_WEIGHT", 0.005))
+        self._lock = threading.Lock()
+        self._conn = connect(self.db_path)
+        self._conn.executescript(SCHEMA)
+
+    def record_call(self, stage, model, mode, latency_ms, cost_usd=None, routed_model=None, success=None):
+        """Record one model call; returns its id for record_outcome."""
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT INTO model_calls (stage, model, routed_model, mode, latency_ms, cost_usd, "
+                "success, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (stage, model, routed_model, mode, latency_ms, cost_usd,
+                 None if success is None else int(bool(success)), time.time())
+            )
+        return cursor.lastrowid
+
+    def record_outcome(self, call_ids, success):
+        """Attach a trade outcome to the calls that led to it."""
+        if not call_ids:
+            return
+        placeholders = ", ".join("?" for _ in call_ids)
+        with self._lock:
+            self._conn.execute(
+                f"UPDATE model_calls SET success = ? WHERE id IN ({placeholders})",
+                (int(bool(success)), *call_ids)
+            )
+
+    def model_stats(self, stage, model, window=None):
+        """Latency, cost and win rate of a model's last `window` calls for a stage."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT latency_ms, cost_usd, success FROM model_calls "
+                "WHERE stage = ? AND model = ? ORDER BY id DESC LIMIT ?",
+                (stage, model, window or self.window)
+            ).fetchall()
+        latencies = sorted(row["latency_ms"] for row in rows if row["latency_ms"] is not None)
+        costs = [row["cost_usd"] for row in rows if row["cost_usd"] is not None]
+        outcomes = [row["success"] for row in rows if row["success"] is not None]
+        return {
+            "calls": len(rows),
+            "p50_ms": percentile(latencies, 0.5),
+            "p90_ms": percentile(latencies, 0.9),
+            "mean_cost_usd": sum(costs) / len(costs) if costs else None,
+            "outcomes": len(outcomes),
+            "win_rate": sum(outcomes) / len(outcomes) if outcomes else None,
+        }
+
+    def score(self, stats):
+        # Without outcomes yet, a model is neither credited nor penalized for quality
+        win_rate = stats["win_rate"] if stats["win_rate"] is not None else 0.5
+        return (
+            win_rate
+            - self.cost_weight * (stats["mean_cost_usd"] or 0.0)
+            - self.latency_weight * (stats["p50_ms"] or 0.0) / 1000
+        )
+
+    def pick(self, stage, time_budget=None, explore=None):
+        """(model, reason, stats per candidate) under the routing policy.
+
+        explore is the probability of trying an unmeasured candidate (default
+        MODEL_ROUTER_EXPLORE).
+        """
+        explore = self.explore if explore is None else explore
+        candidates = stage_candidates(stage)
+        stats = {model: self.model_stats(stage, model) for model in candidates}
+        measured = [model for model in candidates if stats[model]["calls"] >= self.min_samples]
+        unmeasured = [model for model in candidates if model not in measured]
+
+        if unmeasured and random.random() < explore:
+            return random.choice(unmeasured), "explore", stats
+        if not measured:
+            return candidates[0], "insufficient data", stats
+        if time_budget is not None:
+            fitting = [model for model in measured if (stats[model]["p90_ms"] or 0.0) <= time_budget * 1000]
+            if not fitting:
+                fastest = min(measured, key=lambda model: stats[model]["p90_ms"] or 0.0)
+                return fastest, "fastest, none fit the time budget", stats
+            measured = fitting
+        best = max(measured, key=lambda model: self.score(stats[model]))
+        return best, "best score", stats
+
+    def choose(self, stage, time_budget=None):
+        """The model a stage runs on now, plus what the router picked and why.
+
+        In shadow mode `model` is the default and `routed_model` the router's pick; with
+        routing on they are the same. A shadow call that explores runs the unmeasured
+        candidate for real, so it too has `model` equal to `routed_model` and is not
+        counted as a disagreement.
+        """
+        mode = routing_mode()
+        route = {"stage": stage, "mode": mode, "model": default_model(stage), "routed_model": None,
+                 "reason": "routing off", "time_budget": time_budget}
+        if mode == "off":
+            return route
+        routed_model, reason, stats = self.pick(
+            stage, time_budget, explore=self.explore if mode == "on" else self.shadow_explore
+        )
+        route.update(routed_model=routed_model, reason=reason, candidates=stats)
+        if mode == "on" or reason == "explore":
+            route["model"] = routed_model
+        return route
+
+    def summary(self, since=None):
+        """Per stage and model: calls, latency, cost and win rate since a time, plus shadow disagreements."""
+        since = since if since is not None else 0.0
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT stage, model, COUNT(*) AS calls, AVG(latency_ms) AS mean_latency_ms, "
+                "AVG(cost_usd) AS mean_cost_usd, COUNT(success) AS outcomes, SUM(success) AS wins, "
+                "SUM(mode = 'shadow' AND routed_model IS NOT NULL AND routed_model != model) "
+                "AS shadow_disagreements, SUM(mode = 'shadow') AS shadow_calls "
+                "FROM model_calls WHERE created_at >= ? GROUP BY stage, model ORDER BY stage, model",
+                (since,)
+            ).fetchall()
+            suggested = self._conn.execute(
+                "SELECT stage, model, routed_model, COUNT(*) AS calls FROM model_calls "
+                "WHERE created_at >= ? AND mode = 'shadow' AND routed_model != model "
+                "GROUP BY stage, model, routed_model",
+                (since,)
+            ).fetchall()
+        results = []
+        for row in rows:
+            row = dict(row)
+            wins = row.pop("wins") or 0
+            row["win_rate"] = wins / row["outcomes"] if row["outcomes"] else None
+            row["shadow_picks"] = {
+                pick["routed_model"]: pick["calls"] for pick in suggested
+                if pick["stage"] == row["stage"] and pick["model"] == row["model"]
+            }
+            results.append(row)
+        return results
+
+
+_router = None
+
+
+def get_model_router():
+    """Return the process-wide ModelRouter, opening it on first use."""
+    global _router
+    if _router is None:
+        _router = ModelRouter()
+    return _router
+
+
+def route_model(stage, time_budget=None):
+    """A stage's route; falls back to the default model if the router's store fails."""
+    try:
+        return get_model_router().choose(stage, time_budget)
+    except Exception as e:
+        print(f"Error routing {stage} model: {e}")
+        return {"stage": stage, "mode": "off", "model": default_model(stage), "routed_model": None,
+                "reason": f"router error: {e}", "time_budget": time_budget}
+
+
+def record_model_call(route, latency_ms, cost_usd=None, success=None):
+    """Record a call made on a route; returns its id, or None if it could not be recorded."""
+    try:
+        return get_model_router().record_call(
+            route["stage"], route["model"], route["mode"], latency_ms, cost_usd, route["routed_model"], success
+        )
+    except Exception as e:
+        print(f"Error recording {route['stage']} model call: {e}")
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Observed latency, cost and win rate per model and stage")
+    parser.add_argument("--days", type=float, default=7, help="Only count calls from the last N days")
+    args = parser.parse_args()
+
+    router = get_model_router()
+    print(f"Routing mode: {routing_mode()}")
+    print(f"{'stage':<11} {'model':<20} {'calls':>6} {'mean ms':>9} {'mean $':>8} {'win rate':>9} {'shadow differs':>15}")
+    for row in router.summary(time.time() - args.days * 86400):
+        win_rate = f"{row['win_rate']:.0%}" if row["win_rate"] is not None else "-"
+        mean_cost = f"{row['mean_cost_usd']:.4f}" if row["mean_cost_usd"] is not None else "-"
+        mean_ms = f"{row['mean_latency_ms']:.0f}" if row["mean_latency_ms"] is not None else "-"
+        differs = f"{row['shadow_disagreements'] or 0}/{row['shadow_calls'] or 0}"
+        print(f"{row['stage']:<11} {row['model']:<20} {row['calls']:>6} {mean_ms:>9} {mean_cost:>8} {win_rate:>9} {differs:>15}")
+        for picked, calls in row["shadow_picks"].items():
+            print(f"{'':<32} shadow would have run {picked}: {calls} calls")
+
+
+if __name__ == "__main__":
+    main()
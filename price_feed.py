@@ -0,0 +1,109 @@
+"""
+Shared price tick feed for evaluation windows.
+
+One PriceFeed per coin polls CoinGecko every EVAL_TICK_SECONDS (default 5) for as long
+as at least one evaluation is watching it, and stores ticks in a fixed-size ring buffer
+backed by two array('d') columns. Concurrent evaluations of the same coin (several
+workers in one process, population variants) share the same requests and ticks.
+"""
+import asyncio
+import os
+import time
+from array import array
+from contextlib import asynccontextmanager
+
+
+class TickRing:
+    """Fixed-capacity ring of (timestamp, price) ticks in two double arrays."""
+
+    def __init__(self, capacity=1024):
+        self.capacity = capacity
+        self.times = array("d", bytes(8 * capacity))
+        self.prices = array("d", bytes(8 * capacity))
+        self.start = 0
+        self.count = 0
+
+    def __len__(self):
+        return self.count
+
+    def append(self, timestamp, price):
+        index = (self.start + self.count) % self.capacity
+        self.times[index] = timestamp
+        self.prices[index] = price
+        if self.count < self.capacity:
+            self.count += 1
+        else:
+            # Full: the new tick overwrote the oldest one
+            self.start = (self.start + 1) % self.capacity
+
+    def since(self, timestamp):
+        """Ticks with a timestamp after the given one, oldest first."""
+        ticks = []
+        for offset in range(self.count):
+            index = (self.start + offset) % self.capacity
+            if self.times[index] > timestamp:
+                ticks.append((self.times[index], self.prices[index]))
+        return ticks
+
+
+class PriceFeed:
+    """Polls one coin's price while watched and notifies waiters of each new tick."""
+
+    def __init__(self, coin_name, fetch, interval=None, capacity=1024):
+        self.coin_name = coin_name
+        self.fetch = fetch
+        self.interval = interval if interval is not None else float(os.environ.get("EVAL_TICK_SECONDS", 5))
+        self.ring = TickRing(capacity)
+        self._watchers = 0
+        self._task = None
+        self._tick = asyncio.Condition()
+
+    async def _poll(self):
+        while True:
+            price = await self.fetch(self.coin_name)
+            if price is not None:
+                async with self._tick:
+                    self.ring.append(time.time(), price)
+                    self._tick.notify_all()
+            await asyncio.sleep(self.interval)
+
+    @asynccontextmanager
+    async def watch(self):
+        """Keep the feed polling for the duration of the block."""
+        self._watchers += 1
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._poll())
+        try:
+            yield self
+        finally:
+            self._watchers -= 1
+            if self._watchers == 0 and self._task is not None:
+                self._task.cancel()
+                self._task = None
+
+    async def wait_for_tick(self, after, timeout):
+        """Wait up to timeout seconds for ticks newer than after; returns them (maybe empty)."""
+        async with self._tick:
+            try:
+                await asyncio.wait_for(
+                    self._tick.wait_for(lambda: bool(self.ring.since(after))), timeout
+                )
+            except asyncio.TimeoutError:
+                pass
+            return self.ring.since(after)
+
+
+_feeds = {}  # event loop -> {coin: PriceFeed}
+
+
+def get_price_feed(coin_name, fetch):
+    """Return the feed for a coin on the running event loop, creating it on first use."""
+    # Feeds hold loop-bound primitives, so each event loop gets its own. Those primitives
+    # reference the loop, so a weak key would never be released: closed loops are pruned.
+    for loop in [loop for loop in _feeds if loop.is_closed()]:
+        del _feeds[loop]
+    feeds = _feeds.setdefault(asyncio.get_running_loop(), {})
+    key = coin_name.upper()
+    if key not in feeds:
+        feeds[key] = PriceFeed(coin_name, fetch)
+    return feeds[key]
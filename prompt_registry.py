@@ -0,0 +1,290 @@
+"""
+Content-addressed prompt registry.
+
+Every system prompt the runner uses is stored under its content hash together with its
+lineage (parent prompt and rewrite reason). Outcomes are folded into running per-coin
+statistics (trials, wins, PnL), and the best prompt for a coin is kept in a one-row-per-coin
+table so looking it up at run start is a single primary-key read. A prompt is only
+promoted once it has enough trials and its Wilson lower bound on win rate beats the
+current best, so one lucky trade no longer replaces the strategy. Rewrites that have not
+reached that many trials yet are handed out by trial_candidate(), so they keep collecting
+trades across runs instead of being forgotten after the run that created them. They are
+kept in a small per-coin candidates table, capped at PROMPT_MAX_CANDIDATES (default 8) by
+dropping the worst-scoring (then oldest) one, and leave it once they have enough trials,
+so picking one reads a handful of rows however many prompts a coin has accumulated.
+"""
+import os
+import threading
+import time
+
+from run_store import prompt_hash
+from stats import wilson_interval, mean_confidence_interval
+from storage import connect, get_data_dir
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS prompts (
+    hash TEXT PRIMARY KEY,
+    content TEXT NOT NULL,
+    parent_hash TEXT,
+    reason TEXT,
+    coin TEXT,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_prompts_parent ON prompts (parent_hash);
+CREATE TABLE IF NOT EXISTS prompt_stats (
+    coin TEXT NOT NULL,
+    hash TEXT NOT NULL,
+    trials INTEGER NOT NULL DEFAULT 0,
+    wins INTEGER NOT NULL DEFAULT 0,
+    profit_sum REAL NOT NULL DEFAULT 0,
+    profit_sq_sum REAL NOT NULL DEFAULT 0,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (coin, hash)
+);
+CREATE TABLE IF NOT EXISTS prompt_candidates (
+    coin TEXT NOT NULL,
+    hash TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    PRIMARY KEY (coin, hash)
+);
+CREATE TABLE IF NOT EXISTS best_prompts (
+    coin TEXT PRIMARY KEY,
+    hash TEXT NOT NULL,
+    score REAL NOT NULL,
+    promoted_at REAL NOT NULL
+);
+"""
+
+
+def get_default_registry_path():
+    """Return the prompt registry database path (override with PROMPT_REGISTRY_DB)."""
+    return os.environ.get("PROMPT_REGISTRY_DB") or str(get_data_dir() / "prompts.db")
+
+
+def score_stats(trials, wins):
+    """Promotion score of a prompt: lower bound of the Wilson interval on its win rate."""
+    return wilson_interval(wins, trials)[0]
+
+
+class PromptRegistry:
+    """SQLite-backed registry of prompts, their lineage and per-coin performance."""
+
+    def __init__(self, db_path=None, min_trials=None, max_candidates=None):
+        self.db_path = db_path or get_default_registry_path()
+        self.min_trials = min_trials if min_trials is not None else int(os.environ.get("PROMPT_MIN_TRIALS", 5))
+        self.max_candidates = (max_candidates if max_candidates is not None
+                               else int(os.environ.get("PROMPT_MAX_CANDIDATES", 8)))
+        self._lock = threading.Lock()
+        self._conn = connect(self.db_path)
+        had_candidates = self._conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'prompt_candidates'"
+        ).fetchone()
+        self._conn.executescript(SCHEMA)
+        if not had_candidates:
+            self._backfill_candidates()
+
+    def _backfill_candidates(self):
+        """Fill the candidates table once from the prompts of a registry that predates it."""
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR IGNORE INTO prompt_candidates (coin, hash, created_at) "
+                "SELECT p.coin, p.hash, p.created_at FROM prompts p "
+                "LEFT JOIN prompt_stats s ON s.coin = p.coin AND s.hash = p.hash "
+                "WHERE p.coin IS NOT NULL AND COALESCE(s.trials, 0) < ? "
+                "AND p.hash NOT IN (SELECT hash FROM best_prompts WHERE coin = p.coin)",
+                (self.min_trials,)
+            )
+            coins = [row["coin"] for row in self._conn.execute("SELECT DISTINCT coin FROM prompt_candidates")]
+            for coin in coins:
+                self._trim_candidates(coin)
+
+    def register(self, content, parent_hash=None, reason=None, coin=None):
+        """Store a prompt (idempotent) and return its content hash."""
+        content_hash = prompt_hash(content)
+        coin = coin.upper() if coin else None
+        now = time.time()
+        with self._lock:
+            inserted = self._conn.execute(
+                "INSERT OR IGNORE INTO prompts (hash, content, parent_hash, reason, coin, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (content_hash, content, parent_hash, reason, coin, now)
+            ).rowcount
+            if inserted and coin:
+                self._conn.execute(
+                    "INSERT OR IGNORE INTO prompt_candidates (coin, hash, created_at) VALUES (?, ?, ?)",
+                    (coin, content_hash, now)
+                )
+                self._trim_candidates(coin)
+        return content_hash
+
+    def get(self, content_hash):
+        """Return a prompt row as a dict, or None."""
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM prompts WHERE hash = ?", (content_hash,)).fetchone()
+        return dict(row) if row else None
+
+    def lineage(self, content_hash):
+        """Return the chain of prompts from this one back to its root."""
+        chain = []
+        seen = set()
+        while content_hash and content_hash not in seen:
+            seen.add(content_hash)
+            row = self.get(content_hash)
+            if row is None:
+                break
+            chain.append(row)
+            content_hash = row["parent_hash"]
+        return chain
+
+    def best_prompt(self, coin):
+        """Return the promoted prompt text for a coin, or None."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT p.content FROM best_prompts b JOIN prompts p ON p.hash = b.hash WHERE b.coin = ?",
+                (coin.upper(),)
+            ).fetchone()
+        return row["content"] if row else None
+
+    def trial_candidate(self, coin):
+        """Return the best-scoring prompt for a coin that still needs trials to qualify, or None.
+
+        The promoted prompt is never a candidate; ties go to the prompt closest to
+        qualifying, then to the newest.
+        """
+        with self._lock:
+            rows = [row for row in self._candidate_rows(coin.upper()) if row["trials"] < self.min_trials]
+        if not rows:
+            return None
+        best = max(rows, key=lambda row: (score_stats(row["trials"], row["wins"]), row["trials"], row["created_at"]))
+        return best["content"]
+
+    def _candidate_rows(self, coin):
+        # At most max_candidates rows, each joined on a primary key
+        return self._conn.execute(
+            "SELECT c.hash, c.created_at, p.content, COALESCE(s.trials, 0) AS trials, COALESCE(s.wins, 0) AS wins "
+            "FROM prompt_candidates c JOIN prompts p ON p.hash = c.hash "
+            "LEFT JOIN prompt_stats s ON s.coin = c.coin AND s.hash = c.hash "
+            "WHERE c.coin = ? AND c.hash NOT IN (SELECT hash FROM best_prompts WHERE coin = ?)",
+            (coin, coin)
+        ).fetchall()
+
+    def _trim_candidates(self, coin):
+        rows = self._candidate_rows(coin)
+        excess = len(rows) - self.max_candidates
+        if excess <= 0:
+            return
+        rows.sort(key=lambda row: (score_stats(row["trials"], row["wins"]), row["created_at"]))
+        self._conn.executemany(
+            "DELETE FROM prompt_candidates WHERE coin = ? AND hash = ?",
+            [(coin, row["hash"]) for row in rows[:excess]]
+        )
+
+    def stats(self, coin, content_hash):
+        """Return the running statistics of one prompt for one coin."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT * FROM prompt_stats WHERE coin = ? AND hash = ?", (coin.upper(), content_hash)
+            ).fetchone()
+        if row is None:
+            return {"coin": coin.upper(), "hash": content_hash, "trials": 0, "wins": 0,
+                    "win_rate": None, "mean_profit": None, "score": 0.0}
+        return self._describe(row)
+
+    def top_prompts(self, coin, limit=5):
+        """Return the best-scoring prompts for a coin, best first."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT s.*, p.content FROM prompt_stats s JOIN prompts p ON p.hash = s.hash "
+                "WHERE s.coin = ? AND s.trials > 0",
+                (coin.upper(),)
+            ).fetchall()
+        described = [dict(self._describe(row), content=row["content"]) for row in rows]
+        described.sort(key=lambda item: (item["score"], item["mean_profit"] or 0.0), reverse=True)
+        return described[:limit]
+
+    def record_outcome(self, coin, content_hash, success, profit):
+        """Fold one evaluated trade into a prompt's stats; returns True if it was promoted."""
+        coin = coin.upper()
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.execute(
+                    "INSERT INTO prompt_stats (coin, hash, trials, wins, profit_sum, profit_sq_sum, updated_at) "
+                    "VALUES (?, ?, 1, ?, ?, ?, ?) "
+                    "ON CONFLICT (coin, hash) DO UPDATE SET trials = trials + 1, "
+                    "wins = wins + excluded.wins, profit_sum = profit_sum + excluded.profit_sum, "
+                    "profit_sq_sum = profit_sq_sum + excluded.profit_sq_sum, updated_at = excluded.updated_at",
+                    (coin, content_hash, int(bool(success)), profit, profit * profit, now)
+                )
+                # A prompt with enough trials is scored on its own and no longer needs trialing
+                self._conn.execute(
+                    "DELETE FROM prompt_candidates WHERE coin = ? AND hash = ? AND "
+                    "(SELECT trials FROM prompt_stats WHERE coin = ? AND hash = ?) >= ?",
+                    (coin, content_hash, coin, content_hash, self.min_trials)
+                )
+                promoted = self._maybe_promote(coin, content_hash, now)
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return promoted
+
+    def _maybe_promote(self, coin, content_hash, now):
+        row = self._conn.execute(
+            "SELECT trials, wins FROM prompt_stats WHERE coin = ? AND hash = ?", (coin, content_hash)
+        ).fetchone()
+        score = score_stats(row["trials"], row["wins"])
+
+        best = self._conn.execute("SELECT hash FROM best_prompts WHERE coin = ?", (coin,)).fetchone()
+        if best is not None and best["hash"] == content_hash:
+            # Keep the stored score of the incumbent current
+            self._conn.execute("UPDATE best_prompts SET score = ? WHERE coin = ?", (score, coin))
+            return False
+        if row["trials"] < self.min_trials:
+            return False
+
+        if best is not None:
+            incumbent = self._conn.execute(
+                "SELECT trials, wins FROM prompt_stats WHERE coin = ? AND hash = ?", (coin, best["hash"])
+            ).fetchone()
+            incumbent_score = score_stats(incumbent["trials"], incumbent["wins"]) if incumbent else 0.0
+            if score <= incumbent_score:
+                return False
+
+        self._conn.execute(
+            "INSERT INTO best_prompts (coin, hash, score, promoted_at) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT (coin) DO UPDATE SET hash = excluded.hash, score = excluded.score, "
+            "promoted_at = excluded.promoted_at",
+            (coin, content_hash, score, now)
+        )
+        return True
+
+    @staticmethod
+    def _describe(row):
+        trials, wins = row["trials"], row["wins"]
+        mean, variance, low, high = mean_confidence_interval(row["profit_sum"], row["profit_sq_sum"], trials)
+        return {
+            "coin": row["coin"],
+            "hash": row["hash"],
+            "trials": trials,
+            "wins": wins,
+            "win_rate": wins / trials if trials else None,
+            "win_rate_interval": wilson_interval(wins, trials),
+            "total_profit": row["profit_sum"],
+            "mean_profit": mean,
+            "profit_interval": (low, high),
+            "score": score_stats(trials, wins),
+        }
+
+
+_registry = None
+
+
+def get_prompt_registry():
+    """Return the process-wide PromptRegistry, opening it on first use."""
+    global _registry
+    if _registry is None:
+        _registry = PromptRegistry()
+    return _registry
@@ -4,8 +4,17 @@ import os
 import json
 from pathlib import Path
 import random
+import time
 import anyio
 import httpx
+from stats import wilson_interval, mean_confidence_interval
+from coin_index import resolve_coin_id
+from rate_limit import get_upstream, parse_retry_after
+
+try:
+    import numpy as np
+except ImportError:  # numpy is optional; scoring falls back to pure Python
+    np = None
 
 
 def load_env_file():
@@ -20,156 +29,205 @@ def load_env_file():
                     os.environ[key.strip()] = value.strip()
 
 
-async def get_coin_price(coin_name):
-    """Get current price of a coin from CoinGecko API."""
-    # Map common coin symbols to CoinGecko IDs (Top 10 cryptocurrencies)
-    coin_id_map = {
-        # Bitcoin
-        "BTC": "bitcoin",
-        "bitcoin": "bitcoin",
-        # Ethereum
-        "ETH": "ethereum",
-        "ethereum": "ethereum",
-        # Tether
-        "USDT": "tether",
-        "tether": "tether",
-        # BNB
-        "BNB": "binancecoin",
-        "binancecoin": "binancecoin",
-        # Solana
-        "SOL": "solana",
-        "solana": "solana",
-        # USDC
-        "USDC": "usd-coin",
-        "usd-coin": "usd-coin",
-        # XRP
-        "XRP": "ripple",
-        "ripple": "ripple",
-        # Dogecoin
-        "DOGE": "dogecoin",
-        "dogecoin": "dogecoin",
-        # Cardano
-        "ADA": "cardano",
-        "cardano": "cardano",
-        # TRON
-        "TRX": "tron",
-        "tron": "tron"
-    }
-    
-    # Get CoinGecko ID (default to lowercase coin_name if not in map)
-    coin_id = coin_id_map.get(coin_name.upper(), coin_name.lower())
-    
-    # Get API key from environment (optional, but recommended)
+async def get_coin_prices(coin_ids, client):
+    """Fetch USD prices for several CoinGecko ids in a single request."""
     api_key = os.environ.get("COINGECKO_API_KEY")
-    
-    async with httpx.AsyncClient() as client:
-        try:
-            headers = {}
-            if api_key:
-                headers["x-cg-api-key"] = api_key
-            
+    headers = {"x-cg-api-key": api_key} if api_key else {}
+    try:
+        upstream = get_upstream("coingecko")
+        async with upstream.guard():
             response = await client.get(
-                "https://api.coingecko.com/api/v3/simple/price",
-                params={"ids": coin_id, "vs_currencies": "usd"},
+                f"{os.environ.get('COINGECKO_API_URL', 'https://api.coingecko.com/api/v3')}/simple/price",
+                params={"ids": ",".join(coin_ids), "vs_currencies": "usd"},
                 headers=headers
             )
+            if response.status_code == 429:
+                # Hold every caller in this process back for as long as CoinGecko asks
+                upstream.bucket.pause(parse_retry_after(response.headers.get("Retry-After")))
             response.raise_for_status()
-            data = response.json()
-            
-            if coin_id in data:
-                return data[coin_id]["usd"]
-            
-            return None
-        except Exception as e:
-            print(f"Error fetching price: {e}")
-            return None
-
-
-async def evaluate_random_trade(coin_name, trade_number):
-    """Evaluate a single random trading decision and return profit."""
-    # Step 1: Randomly decide BUY or SELL
-    decision = random.choice(["BUY", "SELL"])
-    print(f"\nTrade #{trade_number}: Random decision: {decision}")
-    
-    # Step 2: Get price now
-    price_before = await get_coin_price(coin_name)
-    if price_before is None:
-        print(f"Trade #{trade_number}: Failed to get initial price")
-        return None
-    
-    print(f"Trade #{trade_number}: Price at T0: ${price_before}")
-    
-    # Wait 10 seconds
-    print(f"Trade #{trade_number}: Waiting 10 seconds...")
-    await asyncio.sleep(10)
-    
-    # Get price again
-    price_after = await get_coin_price(coin_name)
-    if price_after is None:
-        print(f"Trade #{trade_number}: Failed to get price after wait")
-        return None
-    
-    print(f"Trade #{trade_number}: Price at T1: ${price_after}")
-    
-    # Step 3: Calculate profit
-    # For BUY: profit = price_after - price_before
-    # For SELL: profit = price_before - price_after
-    execution_price = price_before
-    selling_price = price_after
-    
-    if decision == "BUY":
-        profit = selling_price - execution_price
-    else:  # SELL
-        profit = execution_price - selling_price
-    
-    print(f"Trade #{trade_number}: Execution price: ${execution_price:.2f}")
-    print(f"Trade #{trade_number}: Selling price: ${selling_price:.2f}")
-    print(f"Trade #{trade_number}: Profit: ${profit:.2f}")
-    
-    return profit
+        data = response.json()
+        return {coin_id: data[coin_id]["usd"] for coin_id in coin_ids if coin_id in data}
+    except Exception as e:
+        print(f"Error fetching prices: {e}")
+        return {}
+
+
+async def sample_price_series(coin_names, window_seconds=120, interval_seconds=5, client=None):
+    """Sample one price series per coin, fetching all coins together at each tick.
+    
+    Returns {coin_name: [price, ...]}; ticks where a fetch failed repeat the last price.
+    """
+    coin_ids = {coin_name: await resolve_coin_id(coin_name) for coin_name in coin_names}
+    series = {coin_name: [] for coin_name in coin_names}
+    num_ticks = int(window_seconds // interval_seconds) + 1
+    
+    owns_client = client is None
+    client = client or httpx.AsyncClient()
+    try:
+        started = time.monotonic()
+        for tick in range(num_ticks):
+            prices = await get_coin_prices(sorted(set(coin_ids.values())), client)
+            for coin_name, coin_id in coin_ids.items():
+                price = prices.get(coin_id)
+                if price is None and series[coin_name]:
+                    price = series[coin_name][-1]
+                if price is not None:
+                    series[coin_name].append(price)
+            if tick < num_ticks - 1:
+                # Sleep to the next tick boundary so fetch latency does not stretch the window
+                next_tick = started + (tick + 1) * interval_seconds
+                await asyncio.sleep(max(0.0, next_tick - time.monotonic()))
+    finally:
+        if owns_client:
+            await client.aclose()
+    return series
 
 
-async def evaluate_random_agent(coin_name, num_trades=10):
+def score_random_draws(prices, num_draws, horizon_ticks, rng=None):
+    """Score random BUY/SELL draws against one price series in a single vectorised pass.
+    
+    Each draw picks a random entry tick and side; its profit is the signed price change
+    over ``horizon_ticks``. Returns the list of profits.
+    """
+    if len(prices) <= horizon_ticks:
+        return []
+    rng = rng or random.Random()
+    num_entries = len(prices) - horizon_ticks
+    
+    if np is not None:
+        generator = np.random.default_rng(rng.randrange(2 ** 32))
+        series = np.asarray(prices, dtype=float)
+        moves = series[horizon_ticks:] - series[:num_entries]
+        entries = generator.integers(0, num_entries, size=num_draws)
+        sides = generator.choice(np.array([1.0, -1.0]), size=num_draws)
+        return (sides * moves[entries]).tolist()
+    
+    moves = [prices[i + horizon_ticks] - prices[i] for i in range(num_entries)]
+    return [
+        moves[rng.randrange(num_entries)] * (1.0 if rng.random() < 0.5 else -1.0)
+        for _ in range(num_draws)
+    ]
+
+
+def score_random_sides(moves, num_draws, rng=None):
+    """Score random BUY/SELL draws against given price moves (price after - price before).
+    
+    Each draw picks one of the moves and a random side, so the draws are scored over
+    exactly the windows the moves were measured in. Returns the list of profits.
+    """
+    if not moves:
+        return []
+    rng = rng or random.Random()
+    return [rng.choice(moves) * (1.0 if rng.random() < 0.5 else -1.0) for _ in range(num_draws)]
+
+
+def summarize_profits(profits, samples=None):
+    """Mean, variance and 95% intervals of profit and win rate for a list of profits.
+    
+    When the profits are draws resampled from fewer independent outcomes (the distinct
+    entries of one price series, or K trial windows), pass that number as samples: the
+    intervals use it as n, since resampling the same outcomes adds no information.
+    """
+    count = len(profits)
+    samples = min(samples, count) if samples is not None else count
+    wins = sum(1 for profit in profits if profit > 0)
+    # Scale the sums to the independent sample size; the point estimates are unchanged
+    scale = samples / count if count else 0.0
+    mean, variance, low, high = mean_confidence_interval(
+        sum(profits) * scale, sum(profit * profit for profit in profits) * scale, samples
+    )
+    win_low, win_high = wilson_interval(wins * scale, samples)
+    return {
+        "trades": count,
+        "samples": samples,
+        "wins": wins,
+        "win_rate": wins / count if count else None,
+        "win_rate_ci": (win_low, win_high),
+        "mean_profit": mean,
+        "profit_variance": variance,
+        "mean_profit_ci": (low, high),
+        "total_profit": sum(profits),
+    }
+
+
+async def run_random_baseline(coin_names, num_draws=1000, window_seconds=120, interval_seconds=5,
+                              horizon_seconds=10, seed=None, client=None):
+    """Random BUY/SELL baseline per coin from one shared price series per coin.
+    
+    All draws for a coin share one sampled path, so the intervals describe the spread of
+    random decisions over that window rather than over different market regimes, and
+    their n is the number of distinct entry ticks, not the number of draws.
+    """
+    horizon_ticks = max(1, round(horizon_seconds / interval_seconds))
+    series = await sample_price_series(coin_names, window_seconds, interval_seconds, client)
+    rng = random.Random(seed)
+    
+    results = {}
+    for coin_name in coin_names:
+        profits = score_random_draws(series[coin_name], num_draws, horizon_ticks, rng)
+        # Draws only ever see the series' distinct entry ticks, however many are taken
+        summary = summarize_profits(profits, samples=max(0, len(series[coin_name]) - horizon_ticks))
+        summary.update({
+            "horizon_seconds": horizon_ticks * interval_seconds,
+            "ticks": len(series[coin_name]),
+            "profits": profits,
+        })
+        results[coin_name] = summary
+    return results
+
+
+async def evaluate_random_agent(coin_name, num_trades=10, horizon_seconds=10, window_seconds=120,
+                                interval_seconds=5, seed=None):
     """Evaluate random trading decisions and return profits and success list."""
     load_env_file()
     
     print(f"Starting random evaluation for {coin_name}")
-    print(f"Will execute {num_trades} trades, each with 10 second intervals")
-    
-    profits = []
-    success_list = []
-    
-    for i in range(1, num_trades + 1):
-        profit = await evaluate_random_trade(coin_name, i)
-        
-        if profit is not None:
-            profits.append(profit)
-            # 1 means positive profit, 0 means loss
-            success = 1 if profit > 0 else 0
-            success_list.append(success)
-            print(f"Trade #{i}: Result: {success} ({'Profit' if success == 1 else 'Loss'})")
-        else:
-            print(f"Trade #{i}: Failed to evaluate")
-            # You might want to handle this differently - maybe skip or use 0
-            profits.append(0.0)
-            success_list.append(0)
-    
+    print(f"Sampling one {window_seconds}s price series every {interval_seconds}s, "
+          f"then scoring {num_trades} random {horizon_seconds}s trades against it")
+    
+    results = await run_random_baseline(
+        [coin_name], num_trades, window_seconds, interval_seconds, horizon_seconds, seed
+    )
+    profits = results[coin_name]["profits"]
+    if not profits:
+        print("Failed to sample enough prices")
+    success_list = [1 if profit > 0 else 0 for profit in profits]
     return profits, success_list
 
 
+def print_baseline_summary(coin_name, summary):
+    """Print the baseline statistics for one coin."""
+    win_low, win_high = summary["win_rate_ci"]
+    print(f"\n{coin_name}: {summary['trades']} random {summary['horizon_seconds']}s trades "
+          f"over {summary['ticks']} ticks ({summary['samples']} distinct entries)")
+    if not summary["trades"]:
+        print("  No trades scored (not enough price samples)")
+        return
+    low, high = summary["mean_profit_ci"]
+    print(f"  Win rate: {summary['win_rate']:.1%} (95% CI {win_low:.1%} - {win_high:.1%})")
+    print(f"  Mean profit: ${summary['mean_profit']:.4f} (95% CI ${low:.4f} - ${high:.4f})")
+    print(f"  Profit variance: {summary['profit_variance']:.6f}")
+    print(f"  Total profit: ${summary['total_profit']:.2f}")
+
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Evaluate random trading decisions")
-    parser.add_argument("--coin-name", required=True, help="Coin name to evaluate (e.g., BTC, ETH)")
-    parser.add_argument("--num-trades", type=int, default=10, help="Number of trades to execute (default: 10)")
+    parser.add_argument("--coin-name", required=True, help="Coin name(s) to evaluate, comma separated (e.g., BTC or BTC,ETH)")
+    parser.add_argument("--num-trades", type=int, default=10, help="Number of random trades per coin (default: 10)")
+    parser.add_argument("--horizon", type=float, default=10, help="Holding time of each trade in seconds (default: 10)")
+    parser.add_argument("--window", type=float, default=120, help="Length of the sampled price series in seconds (default: 120)")
+    parser.add_argument("--interval", type=float, default=5, help="Seconds between price samples (default: 5)")
+    parser.add_argument("--seed", type=int, default=None, help="Random seed for reproducible draws")
     args = parser.parse_args()
     
-    profits, success_list = anyio.run(evaluate_random_agent, args.coin_name, args.num_trades)
+    load_env_file()
+    coin_names = [coin.strip() for coin in args.coin_name.split(",") if coin.strip()]
+    results = anyio.run(
+        run_random_baseline, coin_names, args.num_trades, args.window, args.interval, args.horizon, args.seed
+    )
     
     print("\n" + "="*50)
     print("FINAL RESULTS")
     print("="*50)
-    print(f"\nProfits: {profits}")
-    print(f"Success list (1=profit, 0=loss): {success_list}")
-    print(f"\nTotal profitable trades: {sum(success_list)}/{len(success_list)}")
-    print(f"Total profit: ${sum(profits):.2f}")
-
+    for coin_name in coin_names:
+        print_baseline_summary(coin_name, results[coin_name])
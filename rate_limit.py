@@ -0,0 +1,285 @@
+"""
+Process-wide outbound rate limiting and circuit breaking per upstream service.
+
+Every live call to CoinGecko, Brave (through the MCP tool hooks) and Anthropic takes a
+token from that upstream's bucket first, waiting in FIFO order if the bucket is empty,
+so concurrent sessions share one request budget instead of each collecting 429s. Time
+spent waiting is recorded per upstream.
+
+A circuit breaker per upstream opens after BREAKER_FAILURES (default 5) consecutive
+failures. While it is open, calls fail immediately with UpstreamUnavailable. After
+BREAKER_RESET_SECONDS (default 30) one trial call is let through, and its result closes
+or reopens the circuit. A caller that admits a call it may never see the end of (a Brave
+tool call cut off with its session) passes an owner to acquire() and calls release()
+with it, so an unfinished trial cannot hold the circuit open.
+
+Rates are configured as RATE_LIMIT_<UPSTREAM>="<requests per second>:<burst>", for
+example RATE_LIMIT_COINGECKO="0.5:5".
+"""
+import asyncio
+import os
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+from email.utils import parsedate_to_datetime
+
+
+DEFAULT_RATES = {
+    # CoinGecko's public API allows roughly 30 calls a minute
+    "coingecko": (0.5, 5),
+    # Brave's free plan allows 1 query per second
+    "brave": (1.0, 1),
+    "anthropic": (2.0, 5),
+}
+
+
+class UpstreamUnavailable(Exception):
+    """Raised instead of calling an upstream whose circuit is open."""
+
+    def __init__(self, upstream, retry_in):
+        self.upstream = upstream
+        self.retry_in = retry_in
+        super().__init__(f"{upstream} is unavailable after repeated failures; retrying in {retry_in:.0f}s")
+
+
+class TokenBucket:
+    """Thread-safe token bucket. Callers reserve a slot and wait for it, first come first served."""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self):
+        """Take a token now, possibly going into debt; returns seconds to wait before using it."""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+            return 0.0 if self._tokens >= 0 else -self._tokens / self.rate
+
+    def pause(self, seconds):
+        """Hold back all callers for a while (e.g. after a 429 with Retry-After)."""
+        with self._lock:
+            self._tokens = min(self._tokens, -seconds * self.rate)
+            self._updated = time.monotonic()
+
+
+def parse_retry_after(value, default=10.0):
+    """Seconds to wait from a Retry-After header, in either delay-seconds or HTTP-date form."""
+    if not value:
+        return default
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return default
+
+
+class CircuitBreaker:
+    """Consecutive-failure circuit breaker with a single half-open trial."""
+
+    def __init__(self, failure_threshold=5, reset_seconds=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.failures = 0
+        self.opened_at = None
+        self._trial_running = False
+        self._trial_owner = None
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_seconds:
+            return "half_open"
+        return "open"
+
+    def retry_in(self):
+        if self.opened_at is None:
+            return 0.0
+        return max(0.0, self.reset_seconds - (time.monotonic() - self.opened_at))
+
+    def allow(self, owner=None):
+        """True if a call may go ahead now; owner identifies the call if it becomes the trial."""
+        with self._lock:
+            state = self.state
+            if state == "closed":
+                return True
+            if state == "half_open" and not self._trial_running:
+                self._trial_running = True
+                self._trial_owner = owner
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial_running = False
+            self._trial_owner = None
+
+    def release(self, owner=None):
+        """Give up a half-open trial that ended without a result (e.g. cancelled).
+
+        With an owner, only that call's trial is given up.
+        """
+        with self._lock:
+            if owner is None or owner == self._trial_owner:
+                self._trial_running = False
+                self._trial_owner = None
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self._trial_running or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+            self._trial_running = False
+            self._trial_owner = None
+
+
+class Upstream:
+    """Rate limiter, circuit breaker and metrics for one outside service."""
+
+    def __init__(self, name, rate, burst, failure_threshold=5, reset_seconds=30.0):
+        self.name = name
+        self.bucket = TokenBucket(rate, burst)
+        self.breaker = CircuitBreaker(failure_threshold, reset_seconds)
+        self.calls = 0
+        self.failures = 0
+        self.rejected = 0
+        self.queue_ms_total = 0.0
+        self.queue_ms_max = 0.0
+        self._lock = threading.Lock()
+
+    def _admit(self, owner=None):
+        """Check the breaker and reserve a token; returns the seconds to wait."""
+        if not self.breaker.allow(owner):
+            with self._lock:
+                self.rejected += 1
+            raise UpstreamUnavailable(self.name, self.breaker.retry_in())
+        wait = self.bucket.reserve()
+        with self._lock:
+            self.calls += 1
+            self.queue_ms_total += wait * 1000
+            self.queue_ms_max = max(self.queue_ms_max, wait * 1000)
+        return wait
+
+    async def acquire(self, owner=None):
+        """Wait for a token; raises UpstreamUnavailable while the circuit is open.
+
+        Pass an owner when the call's result may never be reported, and release(owner)
+        once it is known that it will not be.
+        """
+        wait = self._admit(owner)
+        if wait:
+            try:
+                await asyncio.sleep(wait)
+            except BaseException:
+                self.breaker.release(owner)
+                raise
+
+    def release(self, owner):
+        """Give up an acquired call that will not report a result."""
+        self.breaker.release(owner)
+
+    def record_result(self, success):
+        """Report the outcome of a call made after acquire()."""
+        if success:
+            self.breaker.record_success()
+            return
+        with self._lock:
+            self.failures += 1
+        self.breaker.record_failure()
+
+    def available(self):
+        """False while the circuit is open."""
+        return self.breaker.state != "open"
+
+    @asynccontextmanager
+    async def guard(self):
+        """Wait for a token, then run the block; exceptions count as upstream failures."""
+        await self.acquire()
+        try:
+            yield self
+        except Exception:
+            self.record_result(False)
+            raise
+        except BaseException:
+            self.breaker.release()
+            raise
+        self.record_result(True)
+
+    @contextmanager
+    def guard_sync(self):
+        """guard() for blocking code running in a worker thread."""
+        wait = self._admit()
+        try:
+            if wait:
+                time.sleep(wait)
+            yield self
+        except Exception:
+            self.record_result(False)
+            raise
+        except BaseException:
+            self.breaker.release()
+            raise
+        self.record_result(True)
+
+    def metrics(self):
+        with self._lock:
+            return {
+                "state": self.breaker.state,
+                "retry_in": self.breaker.retry_in(),
+                "rate_per_second": self.bucket.rate,
+                "burst": self.bucket.burst,
+                "calls": self.calls,
+                "failures": self.failures,
+                "rejected": self.rejected,
+                "mean_queue_ms": self.queue_ms_total / self.calls if self.calls else 0.0,
+                "max_queue_ms": self.queue_ms_max,
+            }
+
+
+def parse_rate(value, default):
+    """Parse '<rate>:<burst>' into (rate, burst)."""
+    if not value:
+        return default
+    rate, _, burst = value.partition(":")
+    return float(rate), int(burst or 1)
+
+
+_upstreams = {}
+_upstreams_lock = threading.Lock()
+
+
+def get_upstream(name):
+    """Return the process-wide Upstream for a service, creating it from the environment."""
+    with _upstreams_lock:
+        if name not in _upstreams:
+            rate, burst = parse_rate(os.environ.get(f"RATE_LIMIT_{name.upper()}"), DEFAULT_RATES.get(name, (1.0, 1)))
+            _upstreams[name] = Upstream(
+                name, rate, burst,
+                failure_threshold=int(os.environ.get("BREAKER_FAILURES", 5)),
+                reset_seconds=float(os.environ.get("BREAKER_RESET_SECONDS", 30)),
+            )
+        return _upstreams[name]
+
+
+def unavailable_upstreams(names):
+    """The named upstreams whose circuit is currently open."""
+    return [get_upstream(name) for name in names if not get_upstream(name).available()]
+
+
+def upstream_metrics():
+    """Metrics for every upstream used so far in this process."""
+    with _upstreams_lock:
+        upstreams = list(_upstreams.values())
+    return {upstream.name: upstream.metrics() for upstream in upstreams}
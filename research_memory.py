@@ -0,0 +1,106 @@
+"""
+Latest research report per coin and system prompt, for incremental research.
+
+After a research session produces a report, agent.main stores it here under the coin and
+the hash of the system prompt that produced it, with the time the research started, how
+many tool calls it took and the cost of the last from-scratch session (the baseline
+incremental sessions are compared against). Keying by prompt keeps one prompt's session
+from building on another prompt's research. The next session for the same coin and
+prompt is given the report and told to search only for news, Reddit posts and market
+data newer than it, as long as the chain's last from-scratch session started less than
+INCREMENTAL_MAX_AGE_SECONDS ago (default 1800); after that it researches from scratch
+again, so reports never chain indefinitely. Set INCREMENTAL_RESEARCH=0 to always
+research from scratch.
+"""
+import os
+import threading
+import time
+
+from storage import connect, get_data_dir
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS prompt_reports (
+    coin TEXT NOT NULL,
+    prompt_hash TEXT NOT NULL,
+    report TEXT NOT NULL,
+    researched_at REAL NOT NULL,
+    full_researched_at REAL NOT NULL,
+    tool_calls INTEGER,
+    research_ms REAL,
+    full_tool_calls INTEGER,
+    full_research_ms REAL,
+    log_file TEXT,
+    PRIMARY KEY (coin, prompt_hash)
+);
+"""
+
+
+def get_default_memory_path():
+    """Return the research memory database path (override with RESEARCH_MEMORY_DB)."""
+    return os.environ.get("RESEARCH_MEMORY_DB") or str(get_data_dir() / "research.db")
+
+
+def incremental_enabled():
+    return os.environ.get("INCREMENTAL_RESEARCH", "1") != "0"
+
+
+def max_report_age():
+    return float(os.environ.get("INCREMENTAL_MAX_AGE_SECONDS", 1800))
+
+
+class ResearchMemory:
+    """SQLite store of the most recent research report for each coin and prompt."""
+
+    def __init__(self, db_path=None):
+        self.db_path = db_path or get_default_memory_path()
+        self._lock = threading.Lock()
+        self._conn = connect(self.db_path)
+        self._conn.executescript(SCHEMA)
+
+    def save(self, coin, prompt_hash, report, researched_at, full_researched_at=None, tool_calls=None,
+             research_ms=None, full_tool_calls=None, full_research_ms=None, log_file=None):
+        """Store a coin and prompt's report unless a newer one is already stored.
+
+        full_researched_at is when the chain's last from-scratch session started (defaults
+        to researched_at, i.e. this session was one).
+        """
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO prompt_reports (coin, prompt_hash, report, researched_at, full_researched_at, "
+                "tool_calls, research_ms, full_tool_calls, full_research_ms, log_file) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (coin, prompt_hash) DO UPDATE SET report = excluded.report, "
+                "researched_at = excluded.researched_at, full_researched_at = excluded.full_researched_at, "
+                "tool_calls = excluded.tool_calls, research_ms = excluded.research_ms, "
+                "full_tool_calls = excluded.full_tool_calls, full_research_ms = excluded.full_research_ms, "
+                "log_file = excluded.log_file "
+                "WHERE excluded.researched_at > prompt_reports.researched_at",
+                (coin.upper(), prompt_hash, report, researched_at,
+                 full_researched_at if full_researched_at is not None else researched_at,
+                 tool_calls, research_ms, full_tool_calls, full_research_ms, str(log_file) if log_file else None)
+            )
+
+    def latest(self, coin, prompt_hash, max_age=None):
+        """The last report for a coin and prompt as a dict, or None.
+
+        None too once the chain's from-scratch session is older than max_age seconds.
+        """
+        max_age = max_report_age() if max_age is None else max_age
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT * FROM prompt_reports WHERE coin = ? AND prompt_hash = ? AND full_researched_at >= ?",
+                (coin.upper(), prompt_hash, time.time() - max_age)
+            ).fetchone()
+        return dict(row) if row is not None else None
+
+
+_memory = None
+
+
+def get_research_memory():
+    """Return the process-wide ResearchMemory, opening it on first use."""
+    global _memory
+    if _memory is None:
+        _memory = ResearchMemory()
+    return _memory
@@ -0,0 +1,247 @@
+"""
+Indexed run history store.
+
+Every attempt made by the runner (coin, prompt hash, decision, prices, profit, latency
+breakdown and token usage) is written to one SQLite table, and a per-day rollup keyed by
+coin and prompt hash is updated in the same transaction. Paginated listings use keyset
+pagination on the indexed id and aggregate stats only ever read the rollup, so queries
+stay fast no matter how much history accumulates.
+"""
+import hashlib
+import os
+import threading
+import time
+from datetime import datetime, timezone
+
+from storage import connect, get_data_dir
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS attempts (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    session_id TEXT,
+    attempt INTEGER,
+    coin TEXT NOT NULL,
+    prompt_hash TEXT NOT NULL,
+    decision TEXT,
+    reason TEXT,
+    status TEXT NOT NULL,
+    success INTEGER,
+    price_before REAL,
+    price_after REAL,
+    profit REAL,
+    research_ms REAL,
+    extraction_ms REAL,
+    evaluation_ms REAL,
+    total_ms REAL,
+    input_tokens INTEGER,
+    output_tokens INTEGER,
+    extraction_input_tokens INTEGER,
+    extraction_output_tokens INTEGER,
+    cost_usd REAL,
+    log_file TEXT,
+    created_at REAL NOT NULL,
+    day TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_attempts_coin_id ON attempts (coin, id);
+CREATE INDEX IF NOT EXISTS idx_attempts_prompt_id ON attempts (prompt_hash, id);
+CREATE INDEX IF NOT EXISTS idx_attempts_session ON attempts (session_id, attempt);
+CREATE TABLE IF NOT EXISTS attempt_rollup (
+    day TEXT NOT NULL,
+    coin TEXT NOT NULL,
+    prompt_hash TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    decisions INTEGER NOT NULL DEFAULT 0,
+    wins INTEGER NOT NULL DEFAULT 0,
+    profit_sum REAL NOT NULL DEFAULT 0,
+    profit_sq_sum REAL NOT NULL DEFAULT 0,
+    research_ms_sum REAL NOT NULL DEFAULT 0,
+    total_ms_sum REAL NOT NULL DEFAULT 0,
+    tokens_sum INTEGER NOT NULL DEFAULT 0,
+    cost_usd_sum REAL NOT NULL DEFAULT 0,
+    PRIMARY KEY (coin, day, prompt_hash)
+);
+CREATE INDEX IF NOT EXISTS idx_rollup_day ON attempt_rollup (day);
+"""
+
+ATTEMPT_FIELDS = (
+    "session_id", "attempt", "coin", "prompt_hash", "decision", "reason", "status", "success",
+    "price_before", "price_after", "profit", "research_ms", "extraction_ms", "evaluation_ms",
+    "total_ms", "input_tokens", "output_tokens", "extraction_input_tokens",
+    "extraction_output_tokens", "cost_usd", "log_file", "created_at", "day",
+)
+
+STATS_GROUPS = {
+    "coin": ("coin",),
+    "prompt": ("prompt_hash",),
+    "coin_prompt": ("coin", "prompt_hash"),
+    "day": ("day",),
+    "none": (),
+}
+
+
+def prompt_hash(prompt_text):
+    """Return the content hash used to identify a system prompt."""
+    return hashlib.sha256(prompt_text.encode("utf-8")).hexdigest()[:16]
+
+
+def get_default_store_path():
+    """Return the run history database path (override with RUN_STORE_DB)."""
+    return os.environ.get("RUN_STORE_DB") or str(get_data_dir() / "runs.db")
+
+
+def to_day(timestamp):
+    """Bucket a unix timestamp into a UTC day string (YYYY-MM-DD)."""
+    return datetime.fromtimestamp(timestamp, tz=timezone.utc).strftime("%Y-%m-%d")
+
+
+class RunStore:
+    """SQLite store of attempt outcomes with a per-day rollup for aggregate queries."""
+
+    def __init__(self, db_path=None):
+        self.db_path = db_path or get_default_store_path()
+        self._lock = threading.Lock()
+        self._conn = connect(self.db_path)
+        self._conn.executescript(SCHEMA)
+
+    def record_attempt(self, **fields):
+        """Insert one attempt and fold it into the rollup; returns the new row id."""
+        row = {key: fields.get(key) for key in ATTEMPT_FIELDS}
+        row["coin"] = row["coin"].upper()
+        row["created_at"] = row["created_at"] or time.time()
+        row["day"] = to_day(row["created_at"])
+        if row["success"] is not None:
+            row["success"] = int(bool(row["success"]))
+
+        decided = row["success"] is not None
+        profit = row["profit"] or 0.0
+        tokens = sum(row[key] or 0 for key in (
+            "input_tokens", "output_tokens", "extraction_input_tokens", "extraction_output_tokens"
+        ))
+
+        columns = ", ".join(ATTEMPT_FIELDS)
+        placeholders = ", ".join("?" for _ in ATTEMPT_FIELDS)
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                cursor = self._conn.execute(
+                    f"INSERT INTO attempts ({columns}) VALUES ({placeholders})",
+                    [row[key] for key in ATTEMPT_FIELDS]
+                )
+                self._conn.execute(
+                    "INSERT INTO attempt_rollup (day, coin, prompt_hash, attempts, decisions, wins, "
+                    "profit_sum, profit_sq_sum, research_ms_sum, total_ms_sum, tokens_sum, cost_usd_sum) "
+                    "VALUES (?, ?, ?, 1, ?, ?, ?, ?, ?, ?, ?, ?) "
+                    "ON CONFLICT (coin, day, prompt_hash) DO UPDATE SET "
+                    "attempts = attempts + 1, decisions = decisions + excluded.decisions, "
+                    "wins = wins + excluded.wins, profit_sum = profit_sum + excluded.profit_sum, "
+                    "profit_sq_sum = profit_sq_sum + excluded.profit_sq_sum, "
+                    "research_ms_sum = research_ms_sum + excluded.research_ms_sum, "
+                    "total_ms_sum = total_ms_sum + excluded.total_ms_sum, "
+                    "tokens_sum = tokens_sum + excluded.tokens_sum, "
+                    "cost_usd_sum = cost_usd_sum + excluded.cost_usd_sum",
+                    (
+                        row["day"], row["coin"], row["prompt_hash"],
+                        int(decided), row["success"] or 0, profit, profit * profit,
+                        row["research_ms"] or 0.0, row["total_ms"] or 0.0, tokens, row["cost_usd"] or 0.0,
+                    )
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return cursor.lastrowid
+
+    def list_attempts(self, coin=None, prompt=None, session_id=None, before_id=None, limit=50):
+        """Return a page of attempts, newest first, plus the cursor for the next page."""
+        clauses, params = [], []
+        if coin:
+            clauses.append("coin = ?")
+            params.append(coin.upper())
+        if prompt:
+            clauses.append("prompt_hash = ?")
+            params.append(prompt)
+        if session_id:
+            clauses.append("session_id = ?")
+            params.append(session_id)
+        if before_id:
+            clauses.append("id < ?")
+            params.append(before_id)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        params.append(limit)
+
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT * FROM attempts {where} ORDER BY id DESC LIMIT ?", params
+            ).fetchall()
+        items = [dict(row) for row in rows]
+        next_before_id = items[-1]["id"] if len(items) == limit else None
+        return items, next_before_id
+
+    def stats(self, coin=None, prompt=None, since_day=None, until_day=None, group_by="coin_prompt"):
+        """Aggregate the rollup (win rate, PnL, latency, tokens, cost) per group."""
+        group_columns = STATS_GROUPS[group_by]
+        clauses, params = [], []
+        if coin:
+            clauses.append("coin = ?")
+            params.append(coin.upper())
+        if prompt:
+            clauses.append("prompt_hash = ?")
+            params.append(prompt)
+        if since_day:
+            clauses.append("day >= ?")
+            params.append(since_day)
+        if until_day:
+            clauses.append("day <= ?")
+            params.append(until_day)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        select_groups = "".join(f"{column}, " for column in group_columns)
+        group_clause = f"GROUP BY {', '.join(group_columns)}" if group_columns else ""
+
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT {select_groups}SUM(attempts) AS attempts, SUM(decisions) AS decisions, "
+                "SUM(wins) AS wins, SUM(profit_sum) AS profit_sum, SUM(profit_sq_sum) AS profit_sq_sum, "
+                "SUM(research_ms_sum) AS research_ms_sum, SUM(total_ms_sum) AS total_ms_sum, "
+                "SUM(tokens_sum) AS tokens_sum, SUM(cost_usd_sum) AS cost_usd_sum "
+                f"FROM attempt_rollup {where} {group_clause}",
+                params
+            ).fetchall()
+
+        results = []
+        for row in rows:
+            row = dict(row)
+            attempts = row.pop("attempts") or 0
+            if not attempts:
+                continue
+            decisions = row.pop("decisions") or 0
+            wins = row.pop("wins") or 0
+            profit_sum = row.pop("profit_sum") or 0.0
+            profit_sq_sum = row.pop("profit_sq_sum") or 0.0
+            mean_profit = profit_sum / decisions if decisions else None
+            row.update({
+                "attempts": attempts,
+                "decisions": decisions,
+                "wins": wins,
+                "win_rate": wins / decisions if decisions else None,
+                "total_profit": profit_sum,
+                "mean_profit": mean_profit,
+                "profit_variance": (profit_sq_sum / decisions - mean_profit ** 2) if decisions else None,
+                "mean_research_ms": (row.pop("research_ms_sum") or 0.0) / attempts,
+                "mean_total_ms": (row.pop("total_ms_sum") or 0.0) / attempts,
+                "tokens": row.pop("tokens_sum") or 0,
+                "cost_usd": row.pop("cost_usd_sum") or 0.0,
+            })
+            results.append(row)
+        return results
+
+
+_store = None
+
+
+def get_run_store():
+    """Return the process-wide RunStore, opening it on first use."""
+    global _store
+    if _store is None:
+        _store = RunStore()
+    return _store
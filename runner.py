@@ -2,40 +2,46 @@ import asyncio
 import argparse
 import os
 import json
+import random
+import time
+import uuid
 from pathlib import Path
 from datetime import datetime
-import anthropic
-import httpx
 import anyio
-from agent import main as agent_main, load_system_prompt, load_env_file, setup_logging_directory
+# anthropic and httpx are imported where they are used (see agent.py)
+from agent import main as agent_main, get_runtime, setup_logging_directory
+from run_store import get_run_store, prompt_hash
+from prompt_registry import get_prompt_registry
+from cassette import coin_price, create_message, is_replaying
+from job_queue import SQLiteJobBroker, JobEventCallback, make_worker_id, process_id, DEFAULT_LEASE_SECONDS
+from deadlines import DeadlineBudget, stage_limit, stale_decision_seconds
+from log_archive import get_log_archive
+from price_feed import get_price_feed
+from rate_limit import get_upstream, unavailable_upstreams, parse_retry_after, upstream_metrics
+from coin_index import resolve_coin_id
+from model_router import get_model_router, route_model, record_model_call, token_cost
 
 
-async def get_coin_price(coin_name):
+async def get_coin_price(coin_name, timeout=None):
+    """Get current price of a coin, recorded or replayed when a cassette is active.
+    
+    Returns None if the fetch takes longer than timeout seconds (PRICE_DEADLINE_SECONDS
+    by default).
+    """
+    if timeout is None:
+        timeout = stage_limit("price")
+    try:
+        return await asyncio.wait_for(coin_price(fetch_coin_price, coin_name), timeout)
+    except asyncio.TimeoutError:
+        print(f"Price fetch for {coin_name} exceeded its {timeout:.1f}s deadline")
+        return None
+
+
+async def fetch_coin_price(coin_name):
     """Get current price of a coin from CoinGecko API."""
-    coin_id_map = {
-        "BTC": "bitcoin",
-        "bitcoin": "bitcoin",
-        "ETH": "ethereum",
-        "ethereum": "ethereum",
-        "USDT": "tether",
-        "tether": "tether",
-        "BNB": "binancecoin",
-        "binancecoin": "binancecoin",
-        "SOL": "solana",
-        "solana": "solana",
-        "USDC": "usd-coin",
-        "usd-coin": "usd-coin",
-        "XRP": "ripple",
-        "ripple": "ripple",
-        "DOGE": "dogecoin",
-        "dogecoin": "dogecoin",
-        "ADA": "cardano",
-        "cardano": "cardano",
-        "TRX": "tron",
-        "tron": "tron"
-    }
-    
-    coin_id = coin_id_map.get(coin_name.upper(), coin_name.lower())
+    import httpx
+
+    coin_id = await resolve_coin_id(coin_name)
     api_key = os.environ.get("COINGECKO_API_KEY")
     
     async with httpx.AsyncClient() as client:
@@ -44,12 +50,17 @@ async def get_coin_price(coin_name):
             if api_key:
                 headers["x-cg-api-key"] = api_key
             
-            response = await client.get(
-                "https://api.coingecko.com/api/v3/simple/price",
-                params={"ids": coin_id, "vs_currencies": "usd"},
-                headers=headers
-            )
-            response.raise_for_status()
+            upstream = get_upstream("coingecko")
+            async with upstream.guard():
+                response = await client.get(
+                    f"{os.environ.get('COINGECKO_API_URL', 'https://api.coingecko.com/api/v3')}/simple/price",
+                    params={"ids": coin_id, "vs_currencies": "usd"},
+                    headers=headers
+                )
+                if response.status_code == 429:
+                    # Hold every caller in this process back for as long as CoinGecko asks
+                    upstream.bucket.pause(parse_retry_after(response.headers.get("Retry-After")))
+                response.raise_for_status()
             data = response.json()
             
             if coin_id in data:
@@ -73,9 +84,18 @@ def find_latest_log_file(coin_name, logs_dir):
 
 
 def read_log_file(log_file_path):
-    """Read and return the content of a log file."""
-    if not log_file_path or not log_file_path.exists():
+    """Read and return the content of a log file, from the log archive if it was compacted."""
+    if not log_file_path:
         return None
+    log_file_path = Path(log_file_path)
+    if not log_file_path.exists():
+        try:
+            return get_log_archive().read_session(log_file_path.name)
+        except KeyError:
+            return None
+        except Exception as e:
+            print(f"Error reading archived log: {e}")
+            return None
     
     try:
         with open(log_file_path, "r", encoding="utf-8") as f:
@@ -88,11 +108,15 @@ def read_log_file(log_file_path):
 async def get_updated_prompt(log_content, system_prompt, coin_name):
     """Call Claude to get an updated prompt based on failure analysis."""
     api_key = os.environ.get("ANTHROPIC_API_KEY")
-    if not api_key:
+    if not api_key and not is_replaying():
         print("Warning: ANTHROPIC_API_KEY not found in environment")
         return None, None
     
-    client = anthropic.Anthropic(api_key=api_key)
+    if is_replaying():
+        client = None
+    else:
+        import anthropic
+        client = anthropic.Anthropic(api_key=api_key)
     
     # Prepare the input for Claude
     input_text = f"""The agent failed to make a profitable trading decision for {coin_name}.
@@ -107,9 +131,14 @@ FAILURE INDICATION: The agent's decision resulted in a loss (profit <= 0).
 
 Please analyze the log file and current system prompt, then provide an updated system prompt that should help the agent make better decisions. Focus on what went wrong and how to improve the decision-making process."""
 
+    route = await asyncio.to_thread(route_model, "rewrite")
+    started = time.perf_counter()
     try:
-        response = client.beta.messages.create(
-            model="claude-sonnet-4-5",
+        # Run the blocking SDK call in a thread so concurrent runs keep making progress
+        response = await asyncio.to_thread(
+            create_message,
+            client,
+            model=route["model"],
             max_tokens=2048,
             betas=["structured-outputs-2025-11-13"],
             messages=[
@@ -139,33 +168,95 @@ Please analyze the log file and current system prompt, then provide an updated s
         )
         
         structured_output = json.loads(response.content[0].text)
+        usage = getattr(response, "usage", None)
+        await asyncio.to_thread(
+            record_model_call, route, (time.perf_counter() - started) * 1000,
+            token_cost(route["model"], usage.input_tokens, usage.output_tokens) if usage else None,
+            bool(structured_output.get("updated_prompt"))
+        )
         return structured_output.get("updated_prompt"), structured_output.get("reason")
         
     except Exception as e:
         print(f"Error getting updated prompt: {e}")
+        await asyncio.to_thread(record_model_call, route, (time.perf_counter() - started) * 1000, None, False)
         return None, None
 
 
-async def evaluate_decision(coin_name, decision, system_prompt=None, callback=None):
-    """Evaluate a trading decision and return success status."""
-    print(f"\n{'='*60}")
-    print(f"Evaluating decision: {decision}")
-    print(f"{'='*60}")
+def compute_profit(decision, price_before, price_after):
+    """Return the profit of a BUY/SELL decision between two prices."""
+    if decision == "BUY":
+        return price_after - price_before
+    return price_before - price_after
+
+
+def get_eval_horizons():
+    """Scoring horizons in seconds (EVAL_HORIZONS, default 15,30,60,120)."""
+    return [int(value) for value in os.environ.get("EVAL_HORIZONS", "15,30,60,120").split(",") if value.strip()]
+
+
+def score_price_path(decision, price_before, ticks, horizons):
+    """Score a decision at several horizons along one sampled price path.
     
-    if callback:
-        await callback.send_update("status", {"message": f"Evaluating decision: {decision}"})
+    ticks are (seconds since T0, price) pairs, oldest first. Each horizon uses the last
+    tick at or before it; horizons beyond the sampled window are None. The max adverse
+    excursion is the largest loss against the position seen anywhere on the path.
+    """
+    scores = {}
+    for horizon in horizons:
+        price = None
+        for offset, tick_price in ticks:
+            if offset > horizon:
+                break
+            price = tick_price
+        if not ticks or ticks[-1][0] < horizon:
+            price = None
+        profit = compute_profit(decision, price_before, price) if price is not None else None
+        scores[str(horizon)] = {
+            "price": price,
+            "profit": profit,
+            "success": profit > 0 if profit is not None else None
+        }
+    adverse = max((-compute_profit(decision, price_before, price) for _, price in ticks), default=0.0)
+    return scores, max(0.0, adverse)
+
+
+async def fetch_tick_price(coin_name):
+    """Fetch one tick for the shared price feed, bounded by the price deadline."""
+    try:
+        return await asyncio.wait_for(fetch_coin_price(coin_name), stage_limit("price"))
+    except asyncio.TimeoutError:
+        return None
+
+
+async def capture_price_path(coin_name, callback=None, budget=None):
+    """Capture the T0 price, sample ticks through the evaluation window and capture T1.
     
+    The window is 60 seconds unless EVAL_WINDOW_SECONDS overrides it (the offline
+    benchmarks use a short one) and is skipped when replaying a cassette. The T0 fetch
+    counts against the attempt's deadline budget; the window itself does not. Ticks come
+    from the coin's shared PriceFeed and are streamed as price_update events.
+    Returns {"price_before", "price_after", "ticks"} or None.
+    """
+    window_seconds = int(os.environ.get("EVAL_WINDOW_SECONDS", 60))
+    if is_replaying():
+        # Replayed prices are fixed, so waiting adds nothing
+        window_seconds = 0
     # Get price before
     print("Getting current price (T0)...")
     if callback:
         await callback.send_update("status", {"message": "Getting current price (T0)..."})
     
-    price_before = await get_coin_price(coin_name)
+    price_before = await get_coin_price(coin_name, budget.timeout_for("price") if budget else None)
     if price_before is None:
-        print("Failed to get initial price")
+        message = "Failed to get initial price"
+        if not get_upstream("coingecko").available():
+            message += " (CoinGecko circuit is open)"
+        print(message)
         if callback:
-            await callback.send_update("error", {"message": "Failed to get initial price"})
-        return False, None, None
+            await callback.send_update("error", {"message": message})
+        return None
+    started_at = time.time()
+    ticks = [(0.0, price_before)]
     
     print(f"Price at T0: ${price_before:.2f}")
     if callback:
@@ -175,30 +266,47 @@ async def evaluate_decision(coin_name, decision, system_prompt=None, callback=No
             "label": "Initial Price"
         })
     
-    # Wait 60 seconds with countdown updates
-    print("Waiting 60 seconds...")
+    # Sample the window from the shared feed, sending each tick and a countdown
+    print(f"Waiting {window_seconds} seconds...")
     if callback:
-        await callback.send_update("status", {"message": "Waiting 60 seconds..."})
+        await callback.send_update("status", {"message": f"Waiting {window_seconds} seconds..."})
     
-    # Send countdown updates every 5 seconds
-    for i in range(60, 0, -5):
-        await asyncio.sleep(5)
-        if callback:
-            await callback.send_update("countdown", {"seconds_remaining": i})
+    if window_seconds > 0:
+        feed = get_price_feed(coin_name, fetch_tick_price)
+        ends = time.monotonic() + window_seconds
+        last_tick = started_at
+        async with feed.watch():
+            while (remaining := ends - time.monotonic()) > 0:
+                for tick_time, price in await feed.wait_for_tick(last_tick, remaining):
+                    last_tick = tick_time
+                    offset = tick_time - started_at
+                    ticks.append((offset, price))
+                    if callback:
+                        await callback.send_update("price_update", {
+                            "price": price,
+                            "time": f"T0+{offset:.0f}s",
+                            "offset_seconds": offset,
+                            "label": f"Price at +{offset:.0f}s"
+                        })
+                if callback:
+                    await callback.send_update("countdown", {
+                        "seconds_remaining": max(0, round(ends - time.monotonic()))
+                    })
     
     # Get price after
-    print("Getting price after 60 seconds (T1)...")
+    print(f"Getting price after {window_seconds} seconds (T1)...")
     if callback:
-        await callback.send_update("status", {"message": "Getting price after 60 seconds (T1)..."})
+        await callback.send_update("status", {"message": f"Getting price after {window_seconds} seconds (T1)..."})
     
     price_after = await get_coin_price(coin_name)
     if price_after is None:
         print("Failed to get price after wait")
         if callback:
             await callback.send_update("error", {"message": "Failed to get price after wait"})
-        return False, None, None
+        return None
+    ticks.append((float(window_seconds), price_after))
     
-    print(f"Price at T1: ${price_after:.2f}")
+    print(f"Price at T1: ${price_after:.2f} ({len(ticks)} ticks sampled)")
     if callback:
         await callback.send_update("price_update", {
             "price": price_after,
@@ -206,15 +314,43 @@ async def evaluate_decision(coin_name, decision, system_prompt=None, callback=No
             "label": "Final Price"
         })
     
+    return {"price_before": price_before, "price_after": price_after, "ticks": ticks}
+
+
+async def capture_price_window(coin_name, callback=None, budget=None):
+    """Capture (T0, T1) around the evaluation window, or (None, None)."""
+    path = await capture_price_path(coin_name, callback, budget)
+    if path is None:
+        return None, None
+    return path["price_before"], path["price_after"]
+
+
+async def evaluate_decision(coin_name, decision, system_prompt=None, callback=None, budget=None):
+    """Evaluate a trading decision and return success status."""
+    print(f"\n{'='*60}")
+    print(f"Evaluating decision: {decision}")
+    print(f"{'='*60}")
+    
+    if callback:
+        await callback.send_update("status", {"message": f"Evaluating decision: {decision}"})
+    
+    path = await capture_price_path(coin_name, callback, budget)
+    if path is None:
+        return False, None, None
+    price_before, price_after = path["price_before"], path["price_after"]
+    
     # Calculate profit
-    if decision == "BUY":
-        profit = price_after - price_before
-    else:  # SELL
-        profit = price_before - price_after
+    profit = compute_profit(decision, price_before, price_after)
+    # The same sampled path scores every horizon inside the window at no extra wait
+    horizons, max_adverse_excursion = score_price_path(decision, price_before, path["ticks"], get_eval_horizons())
     
     print(f"Execution price: ${price_before:.2f}")
     print(f"Selling price: ${price_after:.2f}")
     print(f"Profit: ${profit:.2f}")
+    for horizon, score in horizons.items():
+        if score["profit"] is not None:
+            print(f"  {horizon}s horizon: ${score['profit']:.2f}")
+    print(f"Max adverse excursion: ${max_adverse_excursion:.2f}")
     
     # Success if profit > 0
     success = profit > 0
@@ -225,50 +361,182 @@ async def evaluate_decision(coin_name, decision, system_prompt=None, callback=No
             "success": success,
             "profit": profit,
             "price_before": price_before,
-            "price_after": price_after
+            "price_after": price_after,
+            "horizons": horizons,
+            "max_adverse_excursion": max_adverse_excursion,
+            "ticks": len(path["ticks"])
         })
     
     return success, price_before, price_after
 
 
-async def run_agent_with_prompt(coin_name, system_prompt):
-    """Run the agent with a specific system prompt."""
-    # Temporarily modify the system prompt file
-    prompt_path = Path(__file__).parent / "prompts" / "system.j2"
-    prompt_path.parent.mkdir(parents=True, exist_ok=True)
+async def run_agent_with_prompt(coin_name, system_prompt, budget=None, callback=None, progress_context=None,
+                                incremental=None):
+    """Run the agent with a specific system prompt, streaming its progress to callback.
     
-    # Save original prompt if it exists
-    original_prompt = None
-    if prompt_path.exists():
-        with open(prompt_path, "r", encoding="utf-8") as f:
-            original_prompt = f.read()
+    incremental=False researches from scratch; sessions compared against each other
+    (retries with a rewritten prompt, population variants) must not build on one another.
+    """
+    # The prompt is passed straight through rather than written to prompts/system.j2,
+    # so several workers on one box can run different prompts at the same time.
+    return await agent_main(
+        coin_name, system_prompt=system_prompt, budget=budget,
+        callback=callback, progress_context=progress_context, incremental=incremental
+    )
+
+
+async def check_stale_decision(budget, callback=None, **details):
+    """Report a decision whose research is older than STALE_DECISION_SECONDS.
     
-    # Write new prompt
+    Returns True if the decision is stale and must not be traded.
+    """
+    age = budget.elapsed()
+    max_age = stale_decision_seconds()
+    if age <= max_age:
+        return False
+    print(f"Decision is stale ({age:.0f}s old, limit {max_age:.0f}s); not trading it")
+    if callback:
+        await callback.send_update("stale_decision", {
+            "age_seconds": age,
+            "max_age_seconds": max_age,
+            **details
+        })
+    return True
+
+
+async def register_prompt_rewrite(coin_name, parent_prompt, updated_prompt, reason):
+    """Add a rewritten prompt to the registry with its lineage."""
     try:
-        with open(prompt_path, "w", encoding="utf-8") as f:
-            f.write(system_prompt)
-        
-        # Run agent (it will load the prompt from file)
-        result = await agent_main(coin_name)
-        
-        return result
-    finally:
-        # Always restore original prompt
-        if original_prompt is not None:
-            with open(prompt_path, "w", encoding="utf-8") as f:
-                f.write(original_prompt)
-        elif prompt_path.exists():
-            # If there was no original, we might want to keep the new one
-            # But for safety, let's restore the default
-            pass
+        await asyncio.to_thread(
+            get_prompt_registry().register, updated_prompt, prompt_hash(parent_prompt), reason, coin_name
+        )
+    except Exception as e:
+        print(f"Error registering prompt: {e}")
+
+
+async def record_attempt_outcome(session_id, attempt, coin_name, system_prompt, agent_result,
+                                 decision=None, price_before=None, price_after=None,
+                                 evaluation_ms=None, stale=False):
+    """Write one attempt to the run history store and prompt registry; never fails the run.
+    
+    Stale decisions are recorded but not scored. Returns True if the outcome promoted
+    the prompt to best for this coin.
+    """
+    agent_result = agent_result or {}
+    metrics = agent_result.get("metrics") or {}
+    structured = agent_result.get("structured_decision") or {}
+    
+    profit = success = None
+    if decision is None:
+        status = "no_decision"
+    elif stale:
+        status = "stale"
+    elif price_before is None or price_after is None:
+        status = "price_error"
+    else:
+        status = "evaluated"
+        profit = compute_profit(decision, price_before, price_after)
+        success = profit > 0
+    
+    try:
+        await asyncio.to_thread(
+            get_run_store().record_attempt,
+            session_id=session_id,
+            attempt=attempt,
+            coin=coin_name,
+            prompt_hash=prompt_hash(system_prompt),
+            decision=decision,
+            reason=structured.get("reason"),
+            status=status,
+            success=success,
+            price_before=price_before,
+            price_after=price_after,
+            profit=profit,
+            research_ms=metrics.get("research_ms"),
+            extraction_ms=metrics.get("extraction_ms"),
+            evaluation_ms=evaluation_ms,
+            total_ms=metrics.get("total_ms", 0.0) + (evaluation_ms or 0.0),
+            input_tokens=metrics.get("input_tokens"),
+            output_tokens=metrics.get("output_tokens"),
+            extraction_input_tokens=metrics.get("extraction_input_tokens"),
+            extraction_output_tokens=metrics.get("extraction_output_tokens"),
+            cost_usd=metrics.get("cost_usd"),
+            log_file=str(agent_result["log_file"]) if agent_result.get("log_file") else None,
+        )
+    except Exception as e:
+        print(f"Error recording attempt in run store: {e}")
+    
+    if status != "evaluated":
+        return False
+    try:
+        await asyncio.to_thread(get_model_router().record_outcome, metrics.get("model_calls"), success)
+    except Exception as e:
+        print(f"Error recording model outcome: {e}")
+    try:
+        return await asyncio.to_thread(
+            get_prompt_registry().record_outcome, coin_name, prompt_hash(system_prompt), success, profit
+        )
+    except Exception as e:
+        print(f"Error recording prompt outcome: {e}")
+        return False
 
 
-async def run_with_feedback_loop(coin_name, max_retries=3, callback=None):
-    """Run the agent with feedback loop for up to max_retries times."""
-    load_env_file()
+async def report_unavailable_upstreams(callback=None):
+    """Fail fast with an SSE error if an upstream every attempt needs has an open circuit.
+    
+    Returns True if the run should stop now instead of spending an attempt and a window.
+    """
+    down = unavailable_upstreams(["anthropic", "coingecko"])
+    if not down:
+        return False
+    message = "; ".join(f"{upstream.name} is unavailable (retry in {upstream.breaker.retry_in():.0f}s)" for upstream in down)
+    print(f"Stopping run: {message}")
+    if callback:
+        await callback.send_update("error", {
+            "message": f"Upstream unavailable: {message}",
+            "upstreams": {upstream.name: upstream.metrics() for upstream in down}
+        })
+    return True
+
+
+def discard_speculation(speculation):
+    """Cancel a speculative agent run whose prompt is no longer the one to use."""
+    task = speculation["task"]
+    if not task.done():
+        task.cancel()
+    # Retrieve the outcome so a failed speculative run never warns as unhandled
+    task.add_done_callback(lambda done: done.cancelled() or done.exception())
+
+
+def starting_prompt(registry, coin_name, seed_prompt):
+    """Pick the prompt a run starts from: usually the promoted one, sometimes a candidate.
+    
+    With probability PROMPT_TRIAL_PROBABILITY (default 0.3) the run starts from the best
+    prompt that has not had PROMPT_MIN_TRIALS trades yet, so rewrites keep collecting
+    trials across runs and can qualify for promotion. Returns (prompt, trialing).
+    """
+    registry.register(seed_prompt, reason="seed: prompts/system.j2", coin=coin_name)
+    if random.random() < float(os.environ.get("PROMPT_TRIAL_PROBABILITY", 0.3)):
+        candidate = registry.trial_candidate(coin_name)
+        if candidate:
+            print(f"Trialing unpromoted prompt {prompt_hash(candidate)} for {coin_name}")
+            return candidate, True
+    # Otherwise start from the best-performing prompt for this coin, if one has been promoted
+    return registry.best_prompt(coin_name) or seed_prompt, False
+
+
+async def run_with_feedback_loop(coin_name, max_retries=3, callback=None, pipelined=False):
+    """Run the agent with feedback loop for up to max_retries times.
+    
+    With pipelined=True, attempt N+1's research starts during attempt N's evaluation
+    wait using the current prompt. The speculative result is used if the next attempt
+    still runs that prompt (a profitable trade keeps it) and discarded otherwise.
+    """
+    seed_prompt = get_runtime().system_prompt
     
     logs_dir = setup_logging_directory()
-    system_prompt = load_system_prompt()
+    registry = get_prompt_registry()
+    system_prompt, trialing = await asyncio.to_thread(starting_prompt, registry, coin_name, seed_prompt)
     
     print(f"\n{'='*60}")
     print(f"Starting runner for {coin_name}")
@@ -279,15 +547,22 @@ async def run_with_feedback_loop(coin_name, max_retries=3, callback=None):
         await callback.send_update("status", {
             "message": f"Starting runner for {coin_name}",
             "coin_name": coin_name,
-            "max_retries": max_retries
+            "max_retries": max_retries,
+            "prompt_hash": prompt_hash(system_prompt)
         })
     
+    session_id = getattr(callback, "session_id", None) or str(uuid.uuid4())
     attempt = 0
     current_prompt = system_prompt
-    last_successful_prompt = None
     overall_success = False
+    speculation = None
+    speculation_stats = {"reused": 0, "discarded": 0}
     
     while attempt < max_retries:
+        if await report_unavailable_upstreams(callback):
+            if speculation is not None:
+                discard_speculation(speculation)
+            return overall_success, attempt
         attempt += 1
         print(f"\n{'='*60}")
         print(f"ATTEMPT {attempt}/{max_retries}")
@@ -307,13 +582,31 @@ async def run_with_feedback_loop(coin_name, max_retries=3, callback=None):
                 "message": f"Running agent (Attempt {attempt}/{max_retries})..."
             })
         
-        agent_result = await run_agent_with_prompt(coin_name, current_prompt)
+        if speculation is not None and speculation["prompt"] == current_prompt:
+            print("Using research started during the previous evaluation window")
+            speculation_stats["reused"] += 1
+            budget = speculation["budget"]
+            agent_result = await speculation["task"]
+        else:
+            if speculation is not None:
+                print("Discarding speculative research: the prompt changed")
+                speculation_stats["discarded"] += 1
+                discard_speculation(speculation)
+            budget = DeadlineBudget()
+            # Only the first attempt of the promoted prompt is a plain repeat run; a prompt on
+            # trial and every retry are scored as trials, so they research from scratch
+            agent_result = await run_agent_with_prompt(
+                coin_name, current_prompt, budget, callback, {"attempt": attempt},
+                incremental=None if attempt == 1 and not trialing else False
+            )
+        speculation = None
         
-        # Get the latest log file right after agent run
-        log_file = find_latest_log_file(coin_name, logs_dir)
+        # Use this run's own log file; fall back to the latest one for the coin
+        log_file = (agent_result or {}).get("log_file") or find_latest_log_file(coin_name, logs_dir)
         
         if not agent_result or not agent_result.get("structured_decision"):
             print("Failed to get decision from agent")
+            await record_attempt_outcome(session_id, attempt, coin_name, current_prompt, agent_result)
             if callback:
                 await callback.send_update("status", {
                     "message": "Failed to get decision from agent",
@@ -340,6 +633,7 @@ async def run_with_feedback_loop(coin_name, max_retries=3, callback=None):
                             log_content, current_prompt, coin_name
                         )
                         if updated_prompt:
+                            await register_prompt_rewrite(coin_name, current_prompt, updated_prompt, reason)
                             current_prompt = updated_prompt
                             print(f"Updated prompt. Reason: {reason}")
                             if callback:
@@ -360,10 +654,44 @@ async def run_with_feedback_loop(coin_name, max_retries=3, callback=None):
                 "attempt": attempt
             })
         
+        # A decision researched too long ago no longer says anything about the next
+        # minute; report it and retry with the same prompt instead of scoring it.
+        if await check_stale_decision(budget, callback, decision=decision, attempt=attempt):
+            await record_attempt_outcome(
+                session_id, attempt, coin_name, current_prompt, agent_result, decision, stale=True
+            )
+            continue
+        
+        if pipelined and attempt < max_retries:
+            # The next prompt only changes if this trade loses, so start researching
+            # with the current prompt while the evaluation window runs.
+            speculative_budget = DeadlineBudget()
+            speculation = {
+                "prompt": current_prompt,
+                "budget": speculative_budget,
+                "task": asyncio.create_task(run_agent_with_prompt(
+                    coin_name, current_prompt, speculative_budget,
+                    callback, {"attempt": attempt + 1, "speculative": True}, incremental=False
+                ))
+            }
+        
         # Evaluate the decision
+        evaluation_started = time.perf_counter()
         success, price_before, price_after = await evaluate_decision(
-            coin_name, decision, current_prompt, callback
+            coin_name, decision, current_prompt, callback, budget
         )
+        promoted = await record_attempt_outcome(
+            session_id, attempt, coin_name, current_prompt, agent_result, decision,
+            price_before, price_after, (time.perf_counter() - evaluation_started) * 1000
+        )
+        if promoted:
+            print(f"Prompt {prompt_hash(current_prompt)} promoted to best prompt for {coin_name}")
+            if callback:
+                await callback.send_update("prompt_promoted", {
+                    "prompt_hash": prompt_hash(current_prompt),
+                    "stats": await asyncio.to_thread(registry.stats, coin_name, prompt_hash(current_prompt)),
+                    "attempt": attempt
+                })
         
         if success:
             print(f"\n{'='*60}")
@@ -382,8 +710,6 @@ async def run_with_feedback_loop(coin_name, max_retries=3, callback=None):
                         "attempt": attempt
                     })
             
-            # Track successful prompt
-            last_successful_prompt = current_prompt
             overall_success = True
             
             if callback:
@@ -447,6 +773,7 @@ async def run_with_feedback_loop(coin_name, max_retries=3, callback=None):
                         if updated_prompt:
                             print(f"Updated prompt received.")
                             print(f"Reason: {reason}")
+                            await register_prompt_rewrite(coin_name, current_prompt, updated_prompt, reason)
                             current_prompt = updated_prompt
                             print("Will retry with updated prompt...\n")
                             
@@ -462,20 +789,23 @@ async def run_with_feedback_loop(coin_name, max_retries=3, callback=None):
                 else:
                     print("No log file found. Will retry with same prompt...\n")
     
-    # Write final successful prompt back to file if we had success
-    if last_successful_prompt:
-        prompt_path = Path(__file__).parent / "prompts" / "system.j2"
-        prompt_path.parent.mkdir(parents=True, exist_ok=True)
-        with open(prompt_path, "w", encoding="utf-8") as f:
-            f.write(last_successful_prompt)
-        print(f"\n{'='*60}")
-        print("Final successful prompt written to prompts/system.j2")
-        print(f"{'='*60}\n")
-        
+    if speculation is not None:
+        speculation_stats["discarded"] += 1
+        discard_speculation(speculation)
+    if pipelined:
+        speculated = speculation_stats["reused"] + speculation_stats["discarded"]
+        speculation_stats["reuse_rate"] = speculation_stats["reused"] / speculated if speculated else None
+        print(f"Pipelined attempts: {speculation_stats['reused']} reused, "
+              f"{speculation_stats['discarded']} discarded")
         if callback:
-            await callback.send_update("status", {
-                "message": "Final successful prompt written to prompts/system.j2"
-            })
+            await callback.send_update("pipeline_stats", speculation_stats)
+    
+    # Promotion is decided by the registry statistics, not by a single profitable trade;
+    # prompts/system.j2 stays as the seed prompt.
+    best = await asyncio.to_thread(registry.top_prompts, coin_name, 1)
+    if best:
+        print(f"Top-scoring prompt for {coin_name}: {best[0]['hash']} "
+              f"(win rate {best[0]['win_rate']:.0%} over {best[0]['trials']} trades)")
     
     if not overall_success:
         print(f"\n{'='*60}")
@@ -492,9 +822,216 @@ async def run_with_feedback_loop(coin_name, max_retries=3, callback=None):
     return overall_success, attempt
 
 
-async def main(coin_name):
+# Emphases appended to the seed prompt to fill a population that has no history yet
+PROMPT_FOCUSES = (
+    "Weigh the last 24 hours of price momentum and volume more heavily than news.",
+    "Weigh news, announcements and market sentiment more heavily than recent price action.",
+    "Look for signs that the latest move is overextended and favor the contrarian side.",
+    "Compare the coin against the broader crypto market before deciding.",
+    "Only trust signals that at least two independent sources agree on.",
+)
+
+
+def prompt_variant(seed_prompt, focus):
+    """The seed prompt with one strategy emphasis appended."""
+    return f"{seed_prompt.rstrip()}\n\nStrategy emphasis: {focus}\n"
+
+
+def seed_population(registry, coin_name, seed_prompt, population_size):
+    """Pick the initial prompt variants: the best registered prompts and the seed.
+    
+    Slots the registry cannot fill get variants of the seed with different strategy
+    emphases, registered as its children, so generation 1 compares distinct prompts.
+    Only a population larger than the list of emphases repeats the seed.
+    """
+    prompts = [candidate["content"] for candidate in registry.top_prompts(coin_name, population_size)]
+    if seed_prompt not in prompts:
+        prompts.append(seed_prompt)
+    prompts = prompts[:population_size]
+    for focus in PROMPT_FOCUSES:
+        if len(prompts) >= population_size:
+            break
+        variant = prompt_variant(seed_prompt, focus)
+        if variant not in prompts:
+            registry.register(variant, prompt_hash(seed_prompt), f"variant: {focus}", coin_name)
+            prompts.append(variant)
+    while len(prompts) < population_size:
+        prompts.append(seed_prompt)
+    return prompts
+
+
+async def breed_next_generation(coin_name, ranked, population_size, callback=None):
+    """Keep the top half of a ranked generation and rewrite the losers' prompts."""
+    survivors = max(1, population_size // 2)
+    next_prompts = [candidate["prompt"] for candidate in ranked[:survivors]]
+    losers = [candidate for candidate in ranked[survivors:] if not candidate["success"]]
+    
+    async def rewrite(candidate):
+        log_file = (candidate["agent_result"] or {}).get("log_file")
+        log_content = read_log_file(log_file) if log_file else None
+        if not log_content:
+            return None
+        updated_prompt, reason = await get_updated_prompt(log_content, candidate["prompt"], coin_name)
+        if updated_prompt:
+            await register_prompt_rewrite(coin_name, candidate["prompt"], updated_prompt, reason)
+            if callback:
+                await callback.send_update("prompt_updated", {
+                    "reason": reason,
+                    "parent_hash": prompt_hash(candidate["prompt"]),
+                    "prompt_hash": prompt_hash(updated_prompt)
+                })
+        return updated_prompt
+    
+    children = await asyncio.gather(*(rewrite(candidate) for candidate in losers))
+    next_prompts.extend(child for child in children if child)
+    
+    # Fill any remaining slots with the winners, best first
+    index = 0
+    while len(next_prompts) < population_size:
+        next_prompts.append(ranked[index % survivors]["prompt"])
+        index += 1
+    return next_prompts[:population_size]
+
+
+async def run_population(coin_name, population_size=4, generations=3, callback=None):
+    """Run N prompt variants concurrently per generation, scored against one shared price window."""
+    seed_prompt = get_runtime().system_prompt
+    setup_logging_directory()
+    registry = get_prompt_registry()
+    await asyncio.to_thread(registry.register, seed_prompt, None, "seed: prompts/system.j2", coin_name)
+    
+    session_id = getattr(callback, "session_id", None) or str(uuid.uuid4())
+    prompts = await asyncio.to_thread(seed_population, registry, coin_name, seed_prompt, population_size)
+    attempt = 0
+    history = []
+    
+    print(f"\n{'='*60}")
+    print(f"Starting population run for {coin_name}")
+    print(f"Population: {population_size}, generations: {generations}")
+    print(f"{'='*60}\n")
+    
+    for generation in range(1, generations + 1):
+        if await report_unavailable_upstreams(callback):
+            return history
+        print(f"\n{'='*60}")
+        print(f"GENERATION {generation}/{generations}")
+        print(f"{'='*60}\n")
+        if callback:
+            await callback.send_update("generation_start", {
+                "generation": generation,
+                "generations": generations,
+                "prompt_hashes": [prompt_hash(prompt) for prompt in prompts]
+            })
+        
+        # Research all variants concurrently under one budget, since they share T0
+        budget = DeadlineBudget()
+        results = await asyncio.gather(
+            *(run_agent_with_prompt(
+                coin_name, prompt, budget, callback,
+                {"generation": generation, "prompt_hash": prompt_hash(prompt)}, incremental=False
+            ) for prompt in prompts),
+            return_exceptions=True
+        )
+        
+        candidates = []
+        for prompt, result in zip(prompts, results):
+            if isinstance(result, Exception):
+                print(f"Variant {prompt_hash(prompt)} failed: {result}")
+                result = None
+            structured = (result or {}).get("structured_decision") or {}
+            candidates.append({
+                "prompt": prompt,
+                "agent_result": result,
+                "decision": structured.get("decision"),
+                "profit": None,
+                "success": False,
+                "stale": False
+            })
+        
+        decided = [candidate for candidate in candidates if candidate["decision"]]
+        # Every variant waited for the slowest one, so they all share its age
+        if decided and await check_stale_decision(
+            budget, callback, decisions=[candidate["decision"] for candidate in decided], generation=generation
+        ):
+            for candidate in decided:
+                candidate["stale"] = True
+            decided = []
+        price_before = price_after = None
+        evaluation_ms = None
+        if decided:
+            # One shared T0/T1 capture scores every variant, so the comparison is fair
+            # and the generation costs a single window.
+            evaluation_started = time.perf_counter()
+            price_before, price_after = await capture_price_window(coin_name, callback, budget)
+            evaluation_ms = (time.perf_counter() - evaluation_started) * 1000
+        
+        for candidate in candidates:
+            attempt += 1
+            decision = candidate["decision"]
+            if decision and not candidate["stale"] and price_before is not None:
+                candidate["profit"] = compute_profit(decision, price_before, price_after)
+                candidate["success"] = candidate["profit"] > 0
+            await record_attempt_outcome(
+                session_id, attempt, coin_name, candidate["prompt"], candidate["agent_result"],
+                decision, price_before, price_after, evaluation_ms if decision else None,
+                stale=candidate["stale"]
+            )
+        
+        # Rank by profit in this window, breaking ties with each prompt's track record
+        hashes = {prompt_hash(candidate["prompt"]) for candidate in candidates}
+        scores = await asyncio.to_thread(
+            lambda: {content_hash: registry.stats(coin_name, content_hash)["score"] for content_hash in hashes}
+        )
+        ranked = sorted(
+            candidates,
+            key=lambda candidate: (
+                candidate["profit"] if candidate["profit"] is not None else float("-inf"),
+                scores[prompt_hash(candidate["prompt"])]
+            ),
+            reverse=True
+        )
+        ranking = [
+            {
+                "rank": rank,
+                "prompt_hash": prompt_hash(candidate["prompt"]),
+                "decision": candidate["decision"],
+                "profit": candidate["profit"],
+                "success": candidate["success"],
+                "score": scores[prompt_hash(candidate["prompt"])]
+            }
+            for rank, candidate in enumerate(ranked, start=1)
+        ]
+        history.append({"generation": generation, "price_before": price_before,
+                        "price_after": price_after, "ranking": ranking})
+        
+        for entry in ranking:
+            profit = f"${entry['profit']:.2f}" if entry["profit"] is not None else "n/a"
+            print(f"#{entry['rank']} {entry['prompt_hash']} {entry['decision'] or 'NO DECISION'} {profit}")
+        if callback:
+            await callback.send_update("population_ranking", {
+                "generation": generation,
+                "price_before": price_before,
+                "price_after": price_after,
+                "ranking": ranking
+            })
+        
+        if generation < generations:
+            prompts = await breed_next_generation(coin_name, ranked, population_size, callback)
+    
+    if callback:
+        await callback.send_update("complete", {
+            "success": any(entry["success"] for entry in history[-1]["ranking"]) if history else False,
+            "attempts": attempt,
+            "generations": generations,
+            "coin_name": coin_name
+        })
+    
+    return history
+
+
+async def main(coin_name, pipelined=False):
     """Main entry point."""
-    success, attempts = await run_with_feedback_loop(coin_name, max_retries=3)
+    success, attempts = await run_with_feedback_loop(coin_name, max_retries=3, pipelined=pipelined)
     
     print(f"\n{'='*60}")
     print("FINAL SUMMARY")
@@ -507,12 +1044,121 @@ async def main(coin_name):
     return success, attempts
 
 
+async def keep_lease_alive(broker, job_id, worker_id, lease_seconds, job_task):
+    """Renew a job lease until cancelled; cancels job_task once the lease is lost.
+
+    A lost lease means the job may already have been claimed again by another worker,
+    so this worker must stop running (and trading) it.
+    """
+    while True:
+        await asyncio.sleep(lease_seconds / 3)
+        renewed = await asyncio.to_thread(broker.renew_lease, job_id, worker_id, lease_seconds)
+        if not renewed:
+            print(f"Lost lease on job {job_id}; stopping it")
+            job_task.cancel()
+            return
+
+
+async def run_claimed_job(broker, job, worker_id, lease_seconds=DEFAULT_LEASE_SECONDS):
+    """Run one claimed job, publishing its progress to the broker."""
+    job_id = job["id"]
+    callback = JobEventCallback(broker, job_id)
+    if job["claims"] > 1:
+        await callback.send_update("status", {
+            "message": f"Run picked up again by worker {worker_id} after its previous lease expired"
+        })
+    
+    job_task = asyncio.create_task(run_with_feedback_loop(
+        job["coin_name"], job["max_retries"], callback,
+        pipelined=os.environ.get("PIPELINED_ATTEMPTS") == "1"
+    ))
+    lease_task = asyncio.create_task(keep_lease_alive(broker, job_id, worker_id, lease_seconds, job_task))
+    error = None
+    try:
+        await job_task
+    except asyncio.CancelledError:
+        if not lease_task.done():
+            # This worker itself is being cancelled, not the job
+            raise
+        # The job belongs to whichever worker holds the lease now; it finishes it
+        return
+    except Exception as e:
+        error = f"Error during execution: {str(e)}"
+        await callback.send_update("error", {"message": error})
+    finally:
+        lease_task.cancel()
+    
+    await asyncio.to_thread(broker.finish, job_id, worker_id, error)
+
+
+async def publish_upstream_metrics(broker, interval):
+    """Publish this process's upstream metrics to the queue store for GET /api/upstreams."""
+    while True:
+        try:
+            await asyncio.to_thread(broker.publish_upstreams, process_id(), upstream_metrics())
+        except Exception as e:
+            print(f"Error publishing upstream metrics: {e}")
+        await asyncio.sleep(interval)
+
+
+async def run_worker(poll_interval=1.0, lease_seconds=DEFAULT_LEASE_SECONDS, once=False):
+    """Claim and run queued jobs forever (or until the queue is empty if once=True)."""
+    # Build the shared session config before the first job, not during it
+    await asyncio.to_thread(get_runtime)
+    broker = SQLiteJobBroker()
+    worker_id = make_worker_id()
+    print(f"Worker {worker_id} polling {broker.db_path}")
+    publisher = asyncio.create_task(
+        publish_upstream_metrics(broker, float(os.environ.get("UPSTREAM_METRICS_SECONDS", 10)))
+    )
+    
+    try:
+        while True:
+            job = await asyncio.to_thread(broker.claim, worker_id, lease_seconds)
+            if job is None:
+                if once:
+                    return
+                await asyncio.sleep(poll_interval)
+                continue
+            
+            print(f"Worker {worker_id} claimed job {job['id']} ({job['coin_name']})")
+            await run_claimed_job(broker, job, worker_id, lease_seconds)
+    finally:
+        publisher.cancel()
+        # Leave the final counts behind for the API server
+        try:
+            await asyncio.to_thread(broker.publish_upstreams, process_id(), upstream_metrics())
+        except Exception as e:
+            print(f"Error publishing upstream metrics: {e}")
+
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Run agent with feedback loop")
-    parser.add_argument("--coin-name", required=True, help="Coin name to run (e.g., BTC, ETH)")
+    parser.add_argument("--coin-name", help="Coin name to run (e.g., BTC, ETH)")
+    parser.add_argument("--worker", action="store_true", help="Run as a queue worker that claims runs enqueued by api_server")
+    parser.add_argument("--once", action="store_true", help="With --worker, exit once the queue is empty")
+    parser.add_argument("--record", metavar="CASSETTE", help="Record all model, SDK and price interactions to a cassette file")
+    parser.add_argument("--replay", metavar="CASSETTE", help="Replay a recorded cassette with no network access")
+    parser.add_argument("--pipelined", action="store_true", help="Overlap the next attempt's research with the evaluation wait")
+    parser.add_argument("--population", type=int, default=0, help="Run N prompt variants concurrently per generation")
+    parser.add_argument("--generations", type=int, default=3, help="Generations to run in population mode (default: 3)")
     args = parser.parse_args()
     
-    result = anyio.run(main, args.coin_name)
+    if args.record or args.replay:
+        os.environ["CASSETTE_MODE"] = "record" if args.record else "replay"
+        os.environ["CASSETTE_PATH"] = args.record or args.replay
+    
+    if args.worker:
+        anyio.run(run_worker, 1.0, DEFAULT_LEASE_SECONDS, args.once)
+        raise SystemExit(0)
+    if not args.coin_name:
+        parser.error("--coin-name is required unless --worker is given")
+    
+    if args.population:
+        anyio.run(run_population, args.coin_name, args.population, args.generations)
+        raise SystemExit(0)
+    
+    result = anyio.run(main, args.coin_name, args.pipelined)
     success, attempts = result
     
     if success:
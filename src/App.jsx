@@ -4,12 +4,14 @@ import RunButton from './components/RunButton'
 import StatusPanel from './components/StatusPanel'
 import LogViewer from './components/LogViewer'
 import ProgressTracker from './components/ProgressTracker'
+import { connect as connectRunSocket, startRun } from './runSocket'
 
 function App() {
   const [selectedCoin, setSelectedCoin] = useState('BTC')
   const [isRunning, setIsRunning] = useState(false)
   const [logs, setLogs] = useState([])
   const [currentStatus, setCurrentStatus] = useState(null)
+  const [sessionId, setSessionId] = useState(null)
 
   const handleRun = async () => {
     if (isRunning) return
@@ -17,7 +19,28 @@ function App() {
     setIsRunning(true)
     setLogs([])
     setCurrentStatus(null)
+    setSessionId(null)
 
+    // Runs share the page's WebSocket; the per-run SSE stream is the fallback
+    try {
+      await connectRunSocket()
+    } catch (error) {
+      console.warn('WebSocket unavailable, falling back to SSE:', error)
+      await runWithSse()
+      return
+    }
+
+    try {
+      await startRun(selectedCoin, 3, handleUpdate)
+    } catch (error) {
+      handleUpdate({
+        type: 'error',
+        data: { message: `Failed to start: ${error.message}` }
+      })
+    }
+  }
+
+  const runWithSse = async () => {
     try {
       // Use fetch for POST with SSE streaming
       const response = await fetch('/api/run', {
@@ -101,12 +124,12 @@ function App() {
     setLogs(prev => [...prev, logEntry])
     setCurrentStatus(update)
 
+    if (update.type === 'queued') {
+      setSessionId(update.data.session_id)
+    }
+
     if (update.type === 'complete' || update.type === 'error') {
       setIsRunning(false)
-      if (eventSource) {
-        eventSource.close()
-        setEventSource(null)
-      }
     }
   }
 
@@ -168,7 +191,7 @@ function App() {
 
           {/* Right Column - Logs */}
           <div className="lg:col-span-2">
-            <LogViewer logs={logs} isRunning={isRunning} />
+            <LogViewer logs={logs} isRunning={isRunning} sessionId={sessionId} />
           </div>
         </div>
       </div>
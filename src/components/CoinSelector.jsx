@@ -1,4 +1,6 @@
-const coins = [
+import { useEffect, useState } from 'react'
+
+const defaultCoins = [
   { symbol: 'BTC', name: 'Bitcoin' },
   { symbol: 'ETH', name: 'Ethereum' },
   { symbol: 'USDT', name: 'Tether' },
@@ -12,6 +14,18 @@ const coins = [
 ]
 
 function CoinSelector({ selectedCoin, onCoinChange, disabled }) {
+  const [coins, setCoins] = useState(defaultCoins)
+
+  useEffect(() => {
+    // The built-in list shows immediately; the server's ranked list replaces it when it arrives
+    fetch('/api/coins?limit=50')
+      .then((response) => (response.ok ? response.json() : null))
+      .then((data) => {
+        if (data?.coins?.length) setCoins(data.coins)
+      })
+      .catch(() => {})
+  }, [])
+
   const selectedCoinData = coins.find(c => c.symbol === selectedCoin)
   
   return (
@@ -28,7 +42,7 @@ function CoinSelector({ selectedCoin, onCoinChange, disabled }) {
           className="w-full px-4 py-4 bg-gray-700/50 border-2 border-gray-600 rounded-xl text-white focus:outline-none focus:ring-2 focus:ring-blue-500 focus:border-blue-500 disabled:opacity-50 disabled:cursor-not-allowed transition-all appearance-none cursor-pointer hover:border-gray-500"
         >
           {coins.map((coin) => (
-            <option key={coin.symbol} value={coin.symbol}>
+            <option key={coin.id || coin.symbol} value={coin.symbol}>
               {coin.symbol} - {coin.name}
             </option>
           ))}
@@ -1,12 +1,10 @@
-import { useEffect, useRef, useState } from 'react'
+import { useState } from 'react'
+import VirtualList from './VirtualList'
+import SessionLog from './SessionLog'
 
-function LogViewer({ logs, isRunning }) {
-  const logEndRef = useRef(null)
+function LogViewer({ logs, isRunning, sessionId }) {
   const [expandedLogs, setExpandedLogs] = useState(new Set())
-
-  useEffect(() => {
-    logEndRef.current?.scrollIntoView({ behavior: 'smooth' })
-  }, [logs])
+  const [view, setView] = useState('events')
 
   const toggleExpand = (logId) => {
     setExpandedLogs(prev => {
@@ -37,12 +35,28 @@ function LogViewer({ logs, isRunning }) {
         return '📊'
       case 'prompt_updated':
         return '🧠'
+      case 'prompt_promoted':
+        return '🏆'
+      case 'queued':
+        return '📥'
+      case 'stale_decision':
+        return '⌛'
+      case 'agent_tool_start':
+        return '🔧'
+      case 'agent_tool_end':
+        return '🔩'
+      case 'agent_text':
+        return '💬'
+      case 'agent_research_done':
+        return '🔬'
       case 'countdown':
         return '⏱️'
       case 'price_update':
         return '💰'
       case 'complete':
         return '🏁'
+      case 'session_log':
+        return '🗂️'
       default:
         return 'ℹ️'
     }
@@ -99,6 +113,22 @@ function LogViewer({ logs, isRunning }) {
         return `Waiting... ${log.data.seconds_remaining}s remaining`
       case 'prompt_updated':
         return `🧠 AI Learning: ${log.data.reason}`
+      case 'prompt_promoted':
+        return `🏆 Prompt ${log.data.prompt_hash} promoted (win rate ${Math.round((log.data.stats?.win_rate ?? 0) * 100)}% over ${log.data.stats?.trials} trades)`
+      case 'session_log':
+        return `Agent log: ${log.data.log_file}`
+      case 'queued':
+        return `Queued run ${log.data.session_id} for ${log.data.coin_name}`
+      case 'stale_decision':
+        return `⌛ Stale ${log.data.decision || 'generation'} decision not traded (${Math.round(log.data.age_seconds)}s old, limit ${log.data.max_age_seconds}s)`
+      case 'agent_tool_start':
+        return `Calling ${log.data.server ? `${log.data.server}/` : ''}${log.data.tool}${log.data.input ? ` (${log.data.input})` : ''}`
+      case 'agent_tool_end':
+        return `${log.data.tool} ${log.data.is_error ? 'failed' : 'returned'}${log.data.duration_ms != null ? ` in ${(log.data.duration_ms / 1000).toFixed(1)}s` : ''}`
+      case 'agent_text':
+        return log.data.text
+      case 'agent_research_done':
+        return `Research finished after ${(log.data.elapsed_ms / 1000).toFixed(1)}s with ${log.data.tool_calls} tool calls${log.data.timed_out ? ' (deadline reached)' : ''}`
       case 'success':
         return `✅ SUCCESS: ${log.data.message}`
       case 'failure':
@@ -119,7 +149,6 @@ function LogViewer({ logs, isRunning }) {
 
     return (
       <div
-        key={log.id}
         className={`p-4 rounded-xl border-l-4 ${getLogColor(log.type, log.data)} transition-all transform hover:scale-[1.01] ${
           isRunning && isLastLog ? 'ring-2 ring-blue-500/50' : ''
         }`}
@@ -181,6 +210,24 @@ function LogViewer({ logs, isRunning }) {
               </div>
             )}
 
+            {/* Horizon Scores */}
+            {(log.type === 'evaluation' || log.type === 'evaluation_result') && log.data.horizons && (
+              <div className={`mt-3 transition-all ${isExpanded ? 'block' : 'hidden'}`}>
+                <div className="flex flex-wrap gap-2 text-xs font-mono">
+                  {Object.entries(log.data.horizons).filter(([, score]) => score.profit != null).map(([horizon, score]) => (
+                    <span key={horizon} className={`px-2 py-1 rounded border ${score.success ? 'border-green-500 text-green-400' : 'border-red-500 text-red-400'}`}>
+                      {horizon}s: {score.profit >= 0 ? '+' : ''}{score.profit.toFixed(2)}
+                    </span>
+                  ))}
+                  {log.data.max_adverse_excursion != null && (
+                    <span className="px-2 py-1 rounded border border-yellow-500 text-yellow-400">
+                      MAE: {log.data.max_adverse_excursion.toFixed(2)}
+                    </span>
+                  )}
+                </div>
+              </div>
+            )}
+
             {/* System Prompt Display (for attempt_start) */}
             {log.type === 'attempt_start' && log.data.system_prompt && (
               <div className={`mt-3 pt-3 border-t border-gray-600/50 transition-all ${isExpanded ? 'block' : 'hidden'}`}>
@@ -237,6 +284,23 @@ function LogViewer({ logs, isRunning }) {
             Execution Log
           </span>
         </h2>
+        {sessionId && (
+          <div className="flex items-center gap-1 text-sm">
+            {[['events', 'Events'], ['agent', 'Agent log']].map(([value, label]) => (
+              <button
+                key={value}
+                onClick={() => setView(value)}
+                className={`px-3 py-1 rounded-full border transition-colors ${
+                  view === value
+                    ? 'border-blue-500/50 bg-blue-500/20 text-blue-300'
+                    : 'border-gray-700 text-gray-400 hover:text-gray-300'
+                }`}
+              >
+                {label}
+              </button>
+            ))}
+          </div>
+        )}
         {isRunning && (
           <div className="flex items-center gap-2 px-3 py-1.5 bg-green-500/20 border border-green-500/30 rounded-full">
             <div className="w-2 h-2 bg-green-500 rounded-full animate-pulse"></div>
@@ -245,18 +309,24 @@ function LogViewer({ logs, isRunning }) {
         )}
       </div>
       
-      <div className="flex-1 overflow-y-auto p-5 space-y-3 custom-scrollbar">
-        {logs.length === 0 ? (
-          <div className="text-center text-gray-500 py-12">
-            <div className="text-6xl mb-4">🤖</div>
-            <p className="text-lg">No logs yet.</p>
-            <p className="text-sm mt-2">Click "Start AI Analysis" to begin.</p>
-          </div>
-        ) : (
-          logs.map(renderLogContent)
-        )}
-        <div ref={logEndRef} />
-      </div>
+      {view === 'agent' && sessionId ? (
+        <SessionLog key={sessionId} sessionId={sessionId} isRunning={isRunning} />
+      ) : logs.length === 0 ? (
+        <div className="flex-1 text-center text-gray-500 py-12">
+          <div className="text-6xl mb-4">🤖</div>
+          <p className="text-lg">No logs yet.</p>
+          <p className="text-sm mt-2">Click "Start AI Analysis" to begin.</p>
+        </div>
+      ) : (
+        <VirtualList
+          items={logs}
+          getKey={(log) => log.id}
+          renderItem={renderLogContent}
+          followTail
+          className="flex-1 overflow-y-auto p-5 custom-scrollbar"
+          rowClassName="pb-3"
+        />
+      )}
     </div>
   )
 }
@@ -0,0 +1,176 @@
+import { useCallback, useEffect, useRef, useState } from 'react'
+import VirtualList from './VirtualList'
+
+// Pages through a run's agent logs (GET /api/runs/{id}/log) by byte offset. Pages are
+// fetched as the list is scrolled to its end, and re-polled while the run is writing.
+// Mount it with key={sessionId} so a new run starts from a clean state.
+
+const PAGE_SIZE = 200
+const POLL_MS = 2000
+const ENTRY_TYPES = [
+  'agent_message',
+  'tool_call',
+  'result_success',
+  'result_error',
+  'user_prompt',
+  'session_start',
+  'session_end',
+  'structured_extraction',
+  'structured_extraction_error',
+]
+
+const summarize = (data) => {
+  const text = JSON.stringify(data)
+  return text.length > 300 ? `${text.slice(0, 300)}…` : text
+}
+
+function SessionLog({ sessionId, isRunning }) {
+  const [logNames, setLogNames] = useState([])
+  const [selectedLog, setSelectedLog] = useState(null)
+  const [entryType, setEntryType] = useState('')
+  const [entries, setEntries] = useState([])
+  const [expanded, setExpanded] = useState(new Set())
+  const [eof, setEof] = useState(false)
+  const [error, setError] = useState(null)
+  const nextOffset = useRef(0)
+  // The log being paged: the one picked, else the latest when paging started
+  const activeLog = useRef(null)
+  const loading = useRef(false)
+  // Bumped on every reset so responses for a previous log or filter are dropped
+  const generation = useRef(0)
+
+  const loadPage = useCallback(async () => {
+    if (loading.current) return
+    loading.current = true
+    const requested = generation.current
+    try {
+      let page
+      // A filtered page can come back empty before the end of the log; keep reading
+      do {
+        const params = new URLSearchParams({ offset: nextOffset.current, limit: PAGE_SIZE })
+        const log = selectedLog || activeLog.current
+        if (log) params.set('log', log)
+        if (entryType) params.set('types', entryType)
+        const response = await fetch(`/api/runs/${sessionId}/log?${params}`)
+        if (requested !== generation.current) return
+        if (response.status === 404 && !log) {
+          // The first log appears once a worker starts the session
+          setEof(true)
+          return
+        }
+        if (!response.ok) throw new Error(`HTTP error! status: ${response.status}`)
+        page = await response.json()
+        if (requested !== generation.current) return
+        activeLog.current = page.log
+        nextOffset.current = page.next_offset
+        setLogNames(page.logs)
+        setEof(page.eof)
+        setError(null)
+        if (page.entries.length) setEntries(prev => [...prev, ...page.entries])
+      } while (!page.eof && !page.entries.length)
+    } catch (fetchError) {
+      setError(fetchError.message)
+    } finally {
+      if (requested === generation.current) loading.current = false
+    }
+  }, [sessionId, selectedLog, entryType])
+
+  useEffect(() => {
+    generation.current += 1
+    nextOffset.current = 0
+    activeLog.current = selectedLog || activeLog.current
+    loading.current = false
+    setEntries([])
+    setExpanded(new Set())
+    setEof(false)
+    loadPage()
+  }, [loadPage]) // eslint-disable-line react-hooks/exhaustive-deps
+
+  // At the end of what has been written so far: look for new lines and new logs
+  useEffect(() => {
+    if (!eof || !isRunning) return
+    const timer = setInterval(loadPage, POLL_MS)
+    return () => clearInterval(timer)
+  }, [eof, isRunning, loadPage])
+
+  const toggleExpand = (offset) => {
+    setExpanded(prev => {
+      const next = new Set(prev)
+      if (next.has(offset)) {
+        next.delete(offset)
+      } else {
+        next.add(offset)
+      }
+      return next
+    })
+  }
+
+  const renderEntry = (entry) => {
+    const isExpanded = expanded.has(entry.offset)
+    return (
+      <div
+        className="p-3 rounded-lg border-l-4 border-gray-600 bg-gray-700/50 cursor-pointer hover:bg-gray-700/70"
+        onClick={() => toggleExpand(entry.offset)}
+      >
+        <div className="flex items-center gap-3 mb-1">
+          <span className="text-xs font-bold text-gray-300 uppercase tracking-wider px-2 py-0.5 bg-gray-800/70 rounded">
+            {entry.type}
+          </span>
+          <span className="text-xs text-gray-400 font-mono">
+            {entry.timestamp ? new Date(entry.timestamp).toLocaleTimeString() : ''}
+          </span>
+        </div>
+        {isExpanded ? (
+          <pre className="text-xs text-gray-200 whitespace-pre-wrap break-words font-mono">
+            {JSON.stringify(entry.data, null, 2)}
+          </pre>
+        ) : (
+          <div className="text-xs text-gray-300 font-mono break-all">{summarize(entry.data)}</div>
+        )}
+      </div>
+    )
+  }
+
+  return (
+    <div className="flex-1 flex flex-col min-h-0">
+      <div className="px-5 py-3 border-b border-gray-700/50 flex flex-wrap items-center gap-3 text-sm">
+        <select
+          value={selectedLog || activeLog.current || ''}
+          onChange={(event) => setSelectedLog(event.target.value || null)}
+          className="bg-gray-900/70 border border-gray-700 rounded px-2 py-1 text-gray-200 max-w-xs"
+        >
+          {logNames.length === 0 && <option value="">No logs yet</option>}
+          {logNames.map(name => (
+            <option key={name} value={name}>{name}</option>
+          ))}
+        </select>
+        <select
+          value={entryType}
+          onChange={(event) => setEntryType(event.target.value)}
+          className="bg-gray-900/70 border border-gray-700 rounded px-2 py-1 text-gray-200"
+        >
+          <option value="">All types</option>
+          {ENTRY_TYPES.map(type => (
+            <option key={type} value={type}>{type}</option>
+          ))}
+        </select>
+        <span className="text-xs text-gray-400">
+          {entries.length} entries{eof ? '' : ', scroll for more'}
+        </span>
+        {error && <span className="text-xs text-red-400">{error}</span>}
+      </div>
+      <VirtualList
+        items={entries}
+        getKey={(entry) => entry.offset}
+        renderItem={renderEntry}
+        estimateHeight={72}
+        followTail={isRunning}
+        onEndReached={eof ? undefined : loadPage}
+        className="flex-1 overflow-y-auto p-5 custom-scrollbar"
+        rowClassName="pb-2"
+      />
+    </div>
+  )
+}
+
+export default SessionLog
@@ -0,0 +1,129 @@
+import { useEffect, useLayoutEffect, useMemo, useRef, useState } from 'react'
+
+// Windowed list: only the rows in or near the viewport are mounted. Row heights are
+// measured as rows render (and re-measured when they resize, e.g. on expand) and
+// estimated until then, so variable-height rows work without a library.
+
+const BOTTOM_SLACK_PX = 40
+
+// Index of the first row whose bottom is below y
+function findRow(offsets, y) {
+  let low = 0
+  let high = offsets.length - 2
+  while (low < high) {
+    const mid = (low + high) >> 1
+    if (offsets[mid + 1] <= y) {
+      low = mid + 1
+    } else {
+      high = mid
+    }
+  }
+  return low
+}
+
+function VirtualList({
+  items,
+  getKey,
+  renderItem,
+  estimateHeight = 100,
+  overscan = 6,
+  followTail = false,
+  onEndReached,
+  className = '',
+  rowClassName = '',
+  children,
+}) {
+  const containerRef = useRef(null)
+  const heights = useRef(new Map())
+  const rows = useRef(new Map())
+  const atBottom = useRef(true)
+  const [viewport, setViewport] = useState({ top: 0, height: 0 })
+  const [measured, setMeasured] = useState(0)
+
+  // offsets[i] is the top of row i; offsets[items.length] is the total height
+  const offsets = useMemo(() => {
+    const result = new Array(items.length + 1)
+    result[0] = 0
+    for (let i = 0; i < items.length; i++) {
+      result[i + 1] = result[i] + (heights.current.get(String(getKey(items[i]))) ?? estimateHeight)
+    }
+    return result
+  }, [items, measured, estimateHeight]) // eslint-disable-line react-hooks/exhaustive-deps
+
+  const observer = useMemo(() => new ResizeObserver((entries) => {
+    let changed = false
+    for (const entry of entries) {
+      const key = entry.target.dataset.rowKey
+      const height = entry.target.offsetHeight
+      if (heights.current.get(key) !== height) {
+        heights.current.set(key, height)
+        changed = true
+      }
+    }
+    if (changed) setMeasured(count => count + 1)
+  }), [])
+
+  useEffect(() => () => observer.disconnect(), [observer])
+
+  useLayoutEffect(() => {
+    const container = containerRef.current
+    const update = () => setViewport({ top: container.scrollTop, height: container.clientHeight })
+    update()
+    const resize = new ResizeObserver(update)
+    resize.observe(container)
+    return () => resize.disconnect()
+  }, [])
+
+  // Stay pinned to the newest row only while the user has not scrolled up
+  useLayoutEffect(() => {
+    const container = containerRef.current
+    if (followTail && atBottom.current) {
+      container.scrollTop = container.scrollHeight
+    }
+  }, [followTail, items.length, offsets])
+
+  const handleScroll = (event) => {
+    const container = event.currentTarget
+    atBottom.current = container.scrollHeight - container.scrollTop - container.clientHeight < BOTTOM_SLACK_PX
+    setViewport({ top: container.scrollTop, height: container.clientHeight })
+  }
+
+  const total = offsets[items.length]
+  const start = items.length ? Math.max(0, findRow(offsets, viewport.top) - overscan) : 0
+  const end = items.length
+    ? Math.min(items.length, findRow(offsets, viewport.top + viewport.height) + overscan + 1)
+    : 0
+
+  useEffect(() => {
+    if (onEndReached && items.length && end >= items.length) onEndReached()
+  }, [end, items.length]) // eslint-disable-line react-hooks/exhaustive-deps
+
+  const measureRow = (key) => (element) => {
+    if (element) {
+      element.dataset.rowKey = key
+      rows.current.set(key, element)
+      observer.observe(element)
+    } else if (rows.current.has(key)) {
+      observer.unobserve(rows.current.get(key))
+      rows.current.delete(key)
+    }
+  }
+
+  return (
+    <div ref={containerRef} onScroll={handleScroll} className={className}>
+      {children}
+      <div style={{ height: offsets[start] }} />
+      {items.slice(start, end).map((item, i) => {
+        const key = String(getKey(item))
+        return (
+          <div key={key} ref={measureRow(key)} className={rowClassName}>
+            {renderItem(item, start + i)}
+          </div>
+        )
+      })}
+      <div style={{ height: total - offsets[end] }} />
+    </div>
+  )
+}
+
+export default VirtualList
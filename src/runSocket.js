@@ -0,0 +1,109 @@
+// One WebSocket shared by every run the page follows (GET /api/ws in api_server.py).
+// Runs are started and followed through it; events arrive batched per server tick.
+
+const TERMINAL_TYPES = ['complete', 'error']
+
+const listeners = new Map() // session id -> { onEvent, lastId }
+const pendingRuns = new Map() // request ref -> { resolve, reject, onEvent }
+let socket = null
+let opening = null
+let nextRef = 1
+
+function socketUrl() {
+  const protocol = window.location.protocol === 'https:' ? 'wss:' : 'ws:'
+  return `${protocol}//${window.location.host}/api/ws`
+}
+
+function send(message) {
+  if (socket && socket.readyState === WebSocket.OPEN) {
+    socket.send(JSON.stringify(message))
+  }
+}
+
+function deliver(sessionId, update) {
+  const listener = listeners.get(sessionId)
+  if (!listener) return
+  if (TERMINAL_TYPES.includes(update.type)) listeners.delete(sessionId)
+  listener.onEvent(update)
+}
+
+function handleFrame(frame) {
+  if (frame.t === 'ev') {
+    for (const [sessionId, id, type, data, timestamp] of frame.b) {
+      const listener = listeners.get(sessionId)
+      // Events already seen before a reconnect are skipped
+      if (!listener || id <= listener.lastId) continue
+      listener.lastId = id
+      deliver(sessionId, { type, data, timestamp })
+    }
+  } else if (frame.t === 'queued') {
+    const pending = pendingRuns.get(frame.ref)
+    if (!pending) return
+    pendingRuns.delete(frame.ref)
+    listeners.set(frame.sid, { onEvent: pending.onEvent, lastId: 0 })
+    pending.resolve(frame.sid)
+  } else if (frame.t === 'err') {
+    const pending = pendingRuns.get(frame.ref)
+    if (pending) {
+      pendingRuns.delete(frame.ref)
+      pending.reject(new Error(frame.msg))
+    } else if (frame.sid) {
+      deliver(frame.sid, { type: 'error', data: { message: frame.msg } })
+    }
+  }
+}
+
+// Open the shared socket (or reuse it); rejects if the server does not accept WebSockets.
+export function connect() {
+  if (socket && socket.readyState === WebSocket.OPEN) return Promise.resolve(socket)
+  if (opening) return opening
+  opening = new Promise((resolve, reject) => {
+    const ws = new WebSocket(socketUrl())
+    ws.onopen = () => {
+      socket = ws
+      opening = null
+      // Resume every followed run after a reconnect
+      for (const [sessionId, listener] of listeners) {
+        send({ op: 'sub', sid: sessionId, after: listener.lastId })
+      }
+      resolve(ws)
+    }
+    ws.onerror = () => {
+      if (opening) {
+        opening = null
+        reject(new Error('WebSocket connection failed'))
+      }
+    }
+    ws.onclose = () => {
+      socket = null
+      for (const pending of pendingRuns.values()) pending.reject(new Error('WebSocket closed'))
+      pendingRuns.clear()
+      if (listeners.size) setTimeout(() => connect().catch(() => {}), 1000)
+    }
+    ws.onmessage = (message) => handleFrame(JSON.parse(message.data))
+  })
+  return opening
+}
+
+// Enqueue a run and follow it; resolves with the session id.
+export async function startRun(coinName, maxRetries, onEvent) {
+  await connect()
+  const ref = nextRef++
+  return new Promise((resolve, reject) => {
+    pendingRuns.set(ref, { resolve, reject, onEvent })
+    send({ op: 'run', coin: coinName, max_retries: maxRetries, ref })
+  })
+}
+
+// Follow an existing run from after the given event id; returns an unsubscribe function.
+export async function followRun(sessionId, onEvent, after = 0) {
+  listeners.set(sessionId, { onEvent, lastId: after })
+  await connect()
+  send({ op: 'sub', sid: sessionId, after })
+  return () => unfollowRun(sessionId)
+}
+
+export function unfollowRun(sessionId) {
+  listeners.delete(sessionId)
+  send({ op: 'unsub', sid: sessionId })
+}
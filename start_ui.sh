@@ -24,6 +24,11 @@ source venv/bin/activate
 python api_server.py &
 BACKEND_PID=$!
 
+# Start a run worker that claims runs queued by the API server
+echo "🛠️  Starting run worker..."
+python runner.py --worker &
+WORKER_PID=$!
+
 # Wait a moment for backend to start
 sleep 2
 
@@ -39,5 +44,5 @@ echo ""
 npm run dev
 
 # Cleanup on exit
-kill $BACKEND_PID 2>/dev/null
+kill $BACKEND_PID $WORKER_PID 2>/dev/null
 
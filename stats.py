@@ -0,0 +1,73 @@
+"""
+Small statistics helpers shared by the prompt registry and the evaluation scripts.
+"""
+import itertools
+import math
+import random
+
+
+def wilson_interval(wins, trials, z=1.96):
+    """Return the Wilson score interval (low, high) for a win rate."""
+    if trials <= 0:
+        return 0.0, 1.0
+    p = wins / trials
+    denominator = 1 + z * z / trials
+    centre = (p + z * z / (2 * trials)) / denominator
+    margin = z * math.sqrt(p * (1 - p) / trials + z * z / (4 * trials * trials)) / denominator
+    return max(0.0, centre - margin), min(1.0, centre + margin)
+
+
+def mean_confidence_interval(total, total_sq, count, z=1.96):
+    """Return (mean, sample variance, low, high) from running sums of x and x**2."""
+    if count <= 0:
+        return None, None, None, None
+    mean = total / count
+    if count < 2:
+        return mean, 0.0, mean, mean
+    variance = max(0.0, (total_sq - count * mean * mean) / (count - 1))
+    margin = z * math.sqrt(variance / count)
+    return mean, variance, mean - margin, mean + margin
+
+
+def percentile(sorted_values, fraction):
+    """Return the nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, math.ceil(fraction * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def two_proportion_z(wins_a, trials_a, wins_b, trials_b):
+    """Return the z statistic for the difference between two win rates, or None."""
+    if trials_a <= 0 or trials_b <= 0:
+        return None
+    pooled = (wins_a + wins_b) / (trials_a + trials_b)
+    standard_error = math.sqrt(pooled * (1 - pooled) * (1 / trials_a + 1 / trials_b))
+    if standard_error == 0:
+        return 0.0
+    return (wins_a / trials_a - wins_b / trials_b) / standard_error
+
+
+def sign_flip_p_value(profits, draws=10000, rng=None):
+    """One-sided p-value that random sides on the same moves earn at least sum(profits).
+
+    Under the null each trade's side is a coin flip, so its profit is +|p| or -|p|. The
+    distribution is enumerated exactly for up to 16 trades and sampled above that.
+    """
+    if not profits:
+        return None
+    magnitudes = [abs(profit) for profit in profits]
+    observed = sum(profits) - 1e-12
+    if len(magnitudes) <= 16:
+        totals = [
+            sum(sign * magnitude for sign, magnitude in zip(signs, magnitudes))
+            for signs in itertools.product((1, -1), repeat=len(magnitudes))
+        ]
+        return sum(1 for total in totals if total >= observed) / len(totals)
+    rng = rng or random.Random()
+    hits = sum(
+        1 for _ in range(draws)
+        if sum(magnitude if rng.random() < 0.5 else -magnitude for magnitude in magnitudes) >= observed
+    )
+    # Counting the observed assignment keeps a sampled p-value from being 0
+    return (hits + 1) / (draws + 1)
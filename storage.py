@@ -0,0 +1,23 @@
+"""
+Shared SQLite helpers for the local stores (job queue, run history, ...).
+"""
+import os
+import sqlite3
+from pathlib import Path
+
+
+def get_data_dir():
+    """Return the directory holding local SQLite databases, creating it if needed."""
+    data_dir = Path(os.environ.get("DATA_DIR", Path(__file__).parent / "data"))
+    data_dir.mkdir(parents=True, exist_ok=True)
+    return data_dir
+
+
+def connect(db_path):
+    """Open a SQLite connection tuned for several processes sharing one file."""
+    conn = sqlite3.connect(str(db_path), timeout=30, isolation_level=None, check_same_thread=False)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA busy_timeout=30000")
+    return conn
@@ -0,0 +1,265 @@
+"""
+Response-shaping proxy for the Brave Search and CoinGecko MCP servers.
+
+configure_mcp_servers() starts each server behind this script, which relays the stdio
+JSON-RPC traffic unchanged except for tool results: those are cut down to the fields
+the research prompt uses, per tool (TOOL_SCHEMAS). Brave results keep the headline, a
+snippet of at most TOOL_TRIM_SNIPPET_CHARS characters (default 300), the date and the
+source site. CoinGecko results keep price, volume, market cap and 24h change. Tools
+without a schema, error results and output that does not parse pass through untouched.
+
+With --stats, every tool call appends the raw and trimmed sizes to that file; the agent
+sums them into the session log (tool_trim in the session_end metrics). Set TOOL_TRIM=0
+to run the servers directly.
+
+Usage: python tool_trim.py --profile brave [--stats FILE] -- npx -y @modelcontextprotocol/server-brave-search
+"""
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+import threading
+from pathlib import Path
+from urllib.parse import urlparse
+
+
+PROXY_PATH = str(Path(__file__).resolve())
+# Rough size of a token in English text and JSON, for reporting savings
+CHARS_PER_TOKEN = 4
+
+# Server names in configure_mcp_servers -> schema profile
+SERVER_PROFILES = {
+    "brave-search": "brave",
+    "coingecko": "coingecko",
+}
+
+COIN_MARKET_FIELDS = {
+    "id": "id",
+    "symbol": "symbol",
+    "name": "name",
+    "current_price": "current_price",
+    "market_cap": "market_cap",
+    "total_volume": "total_volume",
+    "price_change_percentage_24h": "price_change_percentage_24h",
+    "high_24h": "high_24h",
+    "low_24h": "low_24h",
+    "last_updated": "last_updated",
+}
+
+COIN_DETAIL_FIELDS = {
+    "id": "id",
+    "symbol": "symbol",
+    "name": "name",
+    "current_price": "market_data.current_price.usd",
+    "market_cap": "market_data.market_cap.usd",
+    "total_volume": "market_data.total_volume.usd",
+    "price_change_percentage_24h": "market_data.price_change_percentage_24h",
+    "high_24h": "market_data.high_24h.usd",
+    "low_24h": "market_data.low_24h.usd",
+    "last_updated": "last_updated",
+}
+
+# profile -> tool name -> ("brave_text", labels to keep) or ("json", {output key: dotted path})
+TOOL_SCHEMAS = {
+    "brave": {
+        "brave_web_search": ("brave_text", ("Title", "Description", "Age", "Published", "URL")),
+    },
+    "coingecko": {
+        "get_coins_markets": ("json", COIN_MARKET_FIELDS),
+        "get_id_coins": ("json", COIN_DETAIL_FIELDS),
+        "get_coins_history": ("json", {
+            "id": "id",
+            "symbol": "symbol",
+            "name": "name",
+            "current_price": "market_data.current_price.usd",
+            "market_cap": "market_data.market_cap.usd",
+            "total_volume": "market_data.total_volume.usd",
+        }),
+    },
+}
+
+HTML_TAG = re.compile(r"<[^>]+>")
+
+
+def snippet_chars():
+    return int(os.environ.get("TOOL_TRIM_SNIPPET_CHARS", 300))
+
+
+def trim_brave_text(text, labels):
+    """Keep the labelled lines of each Brave result; the URL is reduced to its site."""
+    max_chars = snippet_chars()
+    results = []
+    for block in text.split("\n\n"):
+        kept = []
+        for line in block.splitlines():
+            label, separator, value = line.partition(": ")
+            if not separator or label not in labels:
+                continue
+            value = HTML_TAG.sub("", value).strip()
+            if label == "URL":
+                label, value = "Source", urlparse(value).netloc.removeprefix("www.")
+            elif len(value) > max_chars:
+                value = value[:max_chars].rstrip() + "..."
+            kept.append(f"{label}: {value}")
+        if kept:
+            results.append("\n".join(kept))
+    # Not the format we know: leave it alone rather than lose it
+    return "\n\n".join(results) if results else text
+
+
+def get_path(value, path):
+    for key in path.split("."):
+        if not isinstance(value, dict) or key not in value:
+            return None
+        value = value[key]
+    return value
+
+
+def project(value, fields):
+    """Project a record (or list of records) onto {output key: dotted path}."""
+    if isinstance(value, list):
+        return [project(item, fields) for item in value]
+    if not isinstance(value, dict):
+        return value
+    projected = {key: get_path(value, path) for key, path in fields.items()}
+    projected = {key: item for key, item in projected.items() if item is not None}
+    # A record with none of the fields is some other shape; keep it whole
+    return projected or value
+
+
+def trim_text(profile, tool_name, text):
+    """Trimmed tool output text, or the text unchanged if the tool has no schema."""
+    schema = TOOL_SCHEMAS.get(profile, {}).get(tool_name)
+    if schema is None:
+        return text
+    kind, fields = schema
+    if kind == "brave_text":
+        return trim_brave_text(text, fields)
+    try:
+        data = json.loads(text)
+    except ValueError:
+        return text
+    return json.dumps(project(data, fields), separators=(",", ":"), ensure_ascii=False)
+
+
+def trim_result(profile, tool_name, result):
+    """Trim the text content of a tools/call result; returns (result, raw chars, trimmed chars)."""
+    content = result.get("content")
+    if result.get("isError") or not isinstance(content, list):
+        return result, 0, 0
+    raw_chars = trimmed_chars = 0
+    trimmed_content = []
+    for item in content:
+        if isinstance(item, dict) and item.get("type") == "text" and isinstance(item.get("text"), str):
+            text = trim_text(profile, tool_name, item["text"])
+            raw_chars += len(item["text"])
+            trimmed_chars += len(text)
+            item = {**item, "text": text}
+        trimmed_content.append(item)
+    return {**result, "content": trimmed_content}, raw_chars, trimmed_chars
+
+
+def record_stats(stats_path, profile, tool_name, raw_chars, trimmed_chars):
+    line = json.dumps({"server": profile, "tool": tool_name, "raw_chars": raw_chars, "trimmed_chars": trimmed_chars})
+    # One short append per call; the Brave and CoinGecko proxies share the file
+    with open(stats_path, "a", encoding="utf-8") as f:
+        f.write(line + "\n")
+
+
+def run_proxy(profile, command, stats_path=None):
+    """Run the server command, relaying stdio JSON-RPC and trimming tool results."""
+    child = subprocess.Popen(command, stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+    pending = {}
+    pending_lock = threading.Lock()
+
+    def relay_requests():
+        for line in sys.stdin.buffer:
+            try:
+                message = json.loads(line)
+            except ValueError:
+                message = None
+            if isinstance(message, dict) and message.get("method") == "tools/call" and "id" in message:
+                with pending_lock:
+                    pending[message["id"]] = (message.get("params") or {}).get("name")
+            child.stdin.write(line)
+            child.stdin.flush()
+        child.stdin.close()
+
+    threading.Thread(target=relay_requests, daemon=True).start()
+
+    for line in child.stdout:
+        try:
+            message = json.loads(line)
+        except ValueError:
+            message = None
+        if isinstance(message, dict) and isinstance(message.get("result"), dict) and "id" in message:
+            with pending_lock:
+                is_tool_call = message["id"] in pending
+                tool_name = pending.pop(message["id"], None)
+            if is_tool_call:
+                result, raw_chars, trimmed_chars = trim_result(profile, tool_name, message["result"])
+                line = (json.dumps({**message, "result": result}, ensure_ascii=False) + "\n").encode("utf-8")
+                if stats_path and raw_chars:
+                    record_stats(stats_path, profile, tool_name, raw_chars, trimmed_chars)
+        sys.stdout.buffer.write(line)
+        sys.stdout.buffer.flush()
+    return child.wait()
+
+
+def trimming_enabled():
+    return os.environ.get("TOOL_TRIM", "1") != "0"
+
+
+def wrap_command(server_name, command, args):
+    """(command, args) that start the server behind the proxy, if it has a schema profile."""
+    profile = SERVER_PROFILES.get(server_name)
+    if profile is None or not trimming_enabled():
+        return command, args
+    return sys.executable, [PROXY_PATH, "--profile", profile, "--", command, *args]
+
+
+def with_stats_path(mcp_servers, stats_path):
+    """Copies of the server configs whose proxies record sizes to stats_path."""
+    servers = {}
+    for name, config in mcp_servers.items():
+        args = config.get("args") or []
+        if args[:1] == [PROXY_PATH]:
+            config = {**config, "args": [PROXY_PATH, "--stats", str(stats_path), *args[1:]]}
+        servers[name] = config
+    return servers
+
+
+def summarize_stats(stats_path):
+    """Totals per session from a stats file: calls, chars before and after, estimated tokens saved."""
+    summary = {"calls": 0, "raw_chars": 0, "trimmed_chars": 0, "by_tool": {}}
+    try:
+        with open(stats_path, "r", encoding="utf-8") as f:
+            lines = f.readlines()
+    except OSError:
+        return summary
+    for line in lines:
+        try:
+            entry = json.loads(line)
+        except ValueError:
+            continue
+        tool = summary["by_tool"].setdefault(entry["tool"], {"calls": 0, "raw_chars": 0, "trimmed_chars": 0})
+        for totals in (summary, tool):
+            totals["calls"] += 1
+            totals["raw_chars"] += entry["raw_chars"]
+            totals["trimmed_chars"] += entry["trimmed_chars"]
+    summary["est_tokens_saved"] = (summary["raw_chars"] - summary["trimmed_chars"]) // CHARS_PER_TOKEN
+    return summary
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Trim MCP tool results to the fields the agent uses")
+    parser.add_argument("--profile", required=True, choices=sorted(TOOL_SCHEMAS))
+    parser.add_argument("--stats", help="Append raw/trimmed sizes per tool call to this file")
+    parser.add_argument("command", nargs=argparse.REMAINDER, help="-- server command and arguments")
+    args = parser.parse_args()
+    command = args.command[1:] if args.command[:1] == ["--"] else args.command
+    if not command:
+        parser.error("no server command given")
+    sys.exit(run_proxy(args.profile, command, args.stats))